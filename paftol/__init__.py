@@ -7,10 +7,14 @@ import tempfile
 import subprocess
 import shutil
 import multiprocessing
+import threading
 import logging
 import csv
+import cPickle
 
 import Bio
+import Bio.Seq
+import Bio.SeqRecord
 import Bio.SeqIO
 import Bio.SeqIO.QualityIO
 import Bio.Alphabet.IUPAC
@@ -32,11 +36,31 @@ logger = logging.getLogger(__name__)
 keepTmp = False
 
 
+# attributes locating files and directories of a particular run, which do not affect results
+runtimePathAttrNameList = ['workdir', 'workingDirectory', 'referenceFname', 'scratchDir', 'databaseStoreDirname']
+
+
+def configurationStr(obj):
+    """Describe an object's configuration by its class name and its attributes of simple types.
+
+Used to include runner parameters in checkpoint digests. Attributes
+listed in C{runtimePathAttrNameList} are left out, so checkpoints can be
+resumed by runs using different temporary directories.
+"""
+    if obj is None:
+        return 'None'
+    attrList = ['%s=%r' % (k, v) for k, v in sorted(vars(obj).items()) if k not in runtimePathAttrNameList and (v is None or isinstance(v, (str, int, long, float, bool)))]
+    return '%s(%s)' % (obj.__class__.__name__, ', '.join(attrList))
+
+
+funnyCharRe = re.compile('[\t/ ;,$#]')
+paftolTargetRe = re.compile('([^-]+)-([^-]+)')
+
+
 def isSane(filename):
     """Check whether a file name is sane, in the sense that it does not contain any "funny" characters"""
     if filename == '':
         return False
-    funnyCharRe = re.compile('[\t/ ;,$#]')
     m = funnyCharRe.search(filename)
     if m is not None:
         return False
@@ -127,31 +151,152 @@ the target genes.
         self.workdirTgz = workdirTgz
         self.workDirname = workDirname
         self.tmpDirname = None
+        self.tgzArchiver = paftol.tools.TarArchiver()
+        self.tgzInBackground = False
+        self.tgzThread = None
+        self.tgzError = None
         # parameters for ensuring file names don't clash, e.g. because paftolGene / organism name is same as targets basename etc.
         self.forwardFasta = 'fwd.fasta'
         self.reverseFasta = 'rev.fasta'
+        # BLAST databases of reads, set up by analysers using tblastn
+        self.forwardDatabase = None
+        self.reverseDatabase = None
         self.targetsFname = 'targets.fasta'
         self.geneAssemblyDirnamePattern = 'targetasm-%s'
         self.geneReadFnamePattern = 'gene-%s.fasta'
         self.geneContigsFnamePattern = '%s-contigs.fasta'
         self.geneRepresentativeFnamePattern = 'generep-%s.fasta'
         self.exoneratePercentIdentityThreshold = 65.0
+        self.checkpointDirname = None
+        self.capReadsDuringMapping = False
+        self.fastqIndexDirname = None
+        self.targetsCacheDirname = None
 
     def analyse(self):
         raise StandardError('not implemented in this "abstract" base class')
 
+    def readTargetSet(self, targetsSourcePath, allowInvalidBases):
+        """Read and sanity check a target set, using the cache in C{targetsCacheDirname} if set.
+
+The cache is not used when targets are read from a file handle rather than a named file.
+"""
+        paftolTargetSet = PaftolTargetSet()
+        if self.targetsCacheDirname is not None and isinstance(targetsSourcePath, basestring):
+            paftolTargetSet.readFastaCached(targetsSourcePath, self.targetsCacheDirname, allowInvalidBases)
+        else:
+            paftolTargetSet.readFasta(targetsSourcePath)
+            paftolTargetSet.sanityCheck(allowInvalidBases)
+        return paftolTargetSet
+
+    def makeCheckpointDigest(self, *componentList):
+        return paftol.tools.md5HexDigest('\t'.join([str(component) for component in componentList]))
+
+    def makeInputDigest(self, result, *paramList):
+        """Compute a digest of the inputs of an analysis, comprising targets, reads and parameters.
+
+Returns C{None} if checkpointing is not enabled, to avoid digesting reads needlessly.
+"""
+        if self.checkpointDirname is None:
+            return None
+        targetsDigest = self.makeCheckpointDigest(*['%s:%s' % (sr.id, str(sr.seq)) for sr in sorted(result.paftolTargetSet.getSeqRecordList(), key=lambda sr: sr.id)])
+        forwardDigest = paftol.tools.md5HexdigestFromFile(result.forwardFastq)
+        reverseDigest = None if result.reverseFastq is None else paftol.tools.md5HexdigestFromFile(result.reverseFastq)
+        return self.makeCheckpointDigest(self.__class__.__name__, self.exoneratePercentIdentityThreshold, targetsDigest, forwardDigest, reverseDigest, *paramList)
+
+    def makeCheckpointFname(self, stageName):
+        return os.path.join(self.checkpointDirname, '%s.pickle' % stageName)
+
+    def loadCheckpoint(self, stageName, inputDigest):
+        """Load the data saved by a completed stage.
+
+@param stageName: name of the stage
+@type stageName: C{str}
+@param inputDigest: digest of the stage's inputs
+@type inputDigest: C{str}
+@return: the data saved by the stage, or C{None} if checkpointing is not enabled, or the stage has not been completed with the same inputs
+"""
+        if self.checkpointDirname is None:
+            return None
+        checkpointFname = self.makeCheckpointFname(stageName)
+        if not os.path.exists(checkpointFname):
+            return None
+        with open(checkpointFname, 'rb') as f:
+            checkpointInputDigest, data = cPickle.load(f)
+        if checkpointInputDigest != inputDigest:
+            logger.debug('stage %s: inputs changed, not resuming', stageName)
+            return None
+        logger.info('stage %s: resuming from checkpoint', stageName)
+        return data
+
+    def saveCheckpoint(self, stageName, inputDigest, data):
+        if self.checkpointDirname is None:
+            return
+        if not os.path.isdir(self.checkpointDirname):
+            os.makedirs(self.checkpointDirname)
+        checkpointFname = self.makeCheckpointFname(stageName)
+        tmpFname = '%s.tmp' % checkpointFname
+        with open(tmpFname, 'wb') as f:
+            cPickle.dump((inputDigest, data), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpFname, checkpointFname)
+
+    def mapAndDistribute(self, result, inputDigest, mapReads, maxNumReadsPerGene):
+        """Run the mapping and read distribution stage, or resume it from its checkpoint.
+
+@param mapReads: function mapping the reads into C{result.paftolTargetSet}
+@return: digest of this stage, to be used as input digest by subsequent stages
+@rtype: C{str}
+"""
+        stageDigest = self.makeCheckpointDigest('distribute', inputDigest, maxNumReadsPerGene, self.capReadsDuringMapping)
+        paftolTargetSet = self.loadCheckpoint('distribute', stageDigest)
+        if paftolTargetSet is not None:
+            result.paftolTargetSet = paftolTargetSet
+            self.writeMappedReadsFasta(result, maxNumReadsPerGene)
+        else:
+            if self.capReadsDuringMapping:
+                result.paftolTargetSet.maxNumMappedReadsPerGene = maxNumReadsPerGene
+            mapReads()
+            logger.debug('mapping done')
+            self.distribute(result, maxNumReadsPerGene)
+            self.saveCheckpoint('distribute', stageDigest, result.paftolTargetSet)
+        return stageDigest
+
+    def recoverGene(self, geneName, stageDigest, recoverGeneData):
+        """Recover a gene, or load the result from the gene's checkpoint.
+
+@param recoverGeneData: function computing the data to be checkpointed for the gene
+"""
+        geneDigest = self.makeCheckpointDigest('gene', stageDigest, geneName)
+        geneStageName = 'gene-%s' % geneName
+        geneData = self.loadCheckpoint(geneStageName, geneDigest)
+        if geneData is None:
+            geneData = recoverGeneData()
+            self.saveCheckpoint(geneStageName, geneDigest, geneData)
+        return geneData
+
+    def recoverCdsDict(self, result, stageDigest, strictOverlapFiltering):
+        result.reconstructedCdsDict = {}
+        for geneName in result.paftolTargetSet.paftolGeneDict:
+            result.reconstructedCdsDict[geneName] = self.recoverGene(geneName, self.makeCheckpointDigest(stageDigest, strictOverlapFiltering), lambda: (self.reconstructCds(result, geneName, strictOverlapFiltering), ))[0]
+
     def setupTmpdir(self):
         if self.tmpDirname is not None:
             raise StandardError('illegal state: already have generated working directory %s' % self.tmpDirname)
         self.tmpDirname = tempfile.mkdtemp(prefix=self.workDirname)
         os.mkdir(self.makeWorkDirname())
 
+    def removeTmpdir(self, tmpDirname):
+        if keepTmp:
+            logger.warning('not removing temporary directory %s', tmpDirname)
+        else:
+            shutil.rmtree(tmpDirname)
+
     def cleanupTmpdir(self):
         if self.tmpDirname is not None:
-            if keepTmp:
-                logger.warning('not removing temporary directory %s', self.tmpDirname)
+            if self.tgzThread is not None:
+                # the background archiving thread removes the temporary directory when done
+                logger.debug('deferring removal of temporary directory %s to archiving thread', self.tmpDirname)
             else:
-                shutil.rmtree(self.tmpDirname)
+                self.removeTmpdir(self.tmpDirname)
             self.tmpDirname = None
 
     def cleanup(self):
@@ -228,19 +373,18 @@ the target genes.
             paftolTarget.writeFasta(self.makeGeneRepresentativeFname(geneName, True))
 
     def readMappedReadsSingle(self, result):
-        readNameMappedReadDict = result.paftolTargetSet.makeReadNameMappedReadDict()
+        readNameIndex = result.paftolTargetSet.makeReadNameIndex()
         with open(result.forwardFastq, 'r') as forwardFile:
             forwardParser = Bio.SeqIO.parse(forwardFile, 'fastq')
-            for forwardRead in fowardParser:
-                readName = forwardRead.id
-                if readName in readNameMappedReadDict:
-                    for mappedRead in readNameMappedReadDict[readName]:
-                        if mappedRead.fowardRead is not None:
-                            raise StandardError, 'duplicate forward read for %s' % readName
-                        mappedRead.forwardRead = forwardRead
+            for forwardRead in forwardParser:
+                readName = MappedRead.readBasename(forwardRead.id)
+                for mappedRead in readNameIndex.getMappedReadList(readName):
+                    if mappedRead.forwardRead is not None:
+                        raise StandardError, 'duplicate forward read for %s' % readName
+                    mappedRead.forwardRead = forwardRead
 
     def readMappedReadsPaired(self, result):
-        readNameMappedReadDict = result.paftolTargetSet.makeReadNameMappedReadDict()
+        readNameIndex = result.paftolTargetSet.makeReadNameIndex()
         with open(result.forwardFastq, 'r') as forwardFile:
             forwardParser = Bio.SeqIO.parse(forwardFile, 'fastq')
             with open(result.reverseFastq, 'r') as reverseFile:
@@ -252,25 +396,73 @@ the target genes.
                     if reverseRead.id != forwardRead.id:
                         raise StandardError('paired read files %s / %s out of sync at read %s / %s' % (result.forwardFastq, result.reverseFastq, forwardRead.id, reverseRead.id))
                     readName = forwardRead.id
-                    if readName in readNameMappedReadDict:
-                        for mappedRead in readNameMappedReadDict[readName]:
-                            if mappedRead.forwardRead is not None:
-                                raise StandardError, 'duplicate forward read for %s' % readName
-                            mappedRead.forwardRead = forwardRead
-                            mappedRead.reverseRead = reverseRead
+                    for mappedRead in readNameIndex.getMappedReadList(readName):
+                        if mappedRead.forwardRead is not None:
+                            raise StandardError, 'duplicate forward read for %s' % readName
+                        mappedRead.forwardRead = forwardRead
+                        mappedRead.reverseRead = reverseRead
                 # FIXME: check for dangling stuff in reverse: reverse.next() should trigger exception (StopIteration?)
 
+    def openFastqIndex(self, fastqFname):
+        """Open the offset index of a FASTQ file, keyed by read names without mate suffix.
+
+Index files are kept in C{fastqIndexDirname}, so they are built once and
+reused by subsequent runs.
+"""
+        if not os.path.isdir(self.fastqIndexDirname):
+            os.makedirs(self.fastqIndexDirname)
+        absFastqFname = os.path.abspath(fastqFname)
+        indexFname = os.path.join(self.fastqIndexDirname, '%s-%s.fqidx' % (paftol.tools.md5HexDigest(absFastqFname)[:12], os.path.basename(fastqFname)))
+        return paftol.tools.openFastqIndex(absFastqFname, indexFname, MappedRead.readBasename)
+
+    def readMappedReadsIndexed(self, result):
+        """Retrieve the reads of mapped reads by looking them up in FASTQ offset indexes.
+
+Unlike L{readMappedReadsSingle} and L{readMappedReadsPaired}, this does
+not scan the FASTQ files, so the time taken depends on the number of
+mapped reads rather than on the size of the FASTQ files.
+"""
+        readNameMappedReadDict = result.paftolTargetSet.makeReadNameMappedReadDict()
+        fastqFnameList = [result.forwardFastq]
+        if result.isPaired():
+            fastqFnameList.append(result.reverseFastq)
+        fastqIndexList = []
+        try:
+            for fastqFname in fastqFnameList:
+                fastqIndexList.append(self.openFastqIndex(fastqFname))
+            for readName, mappedReadList in readNameMappedReadDict.iteritems():
+                readList = []
+                for fastqFname, fastqIndex in zip(fastqFnameList, fastqIndexList):
+                    if readName not in fastqIndex:
+                        raise StandardError, 'read %s not found in %s' % (readName, fastqFname)
+                    read = fastqIndex[readName]
+                    read.id = MappedRead.readBasename(read.id)
+                    readList.append(read)
+                for mappedRead in mappedReadList:
+                    mappedRead.forwardRead = readList[0]
+                    if result.isPaired():
+                        mappedRead.reverseRead = readList[1]
+        finally:
+            for fastqIndex in fastqIndexList:
+                fastqIndex.close()
+
     def writeMappedReadsFasta(self, result, maxNumReadsPerGene):
         for paftolGene in result.paftolTargetSet.paftolGeneDict.values():
             with open(self.makeGeneReadFname(paftolGene.name, True), 'w') as fastaFile:
                 paftolGene.writeMappedReadsFasta(fastaFile, True, result.reverseFastq is not None, maxNumReadsPerGene)
 
     def distributeSingle(self, result, maxNumReadsPerGene):
-        self.readMappedReadsSingle(result)
+        if self.fastqIndexDirname is None:
+            self.readMappedReadsSingle(result)
+        else:
+            self.readMappedReadsIndexed(result)
         self.writeMappedReadsFasta(result, maxNumReadsPerGene)
 
     def distributePaired(self, result, maxNumReadsPerGene):
-        self.readMappedReadsPaired(result)
+        if self.fastqIndexDirname is None:
+            self.readMappedReadsPaired(result)
+        else:
+            self.readMappedReadsIndexed(result)
         self.writeMappedReadsFasta(result, maxNumReadsPerGene)
 
     def distributeSingleOld(self, result):
@@ -408,27 +600,63 @@ the target genes.
         logger.debug('gene %s: %d non-overlapping contig list [strict=%s]: %s', geneName, len(exonerateResultList), str(strictOverlapFiltering), ', '.join(['%s; tcdsLen=%d' % (e.targetId, len(e.targetCdsSeq.seq)) for e in exonerateResultList]))
         return exonerateResultList
 
+    def writeTgz(self, tmpDirname):
+        tmpTgz = os.path.join(tmpDirname, '%s.tgz' % self.workDirname)
+        self.tgzArchiver.archive(tmpTgz, os.path.join(tmpDirname, self.workDirname), self.workDirname)
+        # FIXME: clumsy to first create tgz in temp dir and then
+        # moving it to final destination, compute absolute path to
+        # final destination and use that directly?
+        shutil.move(tmpTgz, self.workdirTgz)
+
+    def runTgzThread(self, tmpDirname):
+        try:
+            self.writeTgz(tmpDirname)
+        except StandardError as e:
+            logger.error('archiving %s failed: %s', tmpDirname, str(e))
+            self.tgzError = e
+        finally:
+            self.removeTmpdir(tmpDirname)
+
     def makeTgz(self):
+        """Archive the working directory into C{self.workdirTgz}, if that is set.
+
+If C{self.tgzInBackground} is set, archiving is done by a background
+thread which also takes over removal of the temporary directory.
+L{waitForTgz} waits for this thread to finish.
+"""
         if self.workdirTgz is not None:
             if self.tmpDirname is None:
                 raise StandardError('illegal state: no temporary directory generated')
-            tmpTgz = os.path.join(self.tmpDirname, '%s.tgz' % self.workDirname)
-            tgzArgv = ['tar', '-zcf', tmpTgz, self.workDirname]
-            tgzProcess = subprocess.Popen(tgzArgv, cwd=self.tmpDirname)
-            tgzReturncode = tgzProcess.wait()
-            if tgzReturncode != 0:
-                raise StandardError('process "%s" returned %d' % (' '.join(tgzArgv), tgzReturncode))
-            # FIXME: clumsy to first create tgz in temp dir and then
-            # moving it to final destination, compute absolute path to
-            # final destination and use that directly?
-            shutil.move(os.path.join(self.tmpDirname, tmpTgz), self.workdirTgz)
+            if self.tgzInBackground:
+                self.waitForTgz()
+                self.tgzThread = threading.Thread(target=self.runTgzThread, args=(self.tmpDirname, ), name='tgz-%s' % self.workDirname)
+                self.tgzThread.start()
+            else:
+                self.writeTgz(self.tmpDirname)
+
+    def waitForTgz(self):
+        if self.tgzThread is not None:
+            self.tgzThread.join()
+            self.tgzThread = None
+            if self.tgzError is not None:
+                tgzError = self.tgzError
+                self.tgzError = None
+                raise StandardError('archiving working directory failed: %s' % str(tgzError))
 
             
 class TargetMapper(object):
 
+    """Base class for mapping reads to targets.
+
+@ivar referenceFname: name of a targets file prepared by L{prepareReference}
+    and shared by several mappers, or C{None} to write the targets to the working directory
+@type referenceFname: C{str}
+"""
+
     def __init__(self):
         self.workdir = None
         self.targetsFname = 'targets.fasta'
+        self.referenceFname = None
         
     def makePath(self, baseFname):
         return os.path.join(self.workdir, baseFname)
@@ -438,6 +666,12 @@ class TargetMapper(object):
     
     def writeTargetsFile(self, paftolTargetSet):
         paftolTargetSet.writeFasta(self.makeTargetsPath())
+
+    def prepareReference(self, paftolTargetSet, referenceFname):
+        """Write targets to C{referenceFname} for use by this and other mappers, which need to have their C{referenceFname} set to this.
+"""
+        paftolTargetSet.writeFasta(referenceFname)
+        self.referenceFname = referenceFname
         
     def makeWorkdir(self):
         os.mkdir(self.workdir)
@@ -450,13 +684,24 @@ class TargetMapper(object):
         self.makeWorkdir()
         logger.debug('set up workdir: %s', self.workdir)
 
-    def cleanup(self):
-        shutil.rmtree(self.workdir)
+    def cleanup(self, removeWorkdir=True):
+        if removeWorkdir:
+            shutil.rmtree(self.workdir)
         self.workdir = None
 
     def mapReads(self, paftolTargetSet, forwardReadsFname, reverseReadsFname):
         raise StandardError, 'abstract method called'
 
+    def canMapInterleavedReads(self):
+        return False
+
+    def mapInterleavedReads(self, paftolTargetSet, writeInterleavedReads):
+        """Map paired reads provided as an interleaved FASTQ stream.
+
+@param writeInterleavedReads: function writing the interleaved reads to a file, called in a separate thread
+"""
+        raise StandardError, '%s does not support mapping streamed reads' % self.__class__.__name__
+
 
 class TargetMapperTblastn(TargetMapper):
     
@@ -472,23 +717,19 @@ class TargetMapperTblastn(TargetMapper):
         logger.debug('mapping gene sequences to reads')
         if not self.isSetup():
             raise StandardError, 'illegal state: TargetMapperTblastn instance not set up'
-        self.writeTargetsFile(paftolTargetSet)
-        referenceFname = self.makeTargetsPath()
+        if self.referenceFname is None:
+            self.writeTargetsFile(paftolTargetSet)
         targetProteinList = [paftol.tools.translateSeqRecord(geneSr) for geneSr in paftolTargetSet.getSeqRecordList()]
         # FIXME: check these parameters, consider numAlignments?
         self.tblastnRunner.maxTargetSeqs = 10000000
         self.tblastnRunner.maxHsps = 1
         # jtk: analyser logic needs developing to mange numOfftargetsReads generically
         # result.paftolTargetSet.numOfftargetReads = None
-        forwardFastaPath = self.makePath(self.forwardFasta)
-        paftol.tools.fastqToFasta(forwardReadsFname, forwardFastaPath)
-        self.tblastnRunner.indexDatabase(forwardFastaPath)
-        self.tblastnRunner.processTblastn(paftolTargetSet, forwardFastaPath, targetProteinList)
+        forwardDatabase = self.tblastnRunner.makeFastqDatabase(forwardReadsFname, self.makePath(self.forwardFasta))
+        self.tblastnRunner.processTblastn(paftolTargetSet, forwardDatabase, targetProteinList)
         if reverseReadsFname is not None:
-            reverseFastaPath = self.makePath(self.reverseFasta)
-            paftol.tools.fastqToFasta(reverseReadsFname, reverseFastaPath)
-            self.tblastnRunner.indexDatabase(reverseFastaPath)
-            self.tblastnRunner.processTblastn(paftolTargetSet, reverseFastaPath, targetProteinList)
+            reverseDatabase = self.tblastnRunner.makeFastqDatabase(reverseReadsFname, self.makePath(self.reverseFasta))
+            self.tblastnRunner.processTblastn(paftolTargetSet, reverseDatabase, targetProteinList)
 
 
 class TargetMapperBwa(TargetMapper):
@@ -499,21 +740,39 @@ class TargetMapperBwa(TargetMapper):
             bwaRunner = paftol.tools.BwaRunner()
         self.bwaRunner = bwaRunner
  
+    def prepareReference(self, paftolTargetSet, referenceFname):
+        super(TargetMapperBwa, self).prepareReference(paftolTargetSet, referenceFname)
+        self.bwaRunner.indexReference(referenceFname)
+
+    def makeReferenceFname(self, paftolTargetSet):
+        if self.workdir is None:
+            raise StandardError, 'illegal state: no workdir'
+        if self.referenceFname is None:
+            self.writeTargetsFile(paftolTargetSet)
+            referenceFname = self.makeTargetsPath()
+            self.bwaRunner.indexReference(referenceFname)
+            return referenceFname
+        return self.referenceFname
+
     def mapReads(self, paftolTargetSet, forwardReadsFname, reverseReadsFname):
         """Map reads to genes.
 """
         logger.debug('mapping reads to gene sequences')
-        if self.workdir is None:
-            raise StandardError, 'illegal state: no workdir'
-        referenceFname = self.makeTargetsPath()
-        self.bwaRunner.indexReference(referenceFname)
-        forwardReadsFname = os.path.join(os.getcwd(), result.forwardFastq)
-        if result.reverseFastq is None:
-            reverseReadsFname = None
-        else:
-            reverseReadsFname = os.path.join(os.getcwd(), result.reverseFastq)
+        referenceFname = self.makeReferenceFname(paftolTargetSet)
+        forwardReadsFname = os.path.join(os.getcwd(), forwardReadsFname)
+        if reverseReadsFname is not None:
+            reverseReadsFname = os.path.join(os.getcwd(), reverseReadsFname)
         paftolTargetSet.numOfftargetReads = 0
-        self.bwaRunner.processBwa(paftolTargetSet, referenceFname, forwardReadsFname, reverseReadsFname)
+        self.bwaRunner.processBwa(paftolTargetSet, referenceFname, forwardReadsFname, reverseReadsFname, False)
+
+    def canMapInterleavedReads(self):
+        return True
+
+    def mapInterleavedReads(self, paftolTargetSet, writeInterleavedReads):
+        logger.debug('mapping streamed reads to gene sequences')
+        referenceFname = self.makeReferenceFname(paftolTargetSet)
+        paftolTargetSet.numOfftargetReads = 0
+        self.bwaRunner.processBwaInterleaved(paftolTargetSet, referenceFname, writeInterleavedReads, False)
 
         
 class TargetAssembler(object):
@@ -532,8 +791,9 @@ class TargetAssembler(object):
         self.workdir = workdir
         self.makeWorkdir()
 
-    def cleanup(self):
-        shutil.rmtree(self.workdir)
+    def cleanup(self, removeWorkdir=True):
+        if removeWorkdir:
+            shutil.rmtree(self.workdir)
         self.workdir = None
 
     def makeWorkdirPath(self, filename):
@@ -555,7 +815,8 @@ class TargetAssemblerOverlapSerial(TargetAssembler):
         self.relIdentityThresholdReference = None
         self.windowSizeReadOverlap = None
         self.relIdentityThresholdReadOverlap = None
-        
+        self.writeDebugFiles = False
+
     def makeWorkdirPath(self, filename):
         return os.path.join(self.workdir, filename)
 
@@ -573,19 +834,21 @@ class TargetAssemblerOverlapSerial(TargetAssembler):
         if not self.isSetup():
             raise StandardError, 'cannot assemble gene %s: TargetAssemblerOverlapSerial instance not set up' % geneName
         self.checkControlParameters()
-        overlapCsvFname = self.makeWorkdirPath('overlap-%s.csv' % geneName)
-        positionedReadDirname = self.makeWorkdirPath('posread-%s' % geneName)
-        positionedReadFname = self.makeWorkdirPath('posread-%s.fasta' % geneName)
-        os.mkdir(positionedReadDirname)
-        readSrFwdList = copy.deepcopy(result.paftolTargetSet.paftolGeneDict[geneName].makeMappedReadsUniqueList(includeForward=True, includeReverse=False))
-        readSrRevList = copy.deepcopy(result.paftolTargetSet.paftolGeneDict[geneName].makeMappedReadsUniqueList(includeForward=False, includeReverse=True))
+        if self.writeDebugFiles:
+            overlapCsvFname = self.makeWorkdirPath(self.overlapCsvFnamePattern % geneName)
+            positionedReadDirname = self.makeWorkdirPath('posread-%s' % geneName)
+            positionedReadFname = self.makeWorkdirPath(self.positionedReadFnamePattern % geneName)
+            os.mkdir(positionedReadDirname)
+        else:
+            overlapCsvFname = None
+            positionedReadDirname = None
+            positionedReadFname = None
+        paftolGene = result.paftolTargetSet.paftolGeneDict[geneName]
         readSrList = []
-        for readSr in readSrFwdList:
-            readSr.id = '%s-fwd' % readSr.id
-            readSrList.append(readSr)
-        for readSr in readSrRevList:
-            readSr.id = '%s-rev' % readSr.id
-            readSrList.append(readSr)
+        for readSr in paftolGene.makeMappedReadsUniqueList(includeForward=True, includeReverse=False):
+            readSrList.append(paftol.tools.ReadView.fromSeqRecord(readSr, 'fwd'))
+        for readSr in paftolGene.makeMappedReadsUniqueList(includeForward=False, includeReverse=True):
+            readSrList.append(paftol.tools.ReadView.fromSeqRecord(readSr, 'rev'))
         readSrList.extend(paftol.tools.reverseComplementSeqRecordList(readSrList))
         repGene = result.representativePaftolTargetDict[geneName].seqRecord
         # repGeneProtein = self.translateGene(repGene)
@@ -614,12 +877,13 @@ class TargetAssemblerOverlapSerial(TargetAssembler):
                 # sys.stderr.write('skipping read %s with maxRelativeIdentity %f\n' % (readSrList[i].id, maxRelativeIdentity))
         positionedReadList.sort()
         # logger.debug('tracking: positioned reads')
-        positionedSrList = [positionedRead.readSr for positionedRead in positionedReadList]
-        if positionedReadDirname is not None:
-            for i in xrange(len(positionedSrList)):
-                Bio.SeqIO.write([positionedSrList[i]], '%s/p%03d.fasta' % (positionedReadDirname, i), 'fasta')
-        if positionedReadFname is not None:
-            Bio.SeqIO.write(positionedSrList, positionedReadFname, 'fasta')
+        if positionedReadDirname is not None or positionedReadFname is not None:
+            positionedSrList = [positionedRead.readView.toSeqRecord() for positionedRead in positionedReadList]
+            if positionedReadDirname is not None:
+                for i in xrange(len(positionedSrList)):
+                    Bio.SeqIO.write([positionedSrList[i]], '%s/p%03d.fasta' % (positionedReadDirname, i), 'fasta')
+            if positionedReadFname is not None:
+                Bio.SeqIO.write(positionedSrList, positionedReadFname, 'fasta')
         if overlapCsvFname is not None:
             overlapDataFrame = paftol.tools.DataFrame(['read0', 'read1', 'read1pos', 'maxRelId', 'coreLength', 'coreMatch', 'overlapLength', 'overlapMatch'])
         else:
@@ -629,25 +893,25 @@ class TargetAssemblerOverlapSerial(TargetAssembler):
         for i in xrange(len(positionedReadList)):
             if overlapDataFrame is not None:
                 if i == 0:
-                    overlapRow = {'read0': None, 'read1': positionedReadList[i].readSr.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': None, 'overlapMatch': None}
+                    overlapRow = {'read0': None, 'read1': positionedReadList[i].readView.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': None, 'overlapMatch': None}
                 else:
-                    alignmentList = self.semiglobalAlignmentRunner.align(positionedReadList[i - 1].readSr, [positionedReadList[i].readSr])
+                    alignmentList = self.semiglobalAlignmentRunner.align(positionedReadList[i - 1].readView, [positionedReadList[i].readView])
                     alignment = alignmentList[0]
                     overlapAlignment = paftol.tools.findOverlapAlignment(alignment)
                     if overlapAlignment.get_alignment_length() == 0:
                         overlapMatch = None
                     else:
                         overlapMatch = paftol.tools.findRelativeIdentity(overlapAlignment)
-                    overlapRow = {'read0': positionedReadList[i - 1].readSr.id, 'read1': positionedReadList[i].readSr.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': overlapAlignment.get_alignment_length(), 'overlapMatch': overlapMatch}
+                    overlapRow = {'read0': positionedReadList[i - 1].readView.id, 'read1': positionedReadList[i].readView.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': overlapAlignment.get_alignment_length(), 'overlapMatch': overlapMatch}
                 overlapDataFrame.addRow(overlapRow)
-            if currentContig.addRead(positionedReadList[i].readSr):
-                logger.debug('added read %s to current contig', positionedReadList[i].readSr.id)
+            if currentContig.addRead(positionedReadList[i].readView):
+                logger.debug('added read %s to current contig', positionedReadList[i].readView.id)
             else:
-                logger.debug('started new contig with read %s', positionedReadList[i].readSr.id)
+                logger.debug('started new contig with read %s', positionedReadList[i].readView.id)
                 currentContig.removeTerminalGaps()
                 contigList.append(currentContig)
                 currentContig = paftol.tools.Contig(self.windowSizeReadOverlap, self.relIdentityThresholdReadOverlap, self.semiglobalAlignmentRunner)
-                currentContig.addRead(positionedReadList[i].readSr)
+                currentContig.addRead(positionedReadList[i].readView)
         currentContig.removeTerminalGaps()
         contigList.append(currentContig)
         if overlapCsvFname is not None:
@@ -678,6 +942,8 @@ class TargetRecoverer(HybseqAnalyser):
         self.trimmedUnpairedFwd = 'trimmed_unpaired_fwd.fastq'
         self.trimmedUnpairedRev = 'trimmed_unpaired_rev.fastq'
         self.trimlogFname = 'trimlog.txt'
+        self.trimmedFastqAttrList = ['forwardFastqTrimmedPaired', 'reverseFastqTrimmedPaired', 'forwardFastqTrimmedUnpaired', 'reverseFastqTrimmedUnpaired']
+        self.streamTrimmedReads = False
 
     def setup(self, result):
         logger.debug('setting up')
@@ -795,56 +1061,143 @@ class TargetRecoverer(HybseqAnalyser):
         Bio.SeqIO.write([splicedSupercontig], splicedSupercontigFname, 'fasta')
         return splicedSupercontig
     
+    def recoverContigsAndCds(self, result, geneName, strictOverlapFiltering):
+        contigList = self.recoverContigs(result, geneName)
+        result.contigDict[geneName] = contigList
+        return contigList, self.reconstructCds(result, geneName, strictOverlapFiltering)
+
+    def trim(self, result, inputDigest):
+        """Trim reads, or resume from the trimming checkpoint.
+
+With checkpointing, trimmed reads are written to the checkpoint directory
+so they are available when resuming, until they are removed by
+L{removeTrimmedReads} at the end of the run. The trimming checkpoint is
+stale if the trimmed reads have been removed.
+"""
+        trimAttrList = self.trimmedFastqAttrList + ['forwardTrimmedPairedFastqcStats', 'reverseTrimmedPairedFastqcStats', 'forwardTrimmedUnpairedFastqcStats', 'reverseTrimmedUnpairedFastqcStats', 'forwardFastqcStats', 'reverseFastqcStats']
+        stageDigest = self.makeCheckpointDigest('trim', inputDigest)
+        trimDict = self.loadCheckpoint('trim', stageDigest)
+        if trimDict is not None:
+            if all([os.path.exists(trimDict[attrName]) for attrName in self.trimmedFastqAttrList]):
+                for attrName in trimAttrList:
+                    setattr(result, attrName, trimDict[attrName])
+                return
+            logger.info('stage trim: trimmed reads missing, not resuming')
+        if self.checkpointDirname is None:
+            makeTrimmedPath = self.makeWorkdirPath
+        else:
+            if not os.path.isdir(self.checkpointDirname):
+                os.makedirs(self.checkpointDirname)
+            makeTrimmedPath = lambda fname: os.path.join(self.checkpointDirname, fname)
+        result.forwardFastqTrimmedPaired = makeTrimmedPath(self.trimmedPairedFwd)
+        result.reverseFastqTrimmedPaired = makeTrimmedPath(self.trimmedPairedRev)
+        result.forwardFastqTrimmedUnpaired = makeTrimmedPath(self.trimmedUnpairedFwd)
+        result.reverseFastqTrimmedUnpaired = makeTrimmedPath(self.trimmedUnpairedRev)
+        trimlogPath = self.makeWorkdirPath(self.trimlogFname)
+        self.trimmomaticRunner.runTrimmomaticPaired(result.forwardFastq, result.reverseFastq, result.forwardFastqTrimmedPaired, result.reverseFastqTrimmedPaired, result.forwardFastqTrimmedUnpaired, result.reverseFastqTrimmedUnpaired, trimlogFname = trimlogPath)
+        result.generateFastqcStats()
+        self.saveCheckpoint('trim', stageDigest, dict([(attrName, getattr(result, attrName)) for attrName in trimAttrList]))
+
+    def removeTrimmedReads(self, result):
+        """Remove trimmed reads kept in the checkpoint directory.
+"""
+        if self.checkpointDirname is None:
+            return
+        for attrName in self.trimmedFastqAttrList:
+            trimmedFastqFname = getattr(result, attrName)
+            if trimmedFastqFname is not None and os.path.dirname(os.path.abspath(trimmedFastqFname)) == os.path.abspath(self.checkpointDirname) and os.path.exists(trimmedFastqFname):
+                logger.debug('removing %s', trimmedFastqFname)
+                os.unlink(trimmedFastqFname)
+            setattr(result, attrName, None)
+
+    def trimAndMapStreaming(self, result):
+        """Trim reads and map them while trimming is in progress.
+
+Trimmomatic writes the paired trimmed reads to FIFOs, from which
+they are streamed to the target mapper, so no trimmed paired read
+files are written. Unpaired trimmed reads are written to the working
+directory. As there are no trimmed paired read files, their FastQC
+stats are not computed and remain C{None}.
+"""
+        forwardFifoFname = self.makeWorkdirPath('%s.fifo' % self.trimmedPairedFwd)
+        reverseFifoFname = self.makeWorkdirPath('%s.fifo' % self.trimmedPairedRev)
+        os.mkfifo(forwardFifoFname)
+        os.mkfifo(reverseFifoFname)
+        result.forwardFastqTrimmedUnpaired = self.makeWorkdirPath(self.trimmedUnpairedFwd)
+        result.reverseFastqTrimmedUnpaired = self.makeWorkdirPath(self.trimmedUnpairedRev)
+        trimmomaticProcess, trimmomaticArgv = self.trimmomaticRunner.startTrimmomaticPaired(result.forwardFastq, result.reverseFastq, forwardFifoFname, reverseFifoFname, result.forwardFastqTrimmedUnpaired, result.reverseFastqTrimmedUnpaired, trimlogFname=self.makeWorkdirPath(self.trimlogFname))
+        trimmomaticWaiter = threading.Thread(target=lambda: (trimmomaticProcess.wait(), paftol.tools.unblockFifoReaders([forwardFifoFname, reverseFifoFname])))
+        trimmomaticWaiter.start()
+        try:
+            self.targetMapper.mapInterleavedReads(result.paftolTargetSet, lambda f: paftol.tools.writeInterleavedFastq(forwardFifoFname, reverseFifoFname, f))
+        finally:
+            trimmomaticWaiter.join()
+            os.unlink(forwardFifoFname)
+            os.unlink(reverseFifoFname)
+        if trimmomaticProcess.returncode != 0:
+            raise StandardError('trimmomatic process "%s" exited with %d' % (' '.join(trimmomaticArgv), trimmomaticProcess.returncode))
+        result.generateFastqcStats()
+
     def analyse(self, targetsSourcePath, forwardFastq, reverseFastq, allowInvalidBases, strictOverlapFiltering, maxNumReadsPerGene):
         raise StandardError, 'obsolete -- use recoverTargets'
 
     def recoverTargets(self, targetsSourcePath, forwardFastq, reverseFastq, allowInvalidBases, strictOverlapFiltering, maxNumReadsPerGene):
-        logger.debug('starting')
-	paftolTargetSet = PaftolTargetSet()
-	paftolTargetSet.readFasta(targetsSourcePath)
         # FIXME: put allowInvalidBases in result for subsequent reference?
-	paftolTargetSet.sanityCheck(allowInvalidBases)
+        paftolTargetSet = self.readTargetSet(targetsSourcePath, allowInvalidBases)
+        return self.recoverTargetsFromTargetSet(paftolTargetSet, forwardFastq, reverseFastq, strictOverlapFiltering, maxNumReadsPerGene)
+
+    def recoverTargetsFromTargetSet(self, paftolTargetSet, forwardFastq, reverseFastq, strictOverlapFiltering, maxNumReadsPerGene):
+        """Recover targets using a target set that has already been read and checked.
+
+Reads are mapped into C{paftolTargetSet}, so callers processing multiple
+samples should pass a separate copy (see L{PaftolTargetSet.copyTargets})
+for each sample.
+"""
+        logger.debug('starting')
         result = HybpiperResult(paftolTargetSet, forwardFastq, reverseFastq)
+        inputDigest = self.makeInputDigest(result, configurationStr(self.trimmomaticRunner), configurationStr(self.targetMapper), configurationStr(getattr(self.targetMapper, 'bwaRunner', None)), configurationStr(getattr(self.targetMapper, 'tblastnRunner', None)), configurationStr(self.targetAssembler))
 	try:
-            self.setup(result)
+            with result.measureStage('setup'):
+                self.setup(result)
             logger.debug('setup done')
             if self.trimmomaticRunner is None:
                 logger.debug('running without trimming')
-                trimmedForwardPairedFastqPath = forwardFastq
-                trimmedReversePairedFastqPath = reverseFastq
+                mapReads = lambda: self.targetMapper.mapReads(result.paftolTargetSet, forwardFastq, reverseFastq)
+            elif self.streamTrimmedReads:
+                if not result.isPaired() or not self.targetMapper.canMapInterleavedReads():
+                    raise StandardError, 'streaming trimmed reads requires paired reads and a mapper supporting streamed input'
+                logger.debug('running with trimmomatic trimming streamed to mapping')
+                mapReads = lambda: self.trimAndMapStreaming(result)
             else:
                 logger.debug('running with trimmomatic trimming')
-                trimmedForwardPairedFastqPath = self.makeWorkdirPath(self.trimmedPairedFwd)
-                trimmedReversePairedFastqPath = self.makeWorkdirPath(self.trimmedPairedRev)
-                trimmedForwardUnpairedFastqPath = self.makeWorkdirPath(self.trimmedUnpairedFwd)
-                trimmedReverseUnpairedFastqPath = self.makeWorkdirPath(self.trimmedUnpairedRev)
-                trimlogPath = self.makeWorkdirPath(self.trimlogFname)
-                self.trimmomaticRunner.runTrimmomaticPaired(forwardFastq, reverseFastq, trimmedForwardPairedFastqPath, trimmedReversePairedFastqPath, trimmedForwardUnpairedFastqPath, trimmedReverseUnpairedFastqPath, trimlogFname = trimlogPath)
-                result.forwardFastqTrimmedPaired = trimmedForwardPairedFastqPath
-                result.reverseFastqTrimmedPaired = trimmedReversePairedFastqPath
-                result.forwardFastqTrimmedUnpaired = trimmedForwardUnpairedFastqPath
-                result.reverseFastqTrimmedUnpaired = trimmedReverseUnpairedFastqPath
-                result.generateFastqcStats()
-            self.targetMapper.mapReads(paftolTargetSet, trimmedForwardPairedFastqPath, trimmedReversePairedFastqPath)
-            logger.debug('mapping done')
-            self.distribute(result, maxNumReadsPerGene)
+                with result.measureStage('trim'):
+                    self.trim(result, inputDigest)
+                mapReads = lambda: self.targetMapper.mapReads(result.paftolTargetSet, result.forwardFastqTrimmedPaired, result.reverseFastqTrimmedPaired)
+            with result.measureStage('mapping'):
+                stageDigest = self.mapAndDistribute(result, inputDigest, mapReads, maxNumReadsPerGene)
             logger.debug('read distribution done')
-            self.setRepresentativeGenes(result)
-            self.writeRepresentativeGenes(result)
+            with result.measureStage('representatives'):
+                self.setRepresentativeGenes(result)
+                self.writeRepresentativeGenes(result)
             logger.debug('representative genes selected')
             result.contigDict = {}
             result.reconstructedCdsDict = {}
-            for geneName in result.paftolTargetSet.paftolGeneDict:
-                result.contigDict[geneName] = self.recoverContigs(result, geneName)
-                result.reconstructedCdsDict[geneName] = self.reconstructCds(result, geneName, strictOverlapFiltering)
+            geneStageDigest = self.makeCheckpointDigest(stageDigest, strictOverlapFiltering)
+            with result.measureStage('recovery'):
+                for geneName in result.paftolTargetSet.paftolGeneDict:
+                    result.contigDict[geneName], result.reconstructedCdsDict[geneName] = self.recoverGene(geneName, geneStageDigest, lambda: self.recoverContigsAndCds(result, geneName, strictOverlapFiltering))
 	    logger.debug('CDS reconstruction done')
+            self.removeTrimmedReads(result)
             logger.debug('finished')
             return result
         finally:
-            self.makeTgz()
+            with result.measureStage('archive'):
+                self.makeTgz()
             logger.debug('tgz file made')
-            self.targetMapper.cleanup()
-            self.targetAssembler.cleanup()
+            # workdirs of mapper and assembler are within the temporary directory, so don't remove them while archiving is in progress
+            removeWorkdir = self.tgzThread is None
+            self.targetMapper.cleanup(removeWorkdir)
+            self.targetAssembler.cleanup(removeWorkdir)
             self.cleanup()
             logger.debug('cleanup done')
 
@@ -853,12 +1206,11 @@ class MappedRead(object):
     """Represent a mapping of an NGS read to a PaftolTarget.
 """
 
-    slashNumberReadIdRe = re.compile('([^/]+)/([12])')
-
     def __init__(self, paftolTarget):
         self.paftolTarget = paftolTarget
         self.forwardRead = None
         self.reverseRead = None
+        self.isDiscarded = False
 
     def getReadName(self):
         raise StandardError, 'abstract method not overridden'
@@ -866,13 +1218,61 @@ class MappedRead(object):
     def getMappingScore(self):
         raise StandardError, 'abstract method not overridden'
 
+    def getReadLength(self):
+        raise StandardError, 'abstract method not overridden'
+
     @staticmethod
     def readBasename(rawReadName):
-        m = MappedRead.slashNumberReadIdRe.match(rawReadName)
-        if m is None:
-            return rawReadName
+        """Strip a C{/1} or C{/2} mate suffix from a read name.
+
+The name is cut at its first slash if that is preceded by at least one
+character and followed by C{1} or C{2}, otherwise it is returned unchanged.
+"""
+        i = rawReadName.find('/')
+        if i > 0 and rawReadName[i + 1:i + 2] in ('1', '2'):
+            return rawReadName[:i]
+        return rawReadName
+
+
+class ReadNameIndex(object):
+    """Index of mapped reads by read name.
+
+Mapped reads are indexed by the hash of their read name rather than by
+the name itself, which saves storing a string per name. Most names are
+associated with a single mapped read, which is stored without a list
+wrapper. Hash collisions are resolved upon lookup by comparing names
+of the mapped reads.
+"""
+
+    def __init__(self):
+        self.readNameHashDict = {}
+
+    def add(self, mappedRead):
+        h = hash(mappedRead.getReadName())
+        entry = self.readNameHashDict.get(h)
+        if entry is None:
+            self.readNameHashDict[h] = mappedRead
+        elif isinstance(entry, list):
+            entry.append(mappedRead)
         else:
-            return m.group(1)
+            self.readNameHashDict[h] = [entry, mappedRead]
+
+    def getMappedReadList(self, readName):
+        """Get the reads mapped under a name.
+
+@param readName: the read name, without mate suffix
+@type readName: C{str}
+@return: list of mapped reads, empty if none are mapped under C{readName}
+@rtype: C{list} of L{MappedRead}
+"""
+        entry = self.readNameHashDict.get(hash(readName))
+        if entry is None:
+            return []
+        if isinstance(entry, list):
+            return [mappedRead for mappedRead in entry if mappedRead.getReadName() == readName]
+        if entry.getReadName() == readName:
+            return [entry]
+        return []
 
 
 class SamMappedRead(MappedRead):
@@ -887,6 +1287,11 @@ class SamMappedRead(MappedRead):
     def getMappingScore(self):
         return self.samAlignment.mapq
 
+    def getReadLength(self):
+        if self.samAlignment.seq == '*':
+            return None
+        return len(self.samAlignment.seq)
+
 
 class BlastMappedRead(MappedRead):
     """Represent a mapping of a read to a PaftolTarget based on BLAST.
@@ -906,6 +1311,9 @@ taken into account.
         # FIXME: returning score of HSP #0, ignoring all subsequent HSPs
         return self.blastAlignment.hsps[0].score
 
+    def getReadLength(self):
+        return self.blastAlignment.length
+
 
 class PaftolTarget(object):
 
@@ -931,7 +1339,8 @@ facilitating handling of multiple genes and multiple organisms.
         self.organism = organism
         self.paftolGene = paftolGene
         self.seqRecord = seqRecord
-        self.mappedReadList = []
+        self.storedMappedReadList = []
+        self.numDiscardedMappedReads = 0
 	# self.readAssociationList = []
         if paftolGene.name in organism.paftolTargetDict or organism.name in paftolGene.paftolTargetDict:
             raise StandardError('duplicate organism/gene: organism = %s, gene = %s, seqId = %s' % (organism.name, paftolGene.name, seqRecord.id))
@@ -941,8 +1350,29 @@ facilitating handling of multiple genes and multiple organisms.
     def getName(self):
         return '%s-%s' % (self.organism.name, self.paftolGene.name)
 
+    @property
+    def mappedReadList(self):
+        if self.numDiscardedMappedReads > 0:
+            self.compactMappedReads()
+        return self.storedMappedReadList
+
+    def compactMappedReads(self):
+        self.storedMappedReadList = [mr for mr in self.storedMappedReadList if not mr.isDiscarded]
+        self.numDiscardedMappedReads = 0
+
     def addMappedRead(self, mappedRead):
-        self.mappedReadList.append(mappedRead)
+        self.storedMappedReadList.append(mappedRead)
+
+    def discardMappedRead(self, mappedRead):
+        """Discard a mapped read.
+
+Discarded reads are removed from the stored list in batches, so the
+cost of discarding is amortised constant.
+"""
+        mappedRead.isDiscarded = True
+        self.numDiscardedMappedReads = self.numDiscardedMappedReads + 1
+        if 2 * self.numDiscardedMappedReads > len(self.storedMappedReadList):
+            self.compactMappedReads()
 
     def mappingScoreSum(self):
         if len(self.mappedReadList) == 0:
@@ -1020,6 +1450,29 @@ organisms.
         self.name = name
         self.paftolTargetDict = {}
         self.annotationDict = {}
+        self.mappedReadSelection = None
+
+    def capMappedReads(self, mappedRead, maxNumReads):
+        """Keep the number of distinct reads mapped to this gene within a cap while reads are being mapped.
+
+The longest reads are kept, with the mapping score used to break ties,
+and ties beyond that are resolved in favour of reads mapped first.
+
+@param mappedRead: a mapped read just added to one of this gene's targets
+@type mappedRead: L{MappedRead}
+@param maxNumReads: maximal number of distinct reads
+@type maxNumReads: C{int}
+"""
+        if self.mappedReadSelection is None:
+            self.mappedReadSelection = paftol.tools.TopScoringSelection(maxNumReads)
+        score = (mappedRead.getReadLength(), mappedRead.getMappingScore())
+        for discardedMappedRead in self.mappedReadSelection.add(mappedRead.getReadName(), score, mappedRead):
+            discardedMappedRead.paftolTarget.discardMappedRead(discardedMappedRead)
+
+    def numDiscardedReads(self):
+        if self.mappedReadSelection is None:
+            return 0
+        return self.mappedReadSelection.numDiscardedKeys
 
     def getReadNameSet(self):
         s = set()
@@ -1076,7 +1529,6 @@ organisms.
 
 def extractOrganismAndGeneNames(s):
     # FIXME: should tighten this up to fail on dangling garbage (?)
-    paftolTargetRe = re.compile('([^-]+)-([^-]+)')
     m = paftolTargetRe.match(s)
     if m is not None:
         organismName = m.group(1)
@@ -1101,6 +1553,7 @@ methods, respectively.
         self.organismDict = {}
         self.numOfftargetReads = None
         self.fastaHandleStr = None
+        self.maxNumMappedReadsPerGene = None
 
     # FIXME: static?
     def makeFastaId(self, organismName, geneName):
@@ -1153,6 +1606,77 @@ methods, respectively.
                 self.paftolGeneDict[geneName] = PaftolGene(geneName)
             paftolTarget = PaftolTarget(self.organismDict[organismName], self.paftolGeneDict[geneName], sr)
 
+    def addTargetTuple(self, organismName, geneName, seqId, seqName, seqDescription, seqStr):
+        if organismName not in self.organismDict:
+            self.organismDict[organismName] = Organism(organismName)
+        if geneName not in self.paftolGeneDict:
+            self.paftolGeneDict[geneName] = PaftolGene(geneName)
+        sr = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(seqStr, Bio.Alphabet.IUPAC.ambiguous_dna), id=seqId, name=seqName, description=seqDescription)
+        PaftolTarget(self.organismDict[organismName], self.paftolGeneDict[geneName], sr)
+
+    def makeTargetTupleList(self):
+        targetTupleList = []
+        for organismName, organism in self.organismDict.iteritems():
+            for geneName, paftolTarget in organism.paftolTargetDict.iteritems():
+                sr = paftolTarget.seqRecord
+                targetTupleList.append((organismName, geneName, sr.id, sr.name, sr.description, str(sr.seq)))
+        return targetTupleList
+
+    def readFastaCached(self, fastaFname, cacheDirname, allowInvalidBases=False):
+        """Read targets from a FASTA file and sanity check them, using a cache of parsed target sets.
+
+Target sets are cached as pickled lists of tuples, keyed by the MD5
+digest of the FASTA file and by C{allowInvalidBases}, so a cached
+target set has passed the same sanity check as would be applied when
+parsing the FASTA file. Loading a cached target set bypasses FASTA
+parsing and header splitting.
+
+@param fastaFname: name of the FASTA file
+@type fastaFname: C{str}
+@param cacheDirname: directory containing cached target sets, created if it does not exist
+@type cacheDirname: C{str}
+@param allowInvalidBases: passed on to L{sanityCheck}
+@type allowInvalidBases: C{bool}
+"""
+        fastaDigest = paftol.tools.md5HexdigestFromFile(fastaFname)
+        cacheFname = os.path.join(cacheDirname, '%s-%s.targets.pickle' % (fastaDigest, 'anybases' if allowInvalidBases else 'acgt'))
+        self.paftolGeneDict = {}
+        self.organismDict = {}
+        if os.path.exists(cacheFname):
+            logger.debug('reading cached targets %s', cacheFname)
+            with open(cacheFname, 'rb') as f:
+                targetTupleList = cPickle.load(f)
+            for targetTuple in targetTupleList:
+                self.addTargetTuple(*targetTuple)
+            self.fastaHandleStr = str(fastaFname)
+            return
+        self.readFasta(fastaFname)
+        self.sanityCheck(allowInvalidBases)
+        if not os.path.isdir(cacheDirname):
+            os.makedirs(cacheDirname)
+        tmpFname = '%s.tmp%d' % (cacheFname, os.getpid())
+        with open(tmpFname, 'wb') as f:
+            cPickle.dump(self.makeTargetTupleList(), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpFname, cacheFname)
+
+    def copyTargets(self):
+        """Make a copy of this target set without any mapped reads.
+
+Target sequence records are shared with this target set rather than copied.
+
+@return: a new target set
+@rtype: L{PaftolTargetSet}
+"""
+        paftolTargetSet = PaftolTargetSet()
+        paftolTargetSet.fastaHandleStr = self.fastaHandleStr
+        for organismName, organism in self.organismDict.iteritems():
+            paftolTargetSet.organismDict[organismName] = Organism(organismName)
+            for geneName, paftolTarget in organism.paftolTargetDict.iteritems():
+                if geneName not in paftolTargetSet.paftolGeneDict:
+                    paftolTargetSet.paftolGeneDict[geneName] = PaftolGene(geneName)
+                PaftolTarget(paftolTargetSet.organismDict[organismName], paftolTargetSet.paftolGeneDict[geneName], paftolTarget.seqRecord)
+        return paftolTargetSet
+
     def meanTargetLength(self, geneName):
         if geneName not in self.paftolGeneDict:
             raise StandardError, 'gene %s not contained in this target set'
@@ -1184,16 +1708,21 @@ methods, respectively.
             self.checkOrganismAndGene(organismName, geneName)
             paftolTarget = self.organismDict[organismName].paftolTargetDict[geneName]
 	    mappedRead = SamMappedRead(paftolTarget, samAlignment)
-	    paftolTarget.addMappedRead(mappedRead)
+	    self.addMappedRead(paftolTarget, mappedRead)
         else:
             self.numOfftargetReads = self.numOfftargetReads + 1
 
+    def addMappedRead(self, paftolTarget, mappedRead):
+        paftolTarget.addMappedRead(mappedRead)
+        if self.maxNumMappedReadsPerGene is not None:
+            paftolTarget.paftolGene.capMappedReads(mappedRead, self.maxNumMappedReadsPerGene)
+
     def processBlastAlignment(self, query, blastAlignment):
         organismName, geneName = extractOrganismAndGeneNames(query)
         self.checkOrganismAndGene(organismName, geneName)
         paftolTarget = self.organismDict[organismName].paftolTargetDict[geneName]
         mappedRead = BlastMappedRead(paftolTarget, blastAlignment)
-        paftolTarget.addMappedRead(mappedRead)
+        self.addMappedRead(paftolTarget, mappedRead)
 
     def makeReadNameGeneDict(self):
         readNameGeneDict = {}
@@ -1216,6 +1745,14 @@ methods, respectively.
                     readNameMappedReadDict[readName].append(mappedRead)
         return readNameMappedReadDict
 
+    def makeReadNameIndex(self):
+        readNameIndex = ReadNameIndex()
+        for paftolGene in self.paftolGeneDict.values():
+            for paftolTarget in paftolGene.paftolTargetDict.values():
+                for mappedRead in paftolTarget.mappedReadList:
+                    readNameIndex.add(mappedRead)
+        return readNameIndex
+
     def targetStats(self):
         dataFrame = paftol.tools.DataFrame(PaftolTarget.csvFieldNames)
         for organism in self.organismDict.values():
@@ -1592,7 +2129,7 @@ conventions may be added.
 
     def mapReadsStatsBwaMem(self, bwaRunner, forwardReadsFname, reverseReadsFname=None):
         referenceGenomeMappingProcessor = ReferenceGenomeMappingProcessor(self)
-        bwaRunner.processBwa(referenceGenomeMappingProcessor, forwardReadsFname, reverseReadsFname)
+        bwaRunner.processBwa(referenceGenomeMappingProcessor, self.fastaFname, forwardReadsFname, reverseReadsFname)
         return referenceGenomeMappingProcessor.getStatsTable(), referenceGenomeMappingProcessor.rawmapTable
 
 
@@ -1798,7 +2335,7 @@ this).
         else:
             reverseReadsFname = os.path.join(os.getcwd(), result.reverseFastq)
         result.paftolTargetSet.numOfftargetReads = 0
-        self.bwaRunner.processBwa(result.paftolTargetSet, referenceFname, forwardReadsFname, reverseReadsFname)
+        self.bwaRunner.processBwa(result.paftolTargetSet, referenceFname, forwardReadsFname, reverseReadsFname, False)
 
     # ideas for hybrid / consensus sequence for (multiple) re-mapping
     # reference CDS:     atgtac------catacagaagagacgtga
@@ -1812,29 +2349,29 @@ this).
 
     def analyse(self, targetsSourcePath, forwardFastq, reverseFastq, allowInvalidBases, strictOverlapFiltering, maxNumReadsPerGene):
         logger.debug('starting')
-	paftolTargetSet = PaftolTargetSet()
-	paftolTargetSet.readFasta(targetsSourcePath)
         # FIXME: put allowInvalidBases in result for subsequent reference?
-	paftolTargetSet.sanityCheck(allowInvalidBases)
+        paftolTargetSet = self.readTargetSet(targetsSourcePath, allowInvalidBases)
         result = HybpiperResult(paftolTargetSet, forwardFastq, reverseFastq)
+        inputDigest = self.makeInputDigest(result, configurationStr(self.bwaRunner), configurationStr(self.spadesRunner))
 	try:
-            self.setup(result)
+            with result.measureStage('setup'):
+                self.setup(result)
             logger.debug('setup done')
-            self.mapReadsBwa(result)
-            logger.debug('BWA mapping done')
-            self.distribute(result, maxNumReadsPerGene)
+            with result.measureStage('mapping'):
+                stageDigest = self.mapAndDistribute(result, inputDigest, lambda: self.mapReadsBwa(result), maxNumReadsPerGene)
             logger.debug('read distribution done')
-            self.setRepresentativeGenes(result)
-            self.writeRepresentativeGenes(result)
+            with result.measureStage('representatives'):
+                self.setRepresentativeGenes(result)
+                self.writeRepresentativeGenes(result)
             logger.debug('representative genes selected')
-            result.reconstructedCdsDict = {}
-            for geneName in result.paftolTargetSet.paftolGeneDict:
-                result.reconstructedCdsDict[geneName] = self.reconstructCds(result, geneName, strictOverlapFiltering)
+            with result.measureStage('recovery'):
+                self.recoverCdsDict(result, stageDigest, strictOverlapFiltering)
 	    logger.debug('CDS reconstruction done')
             logger.debug('finished')
             return result
         finally:
-            self.makeTgz()
+            with result.measureStage('archive'):
+                self.makeTgz()
             logger.debug('tgz file made')
             self.cleanup()
             logger.debug('cleanup done')
@@ -1872,28 +2409,24 @@ this).
         logger.debug('setting up')
         self.setupTmpdir()
 	result.paftolTargetSet.writeFasta(self.makeTargetsFname(True))
-        forwardFastaPath = self.makeWorkdirPath(self.forwardFasta)
-        paftol.tools.fastqToFasta(result.forwardFastq, forwardFastaPath)
-        self.tblastnRunner.indexDatabase(forwardFastaPath)
-        if result.reverseFastq is not None:
-            reverseFastaPath = self.makeWorkdirPath(self.reverseFasta)
-            paftol.tools.fastqToFasta(result.reverseFastq, reverseFastaPath)
-            self.tblastnRunner.indexDatabase(reverseFastaPath)
 
     def mapReadsTblastn(self, result):
         """Map gene sequences to reads (from multiple organisms possibly).
 """
         logger.debug('mapping gene sequences to reads')
+        self.forwardDatabase = self.tblastnRunner.makeFastqDatabase(result.forwardFastq, self.makeWorkdirPath(self.forwardFasta))
+        if result.reverseFastq is not None:
+            self.reverseDatabase = self.tblastnRunner.makeFastqDatabase(result.reverseFastq, self.makeWorkdirPath(self.reverseFasta))
         referenceFname = self.makeTargetsFname(True) ## check this holds
         targetProteinList = [self.translateGene(geneSr) for geneSr in result.paftolTargetSet.getSeqRecordList()]
         # FIXME: check these parameters, consider numAlignments?
         self.tblastnRunner.maxTargetSeqs = 10000000
         self.tblastnRunner.maxHsps = 1
         result.paftolTargetSet.numOfftargetReads = None
-        self.tblastnRunner.processTblastn(result.paftolTargetSet, self.makeWorkdirPath(self.forwardFasta), targetProteinList)
+        self.tblastnRunner.processTblastn(result.paftolTargetSet, self.forwardDatabase, targetProteinList)
         # FIXME: should be not None (!!!)
         if result.reverseFastq is not None:
-            self.tblastnRunner.processTblastn(result.paftolTargetSet, self.makeWorkdirPath(self.reverseFasta), targetProteinList)
+            self.tblastnRunner.processTblastn(result.paftolTargetSet, self.reverseDatabase, targetProteinList)
 
 
     # ideas for hybrid / consensus sequence for (multiple) re-mapping
@@ -1908,29 +2441,29 @@ this).
 
     def analyse(self, targetsSourcePath, forwardFastq, reverseFastq, allowInvalidBases, strictOverlapFiltering, maxNumReadsPerGene):
         logger.debug('starting')
-	paftolTargetSet = PaftolTargetSet()
-	paftolTargetSet.readFasta(targetsSourcePath)
         # FIXME: put allowInvalidBases in result for subsequent reference?
-	paftolTargetSet.sanityCheck(allowInvalidBases)
+        paftolTargetSet = self.readTargetSet(targetsSourcePath, allowInvalidBases)
         result = HybpiperResult(paftolTargetSet, forwardFastq, reverseFastq)
+        inputDigest = self.makeInputDigest(result, configurationStr(self.tblastnRunner), configurationStr(self.spadesRunner))
 	try:
-            self.setup(result)
+            with result.measureStage('setup'):
+                self.setup(result)
             logger.debug('setup done')
-            self.mapReadsTblastn(result)
-            logger.debug('tblastn mapping done')
-            self.distribute(result, maxNumReadsPerGene)
+            with result.measureStage('mapping'):
+                stageDigest = self.mapAndDistribute(result, inputDigest, lambda: self.mapReadsTblastn(result), maxNumReadsPerGene)
             logger.debug('read distribution done')
-            self.setRepresentativeGenes(result)
-            self.writeRepresentativeGenes(result)
+            with result.measureStage('representatives'):
+                self.setRepresentativeGenes(result)
+                self.writeRepresentativeGenes(result)
             logger.debug('representative genes selected')
-            result.reconstructedCdsDict = {}
-            for geneName in result.paftolTargetSet.paftolGeneDict:
-                result.reconstructedCdsDict[geneName] = self.reconstructCds(result, geneName, strictOverlapFiltering)
+            with result.measureStage('recovery'):
+                self.recoverCdsDict(result, stageDigest, strictOverlapFiltering)
 	    logger.debug('CDS reconstruction done')
             logger.debug('finished')
             return result
         finally:
-            self.makeTgz()
+            with result.measureStage('archive'):
+                self.makeTgz()
             logger.debug('tgz file made')
             self.cleanup()
             logger.debug('cleanup done')
@@ -1948,6 +2481,7 @@ class OverlapAnalyser(HybseqAnalyser):
         self.relIdentityThresholdReference = None
         self.windowSizeReadOverlap = None
         self.relIdentityThresholdReadOverlap = None
+        self.writeDebugFiles = False
         # hard-coded alignment runner while API is incomplete...
         self.alignmentRunner = tools.SemiglobalAlignmentRunner()
 
@@ -1955,44 +2489,42 @@ class OverlapAnalyser(HybseqAnalyser):
         logger.debug('setting up')
         self.setupTmpdir()
 	result.paftolTargetSet.writeFasta(self.makeTargetsFname(True))
-        forwardFastaPath = self.makeWorkdirPath(self.forwardFasta)
-        paftol.tools.fastqToFasta(result.forwardFastq, forwardFastaPath)
-        self.tblastnRunner.indexDatabase(forwardFastaPath)
-        if result.reverseFastq is not None:
-            reverseFastaPath = self.makeWorkdirPath(self.reverseFasta)
-            paftol.tools.fastqToFasta(result.reverseFastq, reverseFastaPath)
-            self.tblastnRunner.indexDatabase(reverseFastaPath)
 
     def mapReadsTblastn(self, result):
         """Map gene sequences to reads (from multiple organisms possibly).
 """
         logger.debug('mapping gene sequences to reads')
+        self.forwardDatabase = self.tblastnRunner.makeFastqDatabase(result.forwardFastq, self.makeWorkdirPath(self.forwardFasta))
+        if result.reverseFastq is not None:
+            self.reverseDatabase = self.tblastnRunner.makeFastqDatabase(result.reverseFastq, self.makeWorkdirPath(self.reverseFasta))
         referenceFname = self.makeTargetsFname(True) ## check this holds
         targetProteinList = [self.translateGene(geneSr) for geneSr in result.paftolTargetSet.getSeqRecordList()]
         # FIXME: check these parameters, consider numAlignments?
         self.tblastnRunner.maxTargetSeqs = 10000000
         self.tblastnRunner.maxHsps = 1
         result.paftolTargetSet.numOfftargetReads = None
-        self.tblastnRunner.processTblastn(result.paftolTargetSet, self.makeWorkdirPath(self.forwardFasta), targetProteinList)
+        self.tblastnRunner.processTblastn(result.paftolTargetSet, self.forwardDatabase, targetProteinList)
         # FIXME: should be not None (!!!)
         if result.reverseFastq is not None:
-            self.tblastnRunner.processTblastn(result.paftolTargetSet, self.makeWorkdirPath(self.reverseFasta), targetProteinList)
+            self.tblastnRunner.processTblastn(result.paftolTargetSet, self.reverseDatabase, targetProteinList)
 
     def assembleGeneSerialOverlap(self, result, geneName):
         # logger.debug('tracking: starting with gene %s' % geneName)
-        overlapCsvFname = self.makeWorkdirPath('overlap-%s.csv' % geneName)
-        positionedReadDirname = self.makeWorkdirPath('posread-%s' % geneName)
-        positionedReadFname = self.makeWorkdirPath('posread-%s.fasta' % geneName)
-        os.mkdir(positionedReadDirname)
-        readSrFwdList = copy.deepcopy(result.paftolTargetSet.paftolGeneDict[geneName].makeMappedReadsUniqueList(includeForward=True, includeReverse=False))
-        readSrRevList = copy.deepcopy(result.paftolTargetSet.paftolGeneDict[geneName].makeMappedReadsUniqueList(includeForward=False, includeReverse=True))
+        if self.writeDebugFiles:
+            overlapCsvFname = self.makeWorkdirPath('overlap-%s.csv' % geneName)
+            positionedReadDirname = self.makeWorkdirPath('posread-%s' % geneName)
+            positionedReadFname = self.makeWorkdirPath('posread-%s.fasta' % geneName)
+            os.mkdir(positionedReadDirname)
+        else:
+            overlapCsvFname = None
+            positionedReadDirname = None
+            positionedReadFname = None
+        paftolGene = result.paftolTargetSet.paftolGeneDict[geneName]
         readSrList = []
-        for readSr in readSrFwdList:
-            readSr.id = '%s-fwd' % readSr.id
-            readSrList.append(readSr)
-        for readSr in readSrRevList:
-            readSr.id = '%s-rev' % readSr.id
-            readSrList.append(readSr)
+        for readSr in paftolGene.makeMappedReadsUniqueList(includeForward=True, includeReverse=False):
+            readSrList.append(paftol.tools.ReadView.fromSeqRecord(readSr, 'fwd'))
+        for readSr in paftolGene.makeMappedReadsUniqueList(includeForward=False, includeReverse=True):
+            readSrList.append(paftol.tools.ReadView.fromSeqRecord(readSr, 'rev'))
         readSrList.extend(paftol.tools.reverseComplementSeqRecordList(readSrList))
         repGene = result.representativePaftolTargetDict[geneName].seqRecord
         # repGeneProtein = self.translateGene(repGene)
@@ -2021,12 +2553,13 @@ class OverlapAnalyser(HybseqAnalyser):
                 # sys.stderr.write('skipping read %s with maxRelativeIdentity %f\n' % (readSrList[i].id, maxRelativeIdentity))
         positionedReadList.sort()
         # logger.debug('tracking: positioned reads')
-        positionedSrList = [positionedRead.readSr for positionedRead in positionedReadList]
-        if positionedReadDirname is not None:
-            for i in xrange(len(positionedSrList)):
-                Bio.SeqIO.write([positionedSrList[i]], '%s/p%03d.fasta' % (positionedReadDirname, i), 'fasta')
-        if positionedReadFname is not None:
-            Bio.SeqIO.write(positionedSrList, positionedReadFname, 'fasta')
+        if positionedReadDirname is not None or positionedReadFname is not None:
+            positionedSrList = [positionedRead.readView.toSeqRecord() for positionedRead in positionedReadList]
+            if positionedReadDirname is not None:
+                for i in xrange(len(positionedSrList)):
+                    Bio.SeqIO.write([positionedSrList[i]], '%s/p%03d.fasta' % (positionedReadDirname, i), 'fasta')
+            if positionedReadFname is not None:
+                Bio.SeqIO.write(positionedSrList, positionedReadFname, 'fasta')
         if overlapCsvFname is not None:
             overlapDataFrame = paftol.tools.DataFrame(['read0', 'read1', 'read1pos', 'maxRelId', 'coreLength', 'coreMatch', 'overlapLength', 'overlapMatch'])
         else:
@@ -2036,25 +2569,25 @@ class OverlapAnalyser(HybseqAnalyser):
         for i in xrange(len(positionedReadList)):
             if overlapDataFrame is not None:
                 if i == 0:
-                    overlapRow = {'read0': None, 'read1': positionedReadList[i].readSr.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': None, 'overlapMatch': None}
+                    overlapRow = {'read0': None, 'read1': positionedReadList[i].readView.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': None, 'overlapMatch': None}
                 else:
-                    alignmentList = self.alignmentRunner.align(positionedReadList[i - 1].readSr, [positionedReadList[i].readSr])
+                    alignmentList = self.alignmentRunner.align(positionedReadList[i - 1].readView, [positionedReadList[i].readView])
                     alignment = alignmentList[0]
                     overlapAlignment = paftol.tools.findOverlapAlignment(alignment)
                     if overlapAlignment.get_alignment_length() == 0:
                         overlapMatch = None
                     else:
                         overlapMatch = paftol.tools.findRelativeIdentity(overlapAlignment)
-                    overlapRow = {'read0': positionedReadList[i - 1].readSr.id, 'read1': positionedReadList[i].readSr.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': overlapAlignment.get_alignment_length(), 'overlapMatch': overlapMatch}
+                    overlapRow = {'read0': positionedReadList[i - 1].readView.id, 'read1': positionedReadList[i].readView.id, 'read1pos': positionedReadList[i].position, 'maxRelId': positionedReadList[i].maxRelativeIdentity, 'coreLength': positionedReadList[i].coreLength, 'coreMatch': positionedReadList[i].coreMatch, 'overlapLength': overlapAlignment.get_alignment_length(), 'overlapMatch': overlapMatch}
                 overlapDataFrame.addRow(overlapRow)
-            if currentContig.addRead(positionedReadList[i].readSr):
-                logger.debug('added read %s to current contig', positionedReadList[i].readSr.id)
+            if currentContig.addRead(positionedReadList[i].readView):
+                logger.debug('added read %s to current contig', positionedReadList[i].readView.id)
             else:
-                logger.debug('started new contig with read %s', positionedReadList[i].readSr.id)
+                logger.debug('started new contig with read %s', positionedReadList[i].readView.id)
                 currentContig.removeTerminalGaps()
                 contigList.append(currentContig)
                 currentContig = paftol.tools.Contig(self.windowSizeReadOverlap, self.relIdentityThresholdReadOverlap, self.alignmentRunner)
-                currentContig.addRead(positionedReadList[i].readSr)
+                currentContig.addRead(positionedReadList[i].readView)
         currentContig.removeTerminalGaps()
         contigList.append(currentContig)
         if overlapCsvFname is not None:
@@ -2168,29 +2701,29 @@ class OverlapAnalyser(HybseqAnalyser):
         if self.relIdentityThresholdReadOverlap is None:
             raise StandardError, 'illegal state: relIdentityThresholdReadOverlap not set, not ready to analyse'
         logger.debug('starting')
-	paftolTargetSet = paftol.PaftolTargetSet()
-	paftolTargetSet.readFasta(targetsSourcePath)
         # FIXME: put allowInvalidBases in result for subsequent reference?
-	paftolTargetSet.sanityCheck(allowInvalidBases)
+        paftolTargetSet = self.readTargetSet(targetsSourcePath, allowInvalidBases)
         result = paftol.HybpiperResult(paftolTargetSet, forwardFastq, reverseFastq)
+        inputDigest = self.makeInputDigest(result, configurationStr(self.tblastnRunner), self.windowSizeReference, self.relIdentityThresholdReference, self.windowSizeReadOverlap, self.relIdentityThresholdReadOverlap)
 	try:
-            self.setup(result)
+            with result.measureStage('setup'):
+                self.setup(result)
             logger.debug('setup done')
-            self.mapReadsTblastn(result)
-            logger.debug('tblastn mapping done')
-            self.distribute(result, maxNumReadsPerGene)
+            with result.measureStage('mapping'):
+                stageDigest = self.mapAndDistribute(result, inputDigest, lambda: self.mapReadsTblastn(result), maxNumReadsPerGene)
             logger.debug('read distribution done')
-            self.setRepresentativeGenes(result)
-            self.writeRepresentativeGenes(result)
+            with result.measureStage('representatives'):
+                self.setRepresentativeGenes(result)
+                self.writeRepresentativeGenes(result)
             logger.debug('representative genes selected')
-            result.reconstructedCdsDict = {}
-            for geneName in result.paftolTargetSet.paftolGeneDict:
-                result.reconstructedCdsDict[geneName] = self.reconstructCds(result, geneName, strictOverlapFiltering)
+            with result.measureStage('recovery'):
+                self.recoverCdsDict(result, stageDigest, strictOverlapFiltering)
 	    logger.debug('CDS reconstruction done')
             logger.debug('finished')
             return result
         finally:
-            self.makeTgz()
+            with result.measureStage('archive'):
+                self.makeTgz()
             logger.debug('tgz file made')
             self.cleanup()
             logger.debug('cleanup done')
@@ -2205,6 +2738,27 @@ class HybseqResult(object):
         self.reconstructedCdsFastaFname = None  # Paul B. - added this file name so it can be used in the database upload.
         self.reconstructedCdsFastaFnamePath = None  # Paul B. - added this path so it can recorded in the database.
         self.cmdLine = None
+        self.stageMetricsList = []
+
+    def measureStage(self, stageName):
+        """Measure resource usage of a stage of the analysis producing this result.
+
+@param stageName: name of the stage
+@type stageName: C{str}
+@return: a context manager, the stage is measured during its C{with} block
+@rtype: C{paftol.tools.StageMetrics}
+"""
+        stageMetrics = paftol.tools.StageMetrics(stageName)
+        self.stageMetricsList.append(stageMetrics)
+        return stageMetrics
+
+    def stageMetricsDataFrame(self, sampleName=None):
+        stageMetricsDataFrame = paftol.tools.DataFrame(['sampleName'] + paftol.tools.StageMetrics.columnHeaderList)
+        for stageMetrics in self.stageMetricsList:
+            rowDict = stageMetrics.getRowDict()
+            rowDict['sampleName'] = sampleName
+            stageMetricsDataFrame.addRow(rowDict)
+        return stageMetricsDataFrame
 
     def summaryStats(self):
         raise StandardError, 'not implemented by this abstract class'
@@ -0,0 +1,307 @@
+import os
+import csv
+import random
+import time
+import math
+import shutil
+import tempfile
+import StringIO
+import logging
+
+import Bio
+import Bio.Alphabet
+import Bio.Alphabet.IUPAC
+import Bio.Seq
+import Bio.SeqRecord
+import Bio.SeqIO
+
+import paftol
+import paftol.tools
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyntheticHybseqData(object):
+
+    """Deterministic synthetic targets and paired end reads for benchmarking.
+
+For each gene, an ancestral sequence is generated, from which the
+targets of the organisms and the sequence of the sample are derived
+by random substitutions, at a rate given by the divergence. Read pairs
+are sampled from the sample sequences such that the genes are covered
+at the given depth. All random choices are made by a generator seeded
+with C{seed}, so equal parameters produce identical data.
+
+@ivar targetSrList: target sequences, with ids of the form C{organism-gene}
+@type targetSrList: C{list} of C{Bio.SeqRecord.SeqRecord}
+@ivar readPairList: read pairs as tuples of forward read, reverse read, target id and position of the forward read
+@type readPairList: C{list} of C{tuple}
+"""
+
+    nucleotideList = ['A', 'C', 'G', 'T']
+    parameterNameList = ['numGenes', 'numOrganisms', 'geneLength', 'readLength', 'depth', 'divergence', 'seed']
+
+    def __init__(self, numGenes=10, numOrganisms=3, geneLength=900, readLength=150, depth=20, divergence=0.05, seed=1):
+        self.numGenes = numGenes
+        self.numOrganisms = numOrganisms
+        self.geneLength = geneLength
+        self.readLength = readLength
+        self.depth = depth
+        self.divergence = divergence
+        self.seed = seed
+        if geneLength < 2 * readLength:
+            raise StandardError, 'gene length %d too short for read length %d' % (geneLength, readLength)
+        self.rng = random.Random(seed)
+        self.targetSrList = []
+        self.readPairList = []
+        self.generate()
+
+    def randomSeq(self, length):
+        return ''.join([self.rng.choice(self.nucleotideList) for i in xrange(length)])
+
+    def mutateSeq(self, s):
+        symbolList = list(s)
+        for i in xrange(len(symbolList)):
+            if self.rng.random() < self.divergence:
+                symbolList[i] = self.rng.choice([n for n in self.nucleotideList if n != symbolList[i]])
+        return ''.join(symbolList)
+
+    def generate(self):
+        numReadPairsPerGene = int(math.ceil(float(self.depth * self.geneLength) / (2 * self.readLength)))
+        readIndex = 0
+        for geneIndex in xrange(self.numGenes):
+            geneName = 'gene%04d' % geneIndex
+            ancestralSeq = self.randomSeq(self.geneLength)
+            for organismIndex in xrange(self.numOrganisms):
+                targetId = 'org%03d-%s' % (organismIndex, geneName)
+                self.targetSrList.append(Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(self.mutateSeq(ancestralSeq), alphabet=Bio.Alphabet.IUPAC.unambiguous_dna), id=targetId, description=''))
+            sampleSeq = Bio.Seq.Seq(self.mutateSeq(ancestralSeq), alphabet=Bio.Alphabet.IUPAC.unambiguous_dna)
+            targetId = self.targetSrList[-self.numOrganisms].id
+            positionList = sorted([self.rng.randint(0, self.geneLength - 2 * self.readLength) for i in xrange(numReadPairsPerGene)])
+            for position in positionList:
+                fragmentLength = self.rng.randint(2 * self.readLength, min(self.geneLength - position, 3 * self.readLength))
+                readName = 'read%08d' % readIndex
+                readIndex = readIndex + 1
+                forwardRead = self.makeRead(readName, '1', sampleSeq[position:position + self.readLength])
+                reverseRead = self.makeRead(readName, '2', sampleSeq[position + fragmentLength - self.readLength:position + fragmentLength].reverse_complement())
+                self.readPairList.append((forwardRead, reverseRead, targetId, position))
+
+    def makeRead(self, readName, mateNumber, seq):
+        read = Bio.SeqRecord.SeqRecord(seq, id='%s/%s' % (readName, mateNumber), description='')
+        read.letter_annotations['phred_quality'] = [40] * len(seq)
+        return read
+
+    def writeTargetsFasta(self, fastaFname):
+        Bio.SeqIO.write(self.targetSrList, fastaFname, 'fasta')
+
+    def writeFastq(self, forwardFastqFname, reverseFastqFname):
+        Bio.SeqIO.write([readPair[0] for readPair in self.readPairList], forwardFastqFname, 'fastq')
+        Bio.SeqIO.write([readPair[1] for readPair in self.readPairList], reverseFastqFname, 'fastq')
+
+    def makeSamLineList(self):
+        """Make SAM lines mapping the forward reads to the targets they were sampled for.
+"""
+        samLineList = []
+        for forwardRead, reverseRead, targetId, position in self.readPairList:
+            samLineList.append('%s\t0\t%s\t%d\t60\t%dM\t*\t0\t0\t%s\t%s\n' % (forwardRead.id, targetId, position + 1, len(forwardRead), str(forwardRead.seq), 'I' * len(forwardRead)))
+        return samLineList
+
+    def makeExonerateResultList(self):
+        """Make exonerate results for contigs of the first gene, as input for containment filtering.
+"""
+        rng = random.Random(self.seed)
+        querySr = self.targetSrList[0]
+        exonerateResultList = []
+        for i, readPair in enumerate(self.readPairList[:min(len(self.readPairList), 200)]):
+            exonerateResult = paftol.tools.ExonerateResult(querySr, None)
+            exonerateResult.targetId = 'contig%05d' % i
+            exonerateResult.queryAlignmentStart = readPair[3] / 3
+            exonerateResult.queryAlignmentEnd = exonerateResult.queryAlignmentStart + rng.randint(10, self.geneLength / 3 - exonerateResult.queryAlignmentStart)
+            exonerateResult.targetAlignmentStart = rng.randint(0, 20)
+            exonerateResult.targetAlignmentLength = 3 * (exonerateResult.queryAlignmentEnd - exonerateResult.queryAlignmentStart) + rng.randint(0, 5)
+            exonerateResultList.append(exonerateResult)
+        return exonerateResultList
+
+
+class Benchmark(object):
+
+    """Time a function on synthetic data.
+
+@ivar name: name of the benchmark
+@type name: C{str}
+@ivar setupFunction: function called before each run to prepare the argument of C{benchFunction}, not timed
+@ivar benchFunction: function to be timed
+"""
+
+    def __init__(self, name, setupFunction, benchFunction):
+        self.name = name
+        self.setupFunction = setupFunction
+        self.benchFunction = benchFunction
+
+    def run(self, numRepeats):
+        timeList = []
+        for i in xrange(numRepeats):
+            benchArg = self.setupFunction()
+            startTime = time.time()
+            self.benchFunction(benchArg)
+            timeList.append(time.time() - startTime)
+        return timeList
+
+
+class BenchmarkSuite(object):
+
+    """Benchmarks of the performance critical parts of Hyb-Seq analysis.
+
+@ivar syntheticHybseqData: data for the benchmarks
+@type syntheticHybseqData: L{SyntheticHybseqData}
+@ivar numRepeats: number of times each benchmark is run
+@type numRepeats: C{int}
+"""
+
+    columnHeaderList = ['benchmark', 'numRepeats', 'minTime', 'medianTime', 'meanTime', 'numGenes', 'numOrganisms', 'geneLength', 'readLength', 'depth', 'divergence', 'seed', 'version']
+
+    def __init__(self, syntheticHybseqData, numRepeats=5):
+        self.syntheticHybseqData = syntheticHybseqData
+        self.numRepeats = numRepeats
+        self.tmpDirname = None
+        self.semiglobalAlignmentRunner = paftol.tools.SemiglobalAlignmentRunner()
+
+    def makeTmpPath(self, fname):
+        return os.path.join(self.tmpDirname, fname)
+
+    def makePaftolTargetSet(self):
+        paftolTargetSet = paftol.PaftolTargetSet()
+        paftolTargetSet.readFasta(self.makeTmpPath('targets.fasta'))
+        return paftolTargetSet
+
+    def makeMappedPaftolTargetSet(self):
+        paftolTargetSet = self.makePaftolTargetSet()
+        for samLine in self.samLineList:
+            paftolTargetSet.processSamAlignment(paftol.tools.SamAlignment(samLine))
+        return paftolTargetSet
+
+    def processSamAlignments(self, benchArg):
+        paftolTargetSet, samAlignmentList = benchArg
+        for samAlignment in samAlignmentList:
+            paftolTargetSet.processSamAlignment(samAlignment)
+
+    def readMappedReadsPaired(self, result):
+        paftol.HybseqAnalyser().readMappedReadsPaired(result)
+
+    def addReadsToContig(self, readList):
+        contig = paftol.tools.Contig(50, 0.7, self.semiglobalAlignmentRunner)
+        for read in readList:
+            contig.addRead(read)
+
+    def writeCsv(self, dataFrame):
+        dataFrame.writeCsv(StringIO.StringIO())
+
+    def makeDataFrame(self):
+        dataFrame = paftol.tools.DataFrame(['readName', 'targetId', 'position', 'length'])
+        for forwardRead, reverseRead, targetId, position in self.syntheticHybseqData.readPairList:
+            dataFrame.addRow({'readName': forwardRead.id, 'targetId': targetId, 'position': position, 'length': len(forwardRead)})
+        return dataFrame
+
+    def makeBenchmarkList(self):
+        data = self.syntheticHybseqData
+        firstTargetId = data.readPairList[0][2]
+        geneReadList = [readPair[0] for readPair in data.readPairList if readPair[2] == firstTargetId]
+        forwardFastq = self.makeTmpPath('fwd.fastq')
+        reverseFastq = self.makeTmpPath('rev.fastq')
+        return [
+            Benchmark('semiglobalOneVsAll', lambda: (data.targetSrList[0], geneReadList), lambda benchArg: paftol.tools.semiglobalOneVsAll(*benchArg)),
+            Benchmark('Contig.addRead', lambda: geneReadList, self.addReadsToContig),
+            Benchmark('readMappedReadsPaired', lambda: paftol.HybpiperResult(self.makeMappedPaftolTargetSet(), forwardFastq, reverseFastq), self.readMappedReadsPaired),
+            Benchmark('PaftolTargetSet.processSamAlignment', lambda: (self.makePaftolTargetSet(), [paftol.tools.SamAlignment(samLine) for samLine in self.samLineList]), self.processSamAlignments),
+            Benchmark('filterByContainment', data.makeExonerateResultList, paftol.HybseqAnalyser().filterByContainment),
+            Benchmark('DataFrame.writeCsv', self.makeDataFrame, self.writeCsv)]
+
+    def makeRowDict(self, benchmarkName, timeList):
+        data = self.syntheticHybseqData
+        sortedTimeList = sorted(timeList)
+        n = len(sortedTimeList)
+        if n % 2 == 1:
+            medianTime = sortedTimeList[n / 2]
+        else:
+            medianTime = 0.5 * (sortedTimeList[n / 2 - 1] + sortedTimeList[n / 2])
+        return {'benchmark': benchmarkName, 'numRepeats': n, 'minTime': sortedTimeList[0], 'medianTime': medianTime, 'meanTime': sum(timeList) / float(n), 'numGenes': data.numGenes, 'numOrganisms': data.numOrganisms, 'geneLength': data.geneLength, 'readLength': data.readLength, 'depth': data.depth, 'divergence': data.divergence, 'seed': data.seed, 'version': getVersion()}
+
+    def run(self, benchmarkNameList=None):
+        """Run the benchmarks.
+
+@param benchmarkNameList: names of the benchmarks to run, C{None} to run all
+@type benchmarkNameList: C{list} of C{str}
+@return: a data frame with one row of timings (in seconds) per benchmark
+@rtype: C{paftol.tools.DataFrame}
+"""
+        self.tmpDirname = tempfile.mkdtemp(prefix='paftolbench')
+        try:
+            self.syntheticHybseqData.writeTargetsFasta(self.makeTmpPath('targets.fasta'))
+            self.syntheticHybseqData.writeFastq(self.makeTmpPath('fwd.fastq'), self.makeTmpPath('rev.fastq'))
+            self.samLineList = self.syntheticHybseqData.makeSamLineList()
+            resultDataFrame = paftol.tools.DataFrame(self.columnHeaderList)
+            for benchmark in self.makeBenchmarkList():
+                if benchmarkNameList is not None and benchmark.name not in benchmarkNameList:
+                    continue
+                logger.info('running benchmark %s', benchmark.name)
+                resultDataFrame.addRow(self.makeRowDict(benchmark.name, benchmark.run(self.numRepeats)))
+            return resultDataFrame
+        finally:
+            shutil.rmtree(self.tmpDirname)
+            self.tmpDirname = None
+
+
+def getVersion():
+    try:
+        import paftol.version
+        return paftol.version.__version__
+    except ImportError:
+        return None
+
+
+def readBenchmarkCsv(f):
+    csvDictReader = csv.DictReader(f)
+    dataFrame = paftol.tools.DataFrame(csvDictReader.fieldnames)
+    for rowDict in csvDictReader:
+        dataFrame.addRow(rowDict)
+    return dataFrame
+
+
+def makeBaselineKey(rowDict):
+    return tuple([rowDict['benchmark']] + [float(rowDict[parameterName]) for parameterName in SyntheticHybseqData.parameterNameList])
+
+
+def compareToBaseline(resultDataFrame, baselineDataFrame, regressionThreshold):
+    """Compare benchmark timings to a baseline.
+
+Timings are compared by their minimum, which is least affected by
+other load on the machine. Benchmarks are matched to baseline rows by
+their name and the parameters of the synthetic data, and a baseline
+containing a benchmark only with different data parameters is rejected.
+
+@param regressionThreshold: ratio of timings above which a benchmark is considered to have regressed
+@type regressionThreshold: C{float}
+@return: a data frame with columns C{benchmark}, C{minTime}, C{baselineMinTime}, C{relativeTime} and C{regression}
+@rtype: C{paftol.tools.DataFrame}
+"""
+    baselineMinTimeDict = {}
+    for rowDict in baselineDataFrame.rowDictList:
+        baselineMinTimeDict[makeBaselineKey(rowDict)] = float(rowDict['minTime'])
+    baselineBenchmarkNameSet = set([baselineKey[0] for baselineKey in baselineMinTimeDict])
+    comparisonDataFrame = paftol.tools.DataFrame(['benchmark', 'minTime', 'baselineMinTime', 'relativeTime', 'regression'])
+    for rowDict in resultDataFrame.rowDictList:
+        benchmarkName = rowDict['benchmark']
+        minTime = float(rowDict['minTime'])
+        baselineKey = makeBaselineKey(rowDict)
+        if baselineKey not in baselineMinTimeDict and benchmarkName in baselineBenchmarkNameSet:
+            raise StandardError, 'benchmark %s: baseline was run on synthetic data with different parameters' % benchmarkName
+        baselineMinTime = baselineMinTimeDict.get(baselineKey)
+        relativeTime = None
+        if baselineMinTime is not None and baselineMinTime > 0.0:
+            relativeTime = minTime / baselineMinTime
+        regression = relativeTime is not None and relativeTime > regressionThreshold
+        if regression:
+            logger.warning('benchmark %s: %f s, baseline %f s (%.2f times)', benchmarkName, minTime, baselineMinTime, relativeTime)
+        comparisonDataFrame.addRow({'benchmark': benchmarkName, 'minTime': minTime, 'baselineMinTime': baselineMinTime, 'relativeTime': relativeTime, 'regression': regression})
+    return comparisonDataFrame
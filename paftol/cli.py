@@ -3,6 +3,10 @@ import os           # Paul B. for os.getcwd()
 import re           # Paul B. added
 import argparse
 import logging
+import csv
+import tempfile
+import shutil
+import multiprocessing
 
 import Bio
 import Bio.SeqIO
@@ -13,6 +17,7 @@ import Bio.Phylo
 
 import paftol
 import paftol.database
+import paftol.benchmark
 
 
 logger = logging.getLogger(__name__)
@@ -48,6 +53,7 @@ def addOverlapAssemblerToParser(p):
     p.add_argument('--relIdentityThresholdReference', type=float, help='percent identity threshold for reference to read alignment')
     p.add_argument('--windowSizeReadOverlap', type=int, help='window size for read overlap alignment')
     p.add_argument('--relIdentityThresholdReadOverlap', type=float, help='percent identity threshold for read overlap alignment')
+    p.add_argument('--writeDebugFiles', action='store_true', help='write positioned reads and read overlap stats to the working directory')
     
     
 def addHybseqToParser(p):
@@ -55,13 +61,22 @@ def addHybseqToParser(p):
     p.add_argument('--allowInvalidBases', action='store_true', help='allow any symbol in reference sequence (e.g. IUPAC ambiguity but also entirely invalid ones)')
     p.add_argument('--strictOverlapFiltering', action='store_true', help='filter contigs so that no region of the reference target is covered by multiple (overlapping) contigs')
     p.add_argument('--maxNumReadsPerGene', type=int, help='maximal number of reads used for assembly (in development)')
+    p.add_argument('--capReadsDuringMapping', action='store_true', help='apply maxNumReadsPerGene while mapping, keeping only the longest reads, to bound memory use')
     p.add_argument('-f', '--forwardreads', help='forward reads (FASTQ)', required=True)
     p.add_argument('-r', '--reversereads', help='reverse reads (FASTQ), omit to use single end mode')
     p.add_argument('--exoneratePercentIdentityThreshold', type=float, help='percent identity threshold for reference to contig alignment')
     p.add_argument('--tgz', help='put temporary working directory into tgz')
+    p.add_argument('--tgzCompression', choices=['gz', 'bz2', 'none'], default='gz', help='compression of the working directory archive')
+    p.add_argument('--tgzCompressLevel', type=int, help='compression level (1 to 9) of the working directory archive')
+    p.add_argument('--tgzExclude', action='append', help='exclude files matching this pattern from the working directory archive (can be used multiple times)')
+    p.add_argument('--tgzInBackground', action='store_true', help='archive working directory in a background thread')
+    p.add_argument('--checkpointDir', help='save completed stages to this directory and resume from them when rerun with the same inputs')
+    p.add_argument('--fastqIndexDir', help='retrieve mapped reads using offset indexes of the FASTQ files kept in this directory (compressed FASTQ must be bgzipped)')
+    p.add_argument('--targetsCacheDir', help='cache parsed target sets in this directory, to speed up repeated runs with the same targets file')
     p.add_argument('targetsfile', nargs='?', help='target sequences (FASTA), default stdin')
     p.add_argument('outfile', nargs='?', help='output file (FASTA), default stdout')
     p.add_argument('--summaryCsv', help='write analysis stats in CSV format')
+    p.add_argument('--stageMetricsCsv', help='write run time and resource usage of analysis stages in CSV format')
 
 
 def addHybpiperToParser(p):
@@ -71,6 +86,8 @@ def addHybpiperToParser(p):
 
 def addTblastnRunnerToParser(p):
     addBlastRunnerToParser(p)
+    p.add_argument('--makeblastdbFromStdin', action='store_true', help='pipe reads converted to FASTA into makeblastdb instead of writing FASTA files')
+    p.add_argument('--readDatabaseStore', help='directory for keeping BLAST databases of reads for reuse by later runs on the same FASTQ files')
 
 
 def addBlastnRunnerToParser(p):
@@ -103,9 +120,16 @@ def argToOverlapAssemblerSerial(argNamespace):
     targetAssemblerOverlapSerial.windowSizeReadOverlap = requiredArg(argNamespace.windowSizeReadOverlap, 'windowSizeReadOverlap is required')
     targetAssemblerOverlapSerial.relIdentityThresholdReadOverlap = requiredArg(argNamespace.relIdentityThresholdReadOverlap, 'relIdentityThresholdReadOverlap is required')
     targetAssemblerOverlapSerial.semiglobalAlignmentRunner = paftol.tools.SemiglobalAlignmentRunner()
+    targetAssemblerOverlapSerial.writeDebugFiles = argNamespace.writeDebugFiles
     return targetAssemblerOverlapSerial
 
 
+def setTgzOptions(hybseqAnalyser, argNamespace):
+    compression = None if argNamespace.tgzCompression == 'none' else argNamespace.tgzCompression
+    hybseqAnalyser.tgzArchiver = paftol.tools.TarArchiver(compression, argNamespace.tgzCompressLevel, argNamespace.tgzExclude)
+    hybseqAnalyser.tgzInBackground = argNamespace.tgzInBackground
+
+
 def argToTrimmomaticRunner(argNamespace):
     trimmomaticRunner = paftol.tools.TrimmomaticRunner()
     trimmomaticRunner.numThreads = argNamespace.trimmomaticNumThreads
@@ -147,11 +171,13 @@ def argToBlastRunnerParams(argNamespace, blastRunner):
 def argToTblastnRunner(argNamespace):
     tblastnRunner = paftol.tools.TblastnRunner()
     argToBlastRunnerParams(argNamespace, tblastnRunner)
+    tblastnRunner.pipeFastaToMakeblastdb = argNamespace.makeblastdbFromStdin
+    tblastnRunner.databaseStoreDirname = argNamespace.readDatabaseStore
     return tblastnRunner
 
 
 def checkAbsenceOfTblastnOptions(argNamespace, msg):
-    checkAbsenceOfOptions(['bastNumThreads', 'blastGapOpen', 'blastGapExtend', 'blastEvalue', 'blastWindowSize'], argNamespace, msg)
+    checkAbsenceOfOptions(['blastNumThreads', 'blastGapOpen', 'blastGapExtend', 'blastEvalue', 'blastWindowSize'], argNamespace, msg)
 
 
 def argToBlastnRunner(argNamespace):
@@ -161,7 +187,7 @@ def argToBlastnRunner(argNamespace):
 
 
 def checkAbsenceOfTblastnOptions(argNamespace, msg):
-    checkAbsenceOfOptions(['bastNumThreads', 'blastGapOpen', 'blastGapExtend', 'blastEvalue', 'blastWindowSize'], argNamespace, msg)
+    checkAbsenceOfOptions(['blastNumThreads', 'blastGapOpen', 'blastGapExtend', 'blastEvalue', 'blastWindowSize'], argNamespace, msg)
 
 
 def argToSpadesRunner(argNamespace):
@@ -202,6 +228,11 @@ like approach, unsing BWA for mapping reads to targets.
         spadesRunner.covCutoff = 8
         logger.warning('SPAdes coverage cutoff not specified, set to %d for backwards compatibility', spadesRunner.covCutoff)
     hybpiperBwaAnalyser = paftol.HybpiperBwaAnalyser(argNamespace.tgz, bwaRunner=bwaRunner, spadesRunner=spadesRunner)
+    setTgzOptions(hybpiperBwaAnalyser, argNamespace)
+    hybpiperBwaAnalyser.checkpointDirname = argNamespace.checkpointDir
+    hybpiperBwaAnalyser.capReadsDuringMapping = argNamespace.capReadsDuringMapping
+    hybpiperBwaAnalyser.fastqIndexDirname = argNamespace.fastqIndexDir
+    hybpiperBwaAnalyser.targetsCacheDirname = argNamespace.targetsCacheDir
     # hybpiperBwaAnalyser.keepTmpDir = True
     targetsfile = sys.stdin if argNamespace.targetsfile is None else argNamespace.targetsfile
     hybpiperResult = hybpiperBwaAnalyser.analyse(targetsFile, argNamespace.forwardreads, argNamespace.reversereads, argNamespace.allowInvalidBases, argNamespace.strictOverlapFiltering, argNamespace.maxNumReadsPerGene)
@@ -213,6 +244,10 @@ like approach, unsing BWA for mapping reads to targets.
         summaryStats = hybpiperResult.summaryStats()
         with open(argNamespace.summaryCsv, 'w') as f:
             summaryStats.writeCsv(f)
+    if argNamespace.stageMetricsCsv is not None:
+        with open(argNamespace.stageMetricsCsv, 'w') as f:
+            hybpiperResult.stageMetricsDataFrame(argNamespace.forwardreads).writeCsv(f)
+    hybpiperBwaAnalyser.waitForTgz()
 
 
 def runHybpiperTblastn(argNamespace):
@@ -227,6 +262,11 @@ like approach, unsing tblastn for mapping reads to targets.
         spadesRunner.covCutoff = 8
         logger.warning('SPAdes coverage cutoff not specified, set to %d for backwards compatibility', spadesRunner.covCutoff)
     hybpiperTblastnAnalyser = paftol.HybpiperTblastnAnalyser(argNamespace.tgz, tblastnRunner=tblastnRunner, spadesRunner=spadesRunner)
+    setTgzOptions(hybpiperTblastnAnalyser, argNamespace)
+    hybpiperTblastnAnalyser.checkpointDirname = argNamespace.checkpointDir
+    hybpiperTblastnAnalyser.capReadsDuringMapping = argNamespace.capReadsDuringMapping
+    hybpiperTblastnAnalyser.fastqIndexDirname = argNamespace.fastqIndexDir
+    hybpiperTblastnAnalyser.targetsCacheDirname = argNamespace.targetsCacheDir
     targetsfile = sys.stdin if argNamespace.targetsfile is None else argNamespace.targetsfile
     hybpiperResult = hybpiperTblastnAnalyser.analyse(targetsfile, argNamespace.forwardreads, argNamespace.reversereads, argNamespace.allowInvalidBases, argNamespace.strictOverlapFiltering, argNamespace.maxNumReadsPerGene)
     if argNamespace.outfile is not None:
@@ -237,11 +277,13 @@ like approach, unsing tblastn for mapping reads to targets.
         summaryStats = hybpiperResult.summaryStats()
         with open(argNamespace.summaryCsv, 'w') as f:
             summaryStats.writeCsv(f)
+    if argNamespace.stageMetricsCsv is not None:
+        with open(argNamespace.stageMetricsCsv, 'w') as f:
+            hybpiperResult.stageMetricsDataFrame(argNamespace.forwardreads).writeCsv(f)
+    hybpiperTblastnAnalyser.waitForTgz()
 
 
-def runTargetRecovery(argNamespace):
-    if argNamespace.usePaftolDb:
-        paftol.database.preRecoveryCheck(argNamespace.forwardreads, argNamespace.reversereads)
+def argToTargetRecoverer(argNamespace, workdirTgz):
     trimmomaticRunner = None
     if argNamespace.trimmer == 'trimmomatic':
         trimmomaticRunner = argToTrimmomaticRunner(argNamespace)
@@ -262,7 +304,23 @@ def runTargetRecovery(argNamespace):
         raise StandardError, 'spades assembly not yet refactored'
     elif argNamespace.assembler == 'overlapSerial':
         targetAssembler = argToOverlapAssemblerSerial(argNamespace)
-    targetRecoverer = paftol.TargetRecoverer(argNamespace.tgz, 'targetrecover', trimmomaticRunner=trimmomaticRunner, targetMapper=targetMapper, targetAssembler=targetAssembler)
+    targetRecoverer = paftol.TargetRecoverer(workdirTgz, 'targetrecover', trimmomaticRunner=trimmomaticRunner, targetMapper=targetMapper, targetAssembler=targetAssembler)
+    setTgzOptions(targetRecoverer, argNamespace)
+    targetRecoverer.capReadsDuringMapping = argNamespace.capReadsDuringMapping
+    if argNamespace.streamTrimmedReads:
+        if trimmomaticRunner is None or not targetMapper.canMapInterleavedReads():
+            raise StandardError, '--streamTrimmedReads requires "--trimmer trimmomatic" and "--mapper bwa"'
+        targetRecoverer.streamTrimmedReads = True
+    return targetRecoverer
+
+
+def runTargetRecovery(argNamespace):
+    if argNamespace.usePaftolDb:
+        paftol.database.preRecoveryCheck(argNamespace.forwardreads, argNamespace.reversereads)
+    targetRecoverer = argToTargetRecoverer(argNamespace, argNamespace.tgz)
+    targetRecoverer.checkpointDirname = argNamespace.checkpointDir
+    targetRecoverer.fastqIndexDirname = argNamespace.fastqIndexDir
+    targetRecoverer.targetsCacheDirname = argNamespace.targetsCacheDir
     targetsfile = sys.stdin if argNamespace.targetsfile is None else argNamespace.targetsfile
     result = targetRecoverer.recoverTargets(targetsfile, argNamespace.forwardreads, argNamespace.reversereads, argNamespace.allowInvalidBases, argNamespace.strictOverlapFiltering, argNamespace.maxNumReadsPerGene)
     result.cmdLine = argNamespace.rawCmdLine
@@ -279,6 +337,9 @@ def runTargetRecovery(argNamespace):
         summaryStats = result.summaryStats()
         with open(argNamespace.summaryCsv, 'w') as f:
             summaryStats.writeCsv(f)
+    if argNamespace.stageMetricsCsv is not None:
+        with open(argNamespace.stageMetricsCsv, 'w') as f:
+            result.stageMetricsDataFrame(argNamespace.forwardreads).writeCsv(f)
     if argNamespace.usePaftolDb:
         # Paul B. - getting the path to the result.reconstructedCdsFastaFname file for upload into the database:
         pwd = os.getcwd()
@@ -289,7 +350,149 @@ def runTargetRecovery(argNamespace):
         print 'fastaFilePath: ', fastaFilePath
         result.reconstructedCdsFastaFnamePath = fastaFilePath
         paftol.database.addRecoveryResult(result)
-    
+    targetRecoverer.waitForTgz()
+
+
+# state of recoverSeqsBatch worker processes, set up by initRecoverSeqsBatchWorker
+recoverSeqsBatchArgNamespace = None
+recoverSeqsBatchTargetSet = None
+recoverSeqsBatchReferenceFname = None
+
+
+def initRecoverSeqsBatchWorker(argNamespace, paftolTargetSet, referenceFname):
+    global recoverSeqsBatchArgNamespace, recoverSeqsBatchTargetSet, recoverSeqsBatchReferenceFname
+    recoverSeqsBatchArgNamespace = argNamespace
+    recoverSeqsBatchTargetSet = paftolTargetSet
+    recoverSeqsBatchReferenceFname = referenceFname
+
+
+def recoverSeqsBatchSample(sampleDict):
+    """Recover targets for one sample of a batch, in a worker process.
+
+@return: a tuple consisting of the sample name, the number of recovered CDSs and an error message (C{None} upon success)
+@rtype: C{tuple}
+"""
+    sampleName = sampleDict['sampleName']
+    try:
+        targetRecoverer = argToTargetRecoverer(recoverSeqsBatchArgNamespace, sampleDict['tgz'])
+        targetRecoverer.targetMapper.referenceFname = recoverSeqsBatchReferenceFname
+        targetRecoverer.checkpointDirname = sampleDict['checkpointDir']
+        targetRecoverer.fastqIndexDirname = recoverSeqsBatchArgNamespace.fastqIndexDir
+        result = targetRecoverer.recoverTargetsFromTargetSet(recoverSeqsBatchTargetSet.copyTargets(), sampleDict['forwardreads'], sampleDict['reversereads'], recoverSeqsBatchArgNamespace.strictOverlapFiltering, recoverSeqsBatchArgNamespace.maxNumReadsPerGene)
+        result.cmdLine = recoverSeqsBatchArgNamespace.rawCmdLine
+        reconstructedCdsList = [sr for sr in result.reconstructedCdsDict.values() if sr is not None]
+        Bio.SeqIO.write(reconstructedCdsList, sampleDict['outfile'], 'fasta')
+        if sampleDict['contigFname'] is not None:
+            result.writeContigFastaFile(sampleDict['contigFname'])
+        if sampleDict['summaryCsv'] is not None:
+            summaryStats = result.summaryStats()
+            with open(sampleDict['summaryCsv'], 'w') as f:
+                summaryStats.writeCsv(f)
+        if sampleDict['stageMetricsCsv'] is not None:
+            with open(sampleDict['stageMetricsCsv'], 'w') as f:
+                result.stageMetricsDataFrame(sampleName).writeCsv(f)
+        targetRecoverer.waitForTgz()
+        return sampleName, len(reconstructedCdsList), None
+    except StandardError as e:
+        logger.error('sample %s: %s', sampleName, str(e))
+        return sampleName, None, str(e)
+
+
+def readRecoverSeqsManifest(manifestFname):
+    """Read a CSV manifest of samples for C{recoverSeqsBatch}.
+
+Columns C{forwardreads} and C{outfile} are required, C{sampleName},
+C{reversereads}, C{contigFname}, C{summaryCsv}, C{stageMetricsCsv}, C{tgz}
+and C{checkpointDir} are optional.
+Empty fields are taken as C{None}.
+"""
+    optionalColumnList = ['sampleName', 'reversereads', 'contigFname', 'summaryCsv', 'stageMetricsCsv', 'tgz', 'checkpointDir']
+    sampleDictList = []
+    with open(manifestFname, 'r') as f:
+        for row in csv.DictReader(f):
+            sampleDict = {}
+            for columnName in ['forwardreads', 'outfile']:
+                if row.get(columnName, '') in ['', None]:
+                    raise StandardError, 'manifest %s: no %s in row %d' % (manifestFname, columnName, len(sampleDictList) + 1)
+                sampleDict[columnName] = row[columnName]
+            for columnName in optionalColumnList:
+                sampleDict[columnName] = None if row.get(columnName, '') in ['', None] else row[columnName]
+            if sampleDict['sampleName'] is None:
+                sampleDict['sampleName'] = sampleDict['forwardreads']
+            sampleDictList.append(sampleDict)
+    return sampleDictList
+
+
+def findNumConcurrentThreadsPerSample(argNamespace):
+    """Find the number of threads that external tools use at the same time for one sample.
+
+Tools normally run one after another, so this is the largest number of
+threads of any of them. With C{--streamTrimmedReads}, trimmomatic and
+bwa run at the same time, so their threads add up.
+"""
+    mapperNumThreads = argNamespace.blastNumThreads if argNamespace.mapper == 'tblastn' else argNamespace.bwaNumThreads
+    if mapperNumThreads is None:
+        mapperNumThreads = 1
+    trimmerNumThreads = 0
+    if argNamespace.trimmer == 'trimmomatic':
+        trimmerNumThreads = 1 if argNamespace.trimmomaticNumThreads is None else argNamespace.trimmomaticNumThreads
+    if argNamespace.streamTrimmedReads:
+        return mapperNumThreads + trimmerNumThreads
+    return max(mapperNumThreads, trimmerNumThreads)
+
+
+def runTargetRecoveryBatch(argNamespace):
+    """Recover targets for multiple samples, reading targets and preparing the reference once.
+
+Samples are processed by a pool of worker processes. Each sample is
+given C{numThreadsPerSample} threads for external tools (unless set
+explicitly via their options), and as many samples are processed
+concurrently as fit into C{numCores}, taking into account tools that
+run at the same time (see L{findNumConcurrentThreadsPerSample}).
+"""
+    sampleDictList = readRecoverSeqsManifest(argNamespace.manifest)
+    numCores = argNamespace.numCores
+    if numCores is None:
+        numCores = multiprocessing.cpu_count()
+    numThreadsPerSample = argNamespace.numThreadsPerSample
+    threadOptNameList = ['blastNumThreads'] if argNamespace.mapper == 'tblastn' else ['bwaNumThreads']
+    if argNamespace.trimmer == 'trimmomatic':
+        threadOptNameList.append('trimmomaticNumThreads')
+    for optName in threadOptNameList:
+        if argNamespace.__dict__[optName] is None and numThreadsPerSample > 1:
+            argNamespace.__dict__[optName] = numThreadsPerSample
+    numWorkers = max(1, min(len(sampleDictList), numCores // findNumConcurrentThreadsPerSample(argNamespace)))
+    paftolTargetSet = paftol.PaftolTargetSet()
+    if argNamespace.targetsCacheDir is None:
+        paftolTargetSet.readFasta(argNamespace.targetsfile)
+        paftolTargetSet.sanityCheck(argNamespace.allowInvalidBases)
+    else:
+        paftolTargetSet.readFastaCached(argNamespace.targetsfile, argNamespace.targetsCacheDir, argNamespace.allowInvalidBases)
+    failedSampleList = []
+    referenceDirname = tempfile.mkdtemp(prefix='recoverbatch')
+    try:
+        targetMapper = argToTargetRecoverer(argNamespace, None).targetMapper
+        targetMapper.prepareReference(paftolTargetSet, os.path.join(referenceDirname, 'targets.fasta'))
+        logger.info('processing %d samples with %d workers', len(sampleDictList), numWorkers)
+        pool = multiprocessing.Pool(numWorkers, initRecoverSeqsBatchWorker, (argNamespace, paftolTargetSet, targetMapper.referenceFname))
+        try:
+            for sampleName, numRecoveredCds, errorMessage in pool.imap_unordered(recoverSeqsBatchSample, sampleDictList):
+                if errorMessage is None:
+                    logger.info('sample %s: recovered %d CDSs', sampleName, numRecoveredCds)
+                else:
+                    failedSampleList.append(sampleName)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        if paftol.keepTmp:
+            logger.warning('not removing temporary directory %s', referenceDirname)
+        else:
+            shutil.rmtree(referenceDirname)
+    if len(failedSampleList) > 0:
+        raise StandardError, 'target recovery failed for %d of %d samples: %s' % (len(failedSampleList), len(sampleDictList), ', '.join(failedSampleList))
+
 
 def runOverlapAnalysis(argNamespace):
     """Run an analysis using tblastn for mapping to targets and overlap based assembly for gene recovery.
@@ -297,10 +500,16 @@ def runOverlapAnalysis(argNamespace):
     """
     tblastnRunner = argToTblastnRunner(argNamespace)
     overlapAnalyser = paftol.OverlapAnalyser(argNamespace.tgz, tblastnRunner=tblastnRunner)
+    setTgzOptions(overlapAnalyser, argNamespace)
+    overlapAnalyser.checkpointDirname = argNamespace.checkpointDir
+    overlapAnalyser.capReadsDuringMapping = argNamespace.capReadsDuringMapping
+    overlapAnalyser.fastqIndexDirname = argNamespace.fastqIndexDir
+    overlapAnalyser.targetsCacheDirname = argNamespace.targetsCacheDir
     overlapAnalyser.windowSizeReference = argNamespace.windowSizeReference
     overlapAnalyser.relIdentityThresholdReference = argNamespace.relIdentityThresholdReference
     overlapAnalyser.windowSizeReadOverlap = argNamespace.windowSizeReadOverlap
     overlapAnalyser.relIdentityThresholdReadOverlap = argNamespace.relIdentityThresholdReadOverlap
+    overlapAnalyser.writeDebugFiles = argNamespace.writeDebugFiles
     targetsfile = sys.stdin if argNamespace.targetsfile is None else argNamespace.targetsfile
     result = overlapAnalyser.analyse(targetsfile, argNamespace.forwardreads, argNamespace.reversereads, argNamespace.allowInvalidBases, argNamespace.strictOverlapFiltering, argNamespace.maxNumReadsPerGene)
     if argNamespace.outfile is not None:
@@ -311,6 +520,10 @@ def runOverlapAnalysis(argNamespace):
         summaryStats = result.summaryStats()
         with open(argNamespace.summaryCsv, 'w') as f:
             summaryStats.writeCsv(f)
+    if argNamespace.stageMetricsCsv is not None:
+        with open(argNamespace.stageMetricsCsv, 'w') as f:
+            result.stageMetricsDataFrame(argNamespace.forwardreads).writeCsv(f)
+    overlapAnalyser.waitForTgz()
 
 
 def runRetrieveTargets(argNamespace):
@@ -354,7 +567,7 @@ def runGenomeReadScan(argNamespace):
     bwaRunner = argToBwaRunner(argNamespace)
     referenceGenome = paftol.ReferenceGenome(argNamespace.scanMethod, argNamespace.refFasta, argNamespace.refGenbank)
     referenceGenome.scanGenes(argNamespace.scanMethod)
-    statsTable, rawmapTable = referenceGenome.mapReadsStatsBwaMem(argNamespace.forwardreads, argNamespace.reversereads, bwaRunner=bwaRunner)
+    statsTable, rawmapTable = referenceGenome.mapReadsStatsBwaMem(bwaRunner, argNamespace.forwardreads, argNamespace.reversereads)
     if argNamespace.rawmapTable is not None:
         with open(argNamespace.rawmapTable, 'w') as csvFile:
             rawmapTable.writeCsv(csvFile)
@@ -403,8 +616,24 @@ def runSelectgenes(argNamespace):
 def runNeedleComparison(argNamespace):
     sr1Dict = Bio.SeqIO.to_dict(Bio.SeqIO.parse(argNamespace.seqfile1, 'fasta'))
     sr2Dict = Bio.SeqIO.to_dict(Bio.SeqIO.parse(argNamespace.seqfile2, 'fasta'))
-    needleRunner = paftol.tools.NeedleRunner()
-    cmpStats = paftol.tools.pairwiseAlignmentStats(sr1Dict, sr2Dict, needleRunner)
+    if argNamespace.aligner == 'needle':
+        alignmentRunner = paftol.tools.NeedleRunner()
+    elif argNamespace.aligner == 'water':
+        alignmentRunner = paftol.tools.WaterRunner()
+    elif argNamespace.aligner == 'global':
+        alignmentRunner = paftol.tools.GlobalAlignmentRunner()
+    elif argNamespace.aligner == 'local':
+        alignmentRunner = paftol.tools.LocalAlignmentRunner()
+    else:
+        raise StandardError, 'unknown aligner: %s' % argNamespace.aligner
+    if argNamespace.numWorkers is not None:
+        if argNamespace.outfile is None:
+            paftol.tools.writePairwiseAlignmentStatsCsv(sr1Dict, sr2Dict, alignmentRunner, sys.stdout, argNamespace.numWorkers, argNamespace.maxNumPending)
+        else:
+            with open(argNamespace.outfile, 'w') as csvFile:
+                paftol.tools.writePairwiseAlignmentStatsCsv(sr1Dict, sr2Dict, alignmentRunner, csvFile, argNamespace.numWorkers, argNamespace.maxNumPending)
+        return
+    cmpStats = paftol.tools.pairwiseAlignmentStats(sr1Dict, sr2Dict, alignmentRunner)
     if argNamespace.outfile is None:
         cmpStats.writeCsv(sys.stdout)
     else:
@@ -436,7 +665,7 @@ def runGeneSetStats(argNamespace):
 def runExonerateStarAlignment(argNamespace):
     reference = Bio.SeqIO.read(argNamespace.reference, 'fasta')
     fastaFname = argNamespace.seqfile
-    exonerateStarAlignment = paftol.tools.ExonerateStarAlignment(reference, fastaFname)
+    exonerateStarAlignment = paftol.tools.ExonerateStarAlignment(reference, fastaFname, argNamespace.numJobs)
     if argNamespace.epsfname is not None:
         with open(argNamespace.epsfname,  'w') as epsfile:
             exonerateStarAlignment.epsSketch(epsfile)
@@ -562,6 +791,7 @@ def addRecoverParser(subparsers):
     p = subparsers.add_parser('recoverSeqs', help='recover target sequences from HybSeq NGS files')
     addHybseqToParser(p)
     p.add_argument('--trimmer', choices=['trimmomatic'], help='method for trimming reads')
+    p.add_argument('--streamTrimmedReads', action='store_true', help='map trimmed reads while trimming is in progress, without writing trimmed paired read files (requires paired reads and bwa mapping; no FastQC stats are computed for trimmed paired reads, so they are missing from summaries and the database)')
     p.add_argument('--mapper', choices=['tblastn', 'bwa'], help='method to be used for mapping reads to target genes', required=True)
     p.add_argument('--assembler', choices=['spades', 'overlapSerial'], help='method to be used to assemble reads mapped to a gene into contigs', required=True)
     p.add_argument('--contigFname', help='filename for contigs')
@@ -572,6 +802,33 @@ def addRecoverParser(subparsers):
     addOverlapAssemblerToParser(p)
     p.set_defaults(func=runTargetRecovery)
 
+
+def addRecoverBatchParser(subparsers):
+    p = subparsers.add_parser('recoverSeqsBatch', help='recover target sequences for multiple samples listed in a manifest')
+    p.add_argument('--allowInvalidBases', action='store_true', help='allow any symbol in reference sequence (e.g. IUPAC ambiguity but also entirely invalid ones)')
+    p.add_argument('--strictOverlapFiltering', action='store_true', help='filter contigs so that no region of the reference target is covered by multiple (overlapping) contigs')
+    p.add_argument('--maxNumReadsPerGene', type=int, help='maximal number of reads used for assembly (in development)')
+    p.add_argument('--capReadsDuringMapping', action='store_true', help='apply maxNumReadsPerGene while mapping, keeping only the longest reads, to bound memory use')
+    p.add_argument('--tgzCompression', choices=['gz', 'bz2', 'none'], default='gz', help='compression of the working directory archives')
+    p.add_argument('--tgzCompressLevel', type=int, help='compression level (1 to 9) of the working directory archives')
+    p.add_argument('--tgzExclude', action='append', help='exclude files matching this pattern from the working directory archives (can be used multiple times)')
+    p.add_argument('--tgzInBackground', action='store_true', help='archive working directories in background threads')
+    p.add_argument('--trimmer', choices=['trimmomatic'], help='method for trimming reads')
+    p.add_argument('--streamTrimmedReads', action='store_true', help='map trimmed reads while trimming is in progress, without writing trimmed paired read files (requires paired reads and bwa mapping; no FastQC stats are computed for trimmed paired reads, so they are missing from summaries and the database)')
+    p.add_argument('--mapper', choices=['tblastn', 'bwa'], help='method to be used for mapping reads to target genes', required=True)
+    p.add_argument('--assembler', choices=['spades', 'overlapSerial'], help='method to be used to assemble reads mapped to a gene into contigs', required=True)
+    p.add_argument('--numCores', type=int, help='total number of cores to use, default all')
+    p.add_argument('--numThreadsPerSample', type=int, default=1, help='number of threads for external tools per sample')
+    p.add_argument('--fastqIndexDir', help='retrieve mapped reads using offset indexes of the FASTQ files kept in this directory (compressed FASTQ must be bgzipped)')
+    p.add_argument('--targetsCacheDir', help='cache parsed target sets in this directory, to speed up repeated runs with the same targets file')
+    addTrimmomaticRunnerToParser(p)
+    addTblastnRunnerToParser(p)
+    addBwaRunnerToParser(p)
+    addOverlapAssemblerToParser(p)
+    p.add_argument('targetsfile', help='target sequences (FASTA)')
+    p.add_argument('manifest', help='samples (CSV with columns forwardreads, outfile and optionally sampleName, reversereads, contigFname, summaryCsv, stageMetricsCsv, tgz, checkpointDir)')
+    p.set_defaults(func=runTargetRecoveryBatch)
+
     
 def addTargetGeneScanParser(subparsers):
     p = subparsers.add_parser('genescan', help='identify PAFTOL genes within a reference genome')
@@ -628,6 +885,9 @@ def addSelectgenesParser(subparsers):
 
 def addNeedleComparisonParser(subparsers):
     p = subparsers.add_parser('needlecmp', help='compare two sets of sequences by pairwise alignment using EMBOSS needle')
+    p.add_argument('--aligner', choices=['needle', 'water', 'global', 'local'], default='needle', help='pairwise aligner: EMBOSS needle or water, or in process global or local alignment (default needle)')
+    p.add_argument('--numWorkers', type=int, help='align in parallel using this number of worker threads, writing rows as they complete')
+    p.add_argument('--maxNumPending', type=int, help='maximal number of sequence pairs in flight in parallel mode (default 4 * numWorkers)')
     p.add_argument('seqfile1', help='sequence file 1 (required)')
     p.add_argument('seqfile2', help='sequence file 2 (required)')
     p.add_argument('outfile', nargs='?', help='output file (CSV), default stdout')
@@ -649,6 +909,7 @@ def addExonerateStarAlignmentParser(subparsers):
     p.add_argument('seqfile', help='further sequences for constructing the star alignment (required)')
     p.add_argument('outfile', nargs='?', help='output file, default stdout')
     p.add_argument('--epsfname', help='sketch (encapsulated postscript)')
+    p.add_argument('--numJobs', type=int, default=1, help='number of exonerate processes to run in parallel on partitions of seqfile')
     p.set_defaults(func=runExonerateStarAlignment)
     
     
@@ -711,6 +972,41 @@ def addAddExternalAccessionParser(subparsers):
     p.set_defaults(func=runAddExternalAccession)
 
     
+def runBenchmark(argNamespace):
+    syntheticHybseqData = paftol.benchmark.SyntheticHybseqData(argNamespace.numGenes, argNamespace.numOrganisms, argNamespace.geneLength, argNamespace.readLength, argNamespace.depth, argNamespace.divergence, argNamespace.seed)
+    benchmarkSuite = paftol.benchmark.BenchmarkSuite(syntheticHybseqData, argNamespace.numRepeats)
+    resultDataFrame = benchmarkSuite.run(argNamespace.benchmark)
+    if argNamespace.outfile is None:
+        resultDataFrame.writeCsv(sys.stdout)
+    else:
+        with open(argNamespace.outfile, 'w') as f:
+            resultDataFrame.writeCsv(f)
+    if argNamespace.baselineCsv is not None:
+        with open(argNamespace.baselineCsv, 'r') as f:
+            baselineDataFrame = paftol.benchmark.readBenchmarkCsv(f)
+        comparisonDataFrame = paftol.benchmark.compareToBaseline(resultDataFrame, baselineDataFrame, argNamespace.regressionThreshold)
+        comparisonDataFrame.writeCsv(sys.stderr)
+        if any(comparisonDataFrame.getColumn('regression')):
+            raise StandardError, 'performance regression relative to baseline %s' % argNamespace.baselineCsv
+
+
+def addBenchmarkParser(subparsers):
+    p = subparsers.add_parser('benchmark', help='time performance critical functions on synthetic data')
+    p.add_argument('--numGenes', type=int, default=10, help='number of synthetic genes')
+    p.add_argument('--numOrganisms', type=int, default=3, help='number of organisms with targets for each gene')
+    p.add_argument('--geneLength', type=int, default=900, help='length of synthetic genes')
+    p.add_argument('--readLength', type=int, default=150, help='length of synthetic reads')
+    p.add_argument('--depth', type=int, default=20, help='read depth over genes')
+    p.add_argument('--divergence', type=float, default=0.05, help='substitution rate of targets and sample relative to ancestral genes')
+    p.add_argument('--seed', type=int, default=1, help='random seed for synthetic data')
+    p.add_argument('--numRepeats', type=int, default=5, help='number of runs of each benchmark')
+    p.add_argument('--benchmark', action='append', help='run this benchmark only (can be used multiple times)')
+    p.add_argument('--baselineCsv', help='benchmark results (CSV) to compare to')
+    p.add_argument('--regressionThreshold', type=float, default=1.2, help='ratio of minimum times above which a benchmark is reported as regressed')
+    p.add_argument('outfile', nargs='?', help='output file (CSV), default stdout')
+    p.set_defaults(func=runBenchmark)
+
+
 def showArgs(args):
     sys.stderr.write('%s\n' % str(args))
 
@@ -728,6 +1024,7 @@ def paftoolsMain():
     addHybpiperTblastnParser(subparsers)
     addOverlapAnalyserParser(subparsers)
     addRecoverParser(subparsers)
+    addRecoverBatchParser(subparsers)
     addTargetGeneScanParser(subparsers)
     addGenomeReadScanParser(subparsers)
     addExtractCdsListParser(subparsers)
@@ -744,6 +1041,7 @@ def paftoolsMain():
     addGeneFastaParser(subparsers)
     addDelgeneNewickParser(subparsers)
     addAddExternalAccessionParser(subparsers)
+    addBenchmarkParser(subparsers)
     args = p.parse_args()
     args.rawCmdLine = ' '.join(['%s' % arg for arg in sys.argv])
     if args.loglevel is not None:
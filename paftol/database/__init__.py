@@ -340,8 +340,7 @@ def insertFastaFile(connection, fastaFname, dirname=None):
     fastaPath = fastaFname
     if dirname is not None:
         fastaPath = os.path.join(dirname, fastaFname)
-    md5 = paftol.tools.md5HexdigestFromFile(fastaPath)
-    numSequences = len(paftol.tools.fastaSeqRecordList(fastaPath))
+    md5, fileSize, numSequences = paftol.tools.md5HexdigestAndStatsFromFile(fastaPath, 'fasta')
     lockCursor = connection.cursor()
     lockCursor.execute('LOCK TABLE FastaFile WRITE')
     try:
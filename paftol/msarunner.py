@@ -7,6 +7,11 @@ import unittest
 import Bio.AlignIO
 import logging
 import os
+import copy
+import threading
+import Queue
+import StringIO
+import multiprocessing
 
 logger = logging.getLogger(__name__)
 
@@ -24,30 +29,20 @@ This is a base class for runners that wrap specific MSA programs.
 
     def align(self, seqRecordList):
         #raise StandardError, 'abstract method'
+        # communicate rather than forking a writer so alignments can be run from multiple threads
+        fastaFile = StringIO.StringIO()
+        Bio.SeqIO.write(seqRecordList, fastaFile, 'fasta')
         p = self.makeSubprocess()
-        pid = os.fork()
-        if pid == 0:
-            p.stdout.close()
-            Bio.SeqIO.write(seqRecordList, p.stdin, 'fasta')
-            p.stdin.close()
-            os._exit(0)
-        p.stdin.close()
-        alignment = Bio.AlignIO.read(p.stdout, 'fasta')
-        p.stdout.close()
-        wPid, wExit = os.waitpid(pid, 0)
-        if pid != wPid:
-            raise StandardError, 'wait returned pid %s (expected %d)' % (wPid, pid)
-        if wExit != 0:
-            raise StandardError, 'wait on forked process returned %d' % wExit
-        returncode = p.wait()
-        if returncode != 0:
-            raise StandardError, 'process "%s" returned %d' % (' '.join(argv), returncode)
+        alignmentStr, errStr = p.communicate(fastaFile.getvalue())
+        if p.returncode != 0:
+            raise StandardError, 'process "%s" returned %d' % (' '.join(self.makeArgv()), p.returncode)
+        alignment = Bio.AlignIO.read(StringIO.StringIO(alignmentStr), 'fasta')
         return alignment
 
     def makeSubprocess(self):
         argv = self.makeArgv()
         logger.debug('%s', ' '.join(argv))
-        p = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+        p = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, close_fds=True)
         return p
 
 
@@ -56,9 +51,12 @@ class MafftRunner(MultipleSequenceAlignmentRunner):
     def __init__(self):
         self.localpair = None
         self.maxiterate = None
+        self.numThreads = None
 
     def makeArgv(self):
         argv = ['mafft', '--quiet']
+        if self.numThreads is not None:
+            argv.extend(['--thread', '%d' % self.numThreads])
         if self.localpair is not None:
             argv.append('--localpair')
         if self.maxiterate is not None:
@@ -72,8 +70,89 @@ class MafftRunner(MultipleSequenceAlignmentRunner):
 class ClustaloRunner(MultipleSequenceAlignmentRunner):
 
     def __init__(self):
-        pass
+        self.numThreads = None
 
     def makeArgv(self):
         argv = ['clustalo', '-i', '-']
+        if self.numThreads is not None:
+            argv.append('--threads=%d' % self.numThreads)
         return argv
+
+
+class MultipleSequenceAlignmentPool(object):
+
+    """Run many independent multiple sequence alignment jobs (e.g. one per gene) concurrently.
+
+Each job is run by a copy of C{msaRunner} with its C{numThreads}
+attribute set to C{numThreadsPerJob}. The number of concurrent jobs is
+chosen so that the total number of threads does not exceed C{numCores}.
+
+@ivar msaRunner: runner used as a template for the jobs' runners
+@type msaRunner: L{MultipleSequenceAlignmentRunner}
+@ivar numCores: global core budget, defaults to the number of CPUs
+@type numCores: C{int}
+@ivar numThreadsPerJob: number of threads per alignment job
+@type numThreadsPerJob: C{int}
+"""
+
+    def __init__(self, msaRunner, numCores=None, numThreadsPerJob=1):
+        self.msaRunner = msaRunner
+        if numCores is None:
+            numCores = multiprocessing.cpu_count()
+        self.numCores = numCores
+        self.numThreadsPerJob = numThreadsPerJob
+
+    def getNumConcurrentJobs(self):
+        return max(1, self.numCores // self.numThreadsPerJob)
+
+    def makeJobRunner(self):
+        jobRunner = copy.copy(self.msaRunner)
+        jobRunner.numThreads = self.numThreadsPerJob
+        return jobRunner
+
+    def runJob(self, jobId, seqRecordList, resultQueue):
+        try:
+            alignment = self.makeJobRunner().align(seqRecordList)
+            resultQueue.put((jobId, alignment, None))
+        except StandardError as e:
+            resultQueue.put((jobId, None, e))
+
+    def alignJobs(self, jobIterable):
+        """Align jobs and generate the alignments in the order in which they are completed.
+
+If a job fails, the jobs still running are waited for and no further
+jobs are started.
+
+@param jobIterable: iterable of tuples consisting of a job id and a list of sequence records to align
+@return: generator of tuples consisting of the job id and the alignment
+"""
+        resultQueue = Queue.Queue()
+        jobIterator = iter(jobIterable)
+        numConcurrentJobs = self.getNumConcurrentJobs()
+        numRunningJobs = 0
+        hasMoreJobs = True
+        try:
+            while True:
+                while hasMoreJobs and numRunningJobs < numConcurrentJobs:
+                    try:
+                        jobId, seqRecordList = jobIterator.next()
+                    except StopIteration:
+                        hasMoreJobs = False
+                        break
+                    logger.debug('starting alignment job %s', str(jobId))
+                    jobThread = threading.Thread(target=self.runJob, args=(jobId, seqRecordList, resultQueue), name='msa-%s' % str(jobId))
+                    jobThread.daemon = True
+                    jobThread.start()
+                    numRunningJobs = numRunningJobs + 1
+                if numRunningJobs == 0:
+                    break
+                jobId, alignment, e = resultQueue.get()
+                numRunningJobs = numRunningJobs - 1
+                if e is not None:
+                    raise StandardError, 'alignment job %s failed: %s' % (str(jobId), str(e))
+                yield jobId, alignment
+        finally:
+            # on failure or when the generator is closed, wait for running jobs rather than abandoning their processes
+            while numRunningJobs > 0:
+                resultQueue.get()
+                numRunningJobs = numRunningJobs - 1
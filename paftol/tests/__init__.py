@@ -1,13 +1,25 @@
 import sys
+import os
 import unittest
 import copy
+import tempfile
+import shutil
+import StringIO
+import gzip
+import glob
+import threading
+import argparse
 
 import Bio
 import Bio.Seq
 import Bio.SeqRecord
+import Bio.SeqIO
+import Bio.bgzf
 
 import paftol
 import paftol.tools
+import paftol.benchmark
+import paftol.cli
 import paftol.database
 import paftol.database.analysis
 import paftol.database.production
@@ -27,6 +39,17 @@ class PaftolTestCase(unittest.TestCase):
     def setUp(self):
         self.seq0 = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('CGTGATACATTACTTTTTA'), id='seq0', description='x1a')
         self.seq1 = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('GTGGACTTGACGCGTCATGGAAAGTACAAGATACTTCGACCTGGCAGTGCAAG'), id='seq1', description='x1b')
+        self.tmpDirname = None
+
+    def tearDown(self):
+        if self.tmpDirname is not None:
+            shutil.rmtree(self.tmpDirname)
+
+    def makeTmpPath(self, fname):
+        """Make a path in a temporary directory that is removed after the test."""
+        if self.tmpDirname is None:
+            self.tmpDirname = tempfile.mkdtemp(prefix='paftoltest')
+        return os.path.join(self.tmpDirname, fname)
 
     def test_SemiglobalAlignmentRunner(self):
         semiglobalAlignmentRunner = paftol.tools.SemiglobalAlignmentRunner()
@@ -35,6 +58,402 @@ class PaftolTestCase(unittest.TestCase):
         self.assertEqual('------------CGTGA-------TACA--TTACTTTTTA-----------------', str(a[0].seq))
         self.assertEqual('GTGGACTTGACGCGTCATGGAAAGTACAAGATACTT----CGACCTGGCAGTGCAAG', str(a[1].seq))
 
+    def test_GlobalAlignmentRunner(self):
+        globalAlignmentRunner = paftol.tools.GlobalAlignmentRunner(penalizeEndGaps=True)
+        a = globalAlignmentRunner.align(self.seq0, [self.seq1])[0]
+        self.assertEqual(a[0].seq.alphabet.gap_char, '-')
+        self.assertEqual(str(self.seq0.seq), str(a[0].seq).replace('-', ''))
+        self.assertEqual(str(self.seq1.seq), str(a[1].seq).replace('-', ''))
+        statsFrame = paftol.tools.pairwiseAlignmentStats({'x': self.seq0}, {'x': self.seq1}, paftol.tools.GlobalAlignmentRunner())
+        self.assertEqual(len(self.seq0), statsFrame.rowDictList[0]['seqLength1'])
+
+    def test_LocalAlignmentRunner(self):
+        localAlignmentRunner = paftol.tools.LocalAlignmentRunner()
+        a = localAlignmentRunner.align(self.seq0, [self.seq1])[0]
+        self.assertTrue(str(a[0].seq).replace('-', '') in str(self.seq0.seq))
+        self.assertTrue(str(a[1].seq).replace('-', '') in str(self.seq1.seq))
+
+    def test_ReadView(self):
+        readView = paftol.tools.ReadView.fromSeqRecord(self.seq0, 'fwd')
+        self.assertEqual('seq0-fwd', readView.id)
+        self.assertEqual('CGTGATACATTACTTTTTA', str(readView.seq))
+        with self.assertRaises(AttributeError):
+            readView.offset = 3
+        positionedRead = paftol.tools.PositionedRead(readView, 3, 1.0, None, None)
+        self.assertEqual('pos: 3', positionedRead.readView.description)
+        self.assertIs(readView.seq, positionedRead.readView.seq)
+        self.assertIsNone(readView.offset)
+
+    def test_md5HexdigestAndStatsFromFile(self):
+        fastaStr = '>seq0\nCGTGA\nTACA\n>seq1\nGTGG\n>seq2\nAC\n'
+        fastaFname = self.makeTmpPath('seqs.fasta')
+        with open(fastaFname, 'w') as f:
+            f.write(fastaStr)
+        for blockSize in [1, 2, 5, 1048576]:
+            for useMmap in [False, True]:
+                md5Hex, fileSize, numRecords = paftol.tools.md5HexdigestAndStatsFromFile(fastaFname, 'fasta', blockSize, useMmap)
+                self.assertEqual(paftol.tools.md5HexDigest(fastaStr), md5Hex)
+                self.assertEqual(len(fastaStr), fileSize)
+                self.assertEqual(3, numRecords)
+                self.assertEqual(md5Hex, paftol.tools.md5HexdigestFromFile(fastaFname, blockSize, useMmap))
+
+    def test_fastqToFasta(self):
+        fastqStr = '@r0 1:N\nACGTACGTAC\n+\nIIIIIIIIII\n@r1/2\nGGA\n+r1/2\nI#I\n'
+        for compressed in [False, True]:
+            fastqFname = self.makeTmpPath('reads%d.fastq' % compressed)
+            fastaFname = self.makeTmpPath('reads%d.fasta' % compressed)
+            if compressed:
+                with gzip.open(fastqFname, 'wb') as f:
+                    f.write(fastqStr)
+            else:
+                with open(fastqFname, 'w') as f:
+                    f.write(fastqStr)
+            self.assertEqual(2, paftol.tools.fastqToFasta(fastqFname, fastaFname, 4))
+            self.assertEqual((2, 13), paftol.tools.countSeqRecordsAndBases(fastqFname, 'fastq'))
+            self.assertEqual((2, 13), paftol.tools.countSeqRecordsAndBases(fastaFname, 'fasta'))
+            srList = list(Bio.SeqIO.parse(fastaFname, 'fasta'))
+            self.assertEqual(['r0', 'r1/2'], [sr.id for sr in srList])
+            self.assertEqual('r0 1:N', srList[0].description)
+            self.assertEqual(['ACGTACGTAC', 'GGA'], [str(sr.seq) for sr in srList])
+
+    def test_findNumConcurrentThreadsPerSample(self):
+        argNamespace = argparse.Namespace(mapper='bwa', trimmer='trimmomatic', streamTrimmedReads=False, bwaNumThreads=4, blastNumThreads=None, trimmomaticNumThreads=4)
+        self.assertEqual(4, paftol.cli.findNumConcurrentThreadsPerSample(argNamespace))
+        argNamespace.streamTrimmedReads = True
+        self.assertEqual(8, paftol.cli.findNumConcurrentThreadsPerSample(argNamespace))
+        argNamespace.bwaNumThreads = None
+        self.assertEqual(5, paftol.cli.findNumConcurrentThreadsPerSample(argNamespace))
+        argNamespace = argparse.Namespace(mapper='tblastn', trimmer=None, streamTrimmedReads=False, bwaNumThreads=None, blastNumThreads=3, trimmomaticNumThreads=None)
+        self.assertEqual(3, paftol.cli.findNumConcurrentThreadsPerSample(argNamespace))
+
+    def test_readRecoverSeqsManifest(self):
+        manifestFname = self.makeTmpPath('manifest.csv')
+        with open(manifestFname, 'w') as f:
+            f.write('forwardreads,reversereads,outfile,tgz\n')
+            f.write('s0_R1.fastq,s0_R2.fastq,s0.fasta,s0.tgz\n')
+            f.write('s1_R1.fastq,,s1.fasta,\n')
+        sampleDictList = paftol.cli.readRecoverSeqsManifest(manifestFname)
+        self.assertEqual(2, len(sampleDictList))
+        self.assertEqual('s0_R1.fastq', sampleDictList[0]['sampleName'])
+        self.assertEqual('s0_R2.fastq', sampleDictList[0]['reversereads'])
+        self.assertEqual('s0.tgz', sampleDictList[0]['tgz'])
+        self.assertIsNone(sampleDictList[0]['checkpointDir'])
+        self.assertEqual('s1.fasta', sampleDictList[1]['outfile'])
+        self.assertIsNone(sampleDictList[1]['reversereads'])
+        self.assertIsNone(sampleDictList[1]['tgz'])
+        with open(manifestFname, 'w') as f:
+            f.write('sampleName,forwardreads\n')
+            f.write('s0,s0_R1.fastq\n')
+        with self.assertRaises(StandardError):
+            paftol.cli.readRecoverSeqsManifest(manifestFname)
+
+    def test_copyTargets(self):
+        paftolTargetSet = paftol.PaftolTargetSet()
+        paftolTargetSet.readFasta(StringIO.StringIO('>org0-gene0\nACGT\n>org1-gene0\nACGA\n>org0-gene1\nTTGA\n'))
+        paftolTargetSet.numOfftargetReads = 0
+        paftolTargetSet.processSamAlignment(paftol.tools.SamAlignment('r0\t0\torg0-gene0\t1\t60\t4M\t*\t0\t0\tACGT\tIIII'))
+        paftolTargetSetCopy = paftolTargetSet.copyTargets()
+        self.assertEqual(sorted(paftolTargetSet.organismDict.keys()), sorted(paftolTargetSetCopy.organismDict.keys()))
+        self.assertEqual(sorted(paftolTargetSet.paftolGeneDict.keys()), sorted(paftolTargetSetCopy.paftolGeneDict.keys()))
+        self.assertEqual(1, len(paftolTargetSet.organismDict['org0'].paftolTargetDict['gene0'].mappedReadList))
+        self.assertEqual([], paftolTargetSetCopy.organismDict['org0'].paftolTargetDict['gene0'].mappedReadList)
+        paftolTargetSetCopy.processSamAlignment(paftol.tools.SamAlignment('r1\t0\torg1-gene0\t1\t60\t4M\t*\t0\t0\tACGA\tIIII'))
+        self.assertEqual([], paftolTargetSet.organismDict['org1'].paftolTargetDict['gene0'].mappedReadList)
+        self.assertTrue(paftolTargetSet.organismDict['org0'].paftolTargetDict['gene1'].seqRecord is paftolTargetSetCopy.organismDict['org0'].paftolTargetDict['gene1'].seqRecord)
+
+    def test_checkpoint(self):
+        hybseqAnalyser = paftol.HybseqAnalyser()
+        self.assertIsNone(hybseqAnalyser.loadCheckpoint('distribute', 'd0'))
+        hybseqAnalyser.checkpointDirname = self.makeTmpPath('checkpoints')
+        self.assertIsNone(hybseqAnalyser.loadCheckpoint('distribute', 'd0'))
+        hybseqAnalyser.saveCheckpoint('distribute', 'd0', {'gene0': [1, 2]})
+        self.assertEqual({'gene0': [1, 2]}, hybseqAnalyser.loadCheckpoint('distribute', 'd0'))
+        self.assertIsNone(hybseqAnalyser.loadCheckpoint('distribute', 'd1'))
+        recoveredList = []
+        recoverGeneData = lambda: recoveredList.append('gene0') or 'cds0'
+        for i in xrange(2):
+            self.assertEqual('cds0', hybseqAnalyser.recoverGene('gene0', 'd0', recoverGeneData))
+        self.assertEqual(['gene0'], recoveredList)
+
+    def test_configurationStr(self):
+        targetMapper0 = paftol.TargetMapperBwa(paftol.tools.BwaRunner())
+        targetMapper1 = paftol.TargetMapperBwa(paftol.tools.BwaRunner())
+        targetMapper0.referenceFname = '/tmp/recoverbatch0/targets.fasta'
+        targetMapper1.referenceFname = '/tmp/recoverbatch1/targets.fasta'
+        self.assertEqual(paftol.configurationStr(targetMapper0), paftol.configurationStr(targetMapper1))
+        targetMapper1.bwaRunner.minSeedLength = 17
+        self.assertNotEqual(paftol.configurationStr(targetMapper0.bwaRunner), paftol.configurationStr(targetMapper1.bwaRunner))
+
+    def test_trimCheckpoint(self):
+        trimmomaticRunList = []
+        class StubTrimmomaticRunner(object):
+            def runTrimmomaticPaired(self, forwardFastq, reverseFastq, *trimmedFastqFnameList, **kwargs):
+                trimmomaticRunList.append(forwardFastq)
+                for trimmedFastqFname in trimmedFastqFnameList:
+                    with open(trimmedFastqFname, 'w') as f:
+                        f.write('@r0\nACGT\n+\nIIII\n')
+        targetRecoverer = paftol.TargetRecoverer(None, 'trimtest', trimmomaticRunner=StubTrimmomaticRunner())
+        targetRecoverer.checkpointDirname = self.makeTmpPath('checkpoints')
+        targetRecoverer.setupTmpdir()
+        try:
+            forwardFastq = self.makeTmpPath('fwd.fastq')
+            reverseFastq = self.makeTmpPath('rev.fastq')
+            for fastqFname in [forwardFastq, reverseFastq]:
+                with open(fastqFname, 'w') as f:
+                    f.write('@r0\nACGTA\n+\nIIIII\n')
+            for i in xrange(2):
+                result = paftol.HybpiperResult(paftol.PaftolTargetSet(), forwardFastq, reverseFastq)
+                # fastqc is not run by this test
+                result.generateFastqcStats = lambda: None
+                targetRecoverer.trim(result, 'd0')
+                self.assertTrue(os.path.exists(result.forwardFastqTrimmedPaired))
+            self.assertEqual(1, len(trimmomaticRunList))
+            targetRecoverer.removeTrimmedReads(result)
+            self.assertEqual(['trim.pickle'], os.listdir(targetRecoverer.checkpointDirname))
+            result = paftol.HybpiperResult(paftol.PaftolTargetSet(), forwardFastq, reverseFastq)
+            result.generateFastqcStats = lambda: None
+            targetRecoverer.trim(result, 'd0')
+            self.assertEqual(2, len(trimmomaticRunList))
+            self.assertTrue(os.path.exists(result.reverseFastqTrimmedUnpaired))
+        finally:
+            targetRecoverer.cleanupTmpdir()
+
+    def test_stageMetrics(self):
+        hybseqResult = paftol.HybseqResult()
+        with hybseqResult.measureStage('stage0'):
+            sum(xrange(10000))
+        with self.assertRaises(ValueError):
+            with hybseqResult.measureStage('stage1'):
+                raise ValueError('stage failed')
+        stageMetricsDataFrame = hybseqResult.stageMetricsDataFrame('sample0')
+        self.assertEqual(['stage0', 'stage1'], stageMetricsDataFrame.getColumn('stageName'))
+        self.assertEqual(['sample0', 'sample0'], stageMetricsDataFrame.getColumn('sampleName'))
+        for rowDict in stageMetricsDataFrame.rowDictList:
+            self.assertTrue(rowDict['wallTime'] >= 0.0)
+            self.assertTrue(rowDict['cpuTime'] >= 0.0)
+            self.assertTrue(rowDict['peakRss'] > 0)
+
+    def test_SyntheticHybseqData(self):
+        data0 = paftol.benchmark.SyntheticHybseqData(numGenes=2, numOrganisms=2, geneLength=300, readLength=50, depth=4, divergence=0.1, seed=3)
+        data1 = paftol.benchmark.SyntheticHybseqData(numGenes=2, numOrganisms=2, geneLength=300, readLength=50, depth=4, divergence=0.1, seed=3)
+        self.assertEqual(['org000-gene0000', 'org001-gene0000', 'org000-gene0001', 'org001-gene0001'], [sr.id for sr in data0.targetSrList])
+        self.assertEqual([str(sr.seq) for sr in data0.targetSrList], [str(sr.seq) for sr in data1.targetSrList])
+        self.assertEqual(24, len(data0.readPairList))
+        self.assertEqual(data0.makeSamLineList(), data1.makeSamLineList())
+        forwardRead, reverseRead, targetId, position = data0.readPairList[0]
+        self.assertEqual('read00000000/1', forwardRead.id)
+        self.assertEqual('read00000000/2', reverseRead.id)
+        self.assertEqual(50, len(reverseRead))
+
+    def test_compareToBaseline(self):
+        rowDict = {'benchmark': 'b0', 'numRepeats': 3, 'minTime': 2.0, 'medianTime': 2.0, 'meanTime': 2.0, 'numGenes': 10, 'numOrganisms': 3, 'geneLength': 900, 'readLength': 150, 'depth': 20, 'divergence': 0.05, 'seed': 1, 'version': None}
+        resultDataFrame = paftol.tools.DataFrame(paftol.benchmark.BenchmarkSuite.columnHeaderList)
+        resultDataFrame.addRow(rowDict)
+        baselineDataFrame = paftol.tools.DataFrame(paftol.benchmark.BenchmarkSuite.columnHeaderList)
+        baselineDataFrame.addRow(dict(rowDict, minTime=1.0))
+        baselineDataFrame.addRow(dict(rowDict, benchmark='b1'))
+        csvFile = StringIO.StringIO()
+        baselineDataFrame.writeCsv(csvFile)
+        baselineDataFrame = paftol.benchmark.readBenchmarkCsv(StringIO.StringIO(csvFile.getvalue()))
+        comparisonRowDict = paftol.benchmark.compareToBaseline(resultDataFrame, baselineDataFrame, 1.5).rowDictList[0]
+        self.assertEqual(2.0, comparisonRowDict['relativeTime'])
+        self.assertTrue(comparisonRowDict['regression'])
+        resultDataFrame.rowDictList[0]['depth'] = 40
+        with self.assertRaises(StandardError):
+            paftol.benchmark.compareToBaseline(resultDataFrame, baselineDataFrame, 1.5)
+
+    def test_TopScoringSelection(self):
+        topScoringSelection = paftol.tools.TopScoringSelection(3)
+        self.assertEqual([], topScoringSelection.add('a', 1, 'a0'))
+        self.assertEqual([], topScoringSelection.add('b', 5, 'b0'))
+        self.assertEqual([], topScoringSelection.add('c', 2, 'c0'))
+        self.assertEqual(['d0'], topScoringSelection.add('d', 1, 'd0'))
+        self.assertEqual([], topScoringSelection.add('a', 3, 'a1'))
+        self.assertEqual(['c0'], topScoringSelection.add('e', 4, 'e0'))
+        self.assertEqual(['b', 'e', 'a'], topScoringSelection.getKeyList())
+        self.assertEqual(['a0', 'a1'], topScoringSelection.keyEntryDict['a'][2])
+        self.assertEqual(2, topScoringSelection.numDiscardedKeys)
+
+    def test_capMappedReads(self):
+        targetsFname = self.makeTmpPath('targets.fasta')
+        with open(targetsFname, 'w') as f:
+            f.write('>o0-g0\n%s\n>o1-g0\n%s\n>o0-g1\n%s\n' % ('ACGT' * 5, 'ACGA' * 5, 'TTGCA' * 4))
+        paftolTargetSet = paftol.PaftolTargetSet()
+        paftolTargetSet.readFasta(targetsFname)
+        paftolTargetSet.maxNumMappedReadsPerGene = 3
+        readTupleList = [('o0-g0', 5), ('o1-g0', 12), ('o0-g1', 4), ('o0-g0', 3), ('o1-g0', 9), ('o0-g1', 8), ('o0-g0', 11), ('o0-g1', 2), ('o1-g0', 7), ('o0-g1', 6)]
+        for i, (targetId, readLength) in enumerate(readTupleList):
+            samLine = 'r%d\t0\t%s\t1\t60\t%dM\t*\t0\t0\t%s\t%s' % (i, targetId, readLength, 'A' * readLength, 'I' * readLength)
+            paftolTargetSet.processSamAlignment(paftol.tools.SamAlignment(samLine))
+        for geneName, readNameSet, numDiscardedReads in [('g0', set(['r1', 'r4', 'r6']), 3), ('g1', set(['r2', 'r5', 'r9']), 1)]:
+            paftolGene = paftolTargetSet.paftolGeneDict[geneName]
+            self.assertEqual(readNameSet, paftolGene.getReadNameSet())
+            self.assertEqual(numDiscardedReads, paftolGene.numDiscardedReads())
+            self.assertEqual(3, sum([len(t.mappedReadList) for t in paftolGene.paftolTargetDict.values()]))
+
+    def test_selectLongestReads(self):
+        readList = [Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(s), id='r%d' % i) for i, s in enumerate(['ACG', 'A', 'ACGT', 'AC', 'ACG', 'ACGT', 'A'])]
+        self.assertEqual(['r2', 'r5', 'r0', 'r4'], [sr.id for sr in paftol.tools.selectLongestReads(readList, 4)])
+        self.assertEqual(['r2', 'r5', 'r0', 'r4', 'r3', 'r1', 'r6'], [sr.id for sr in paftol.tools.selectLongestReads(readList, 10)])
+
+    def test_ReadNameIndex(self):
+        self.assertEqual('r0', paftol.MappedRead.readBasename('r0/1'))
+        self.assertEqual('r0', paftol.MappedRead.readBasename('r0/2'))
+        self.assertEqual('r0/3', paftol.MappedRead.readBasename('r0/3'))
+        self.assertEqual('/1', paftol.MappedRead.readBasename('/1'))
+        self.assertEqual('r0/', paftol.MappedRead.readBasename('r0/'))
+        samLineList = ['r%d/%d\t0\torg-gene\t1\t60\t4M\t*\t0\t0\tACGT\tIIII' % (i / 2, i % 2 + 1) for i in xrange(6)]
+        mappedReadList = [paftol.SamMappedRead(None, paftol.tools.SamAlignment(samLine)) for samLine in samLineList]
+        readNameIndex = paftol.ReadNameIndex()
+        for mappedRead in mappedReadList:
+            readNameIndex.add(mappedRead)
+        self.assertEqual(mappedReadList[2:4], readNameIndex.getMappedReadList('r1'))
+        self.assertEqual([], readNameIndex.getMappedReadList('r3'))
+        # simulate a hash collision
+        readNameIndex.readNameHashDict[hash('r3')] = mappedReadList[4]
+        self.assertEqual([], readNameIndex.getMappedReadList('r3'))
+
+    def test_readMappedReadsIndexed(self):
+        targetsFname = self.makeTmpPath('targets.fasta')
+        with open(targetsFname, 'w') as f:
+            f.write('>o0-g0\nACGTACGTAC\n>o0-g1\nTTGCATTGCA\n')
+        forwardFastq = self.makeTmpPath('fwd.fastq')
+        with open(forwardFastq, 'w') as f:
+            f.write(''.join(['@r%d/1\nACGT%s\n+\nIIIII\n' % (i, 'ACGT'[i % 4]) for i in xrange(6)]))
+        reverseFastqStr = ''.join(['@r%d/2\nTTGCA%s\n+\nIIIIII\n' % (i, 'ACGT'[i % 4]) for i in xrange(6)])
+        reverseFastq = self.makeTmpPath('rev.fastq.gz')
+        with Bio.bgzf.BgzfWriter(reverseFastq, 'wb') as f:
+            f.write(reverseFastqStr)
+        samLineList = ['r0/1\t0\to0-g0\t1\t60\t5M\t*\t0\t0\tACGTA\tIIIII', 'r3/1\t0\to0-g1\t1\t60\t5M\t*\t0\t0\tACGTT\tIIIII']
+        hybseqAnalyser = paftol.HybseqAnalyser()
+        hybseqAnalyser.fastqIndexDirname = self.makeTmpPath('fqidx')
+        def readMappedReads():
+            paftolTargetSet = paftol.PaftolTargetSet()
+            paftolTargetSet.readFasta(targetsFname)
+            for samLine in samLineList:
+                paftolTargetSet.processSamAlignment(paftol.tools.SamAlignment(samLine))
+            hybseqAnalyser.readMappedReadsIndexed(paftol.HybpiperResult(paftolTargetSet, forwardFastq, reverseFastq))
+            readNameMappedReadDict = paftolTargetSet.makeReadNameMappedReadDict()
+            self.assertEqual(['r0', 'r3'], sorted(readNameMappedReadDict.keys()))
+            return dict([(readName, (str(mappedReadList[0].forwardRead.seq), str(mappedReadList[0].reverseRead.seq))) for readName, mappedReadList in readNameMappedReadDict.iteritems()])
+        for i in xrange(2):
+            self.assertEqual({'r0': ('ACGTA', 'TTGCAA'), 'r3': ('ACGTT', 'TTGCAT')}, readMappedReads())
+        indexFnameList = glob.glob(os.path.join(hybseqAnalyser.fastqIndexDirname, '*'))
+        self.assertEqual(2, len(indexFnameList))
+        # an index left partial by an interrupted run is rebuilt
+        for indexFname in indexFnameList:
+            with open(indexFname, 'r+b') as f:
+                f.truncate(100)
+        self.assertEqual({'r0': ('ACGTA', 'TTGCAA'), 'r3': ('ACGTT', 'TTGCAT')}, readMappedReads())
+        # an index of a FASTQ file that has changed is rebuilt
+        with open(forwardFastq, 'w') as f:
+            f.write(''.join(['@r%d/1\nGGGG%s\n+\nIIIII\n' % (i, 'ACGT'[i % 4]) for i in xrange(4)]))
+        self.assertEqual({'r0': ('GGGGA', 'TTGCAA'), 'r3': ('GGGGT', 'TTGCAT')}, readMappedReads())
+        self.assertEqual(sorted(indexFnameList), sorted(glob.glob(os.path.join(hybseqAnalyser.fastqIndexDirname, '*'))))
+        with gzip.open(self.makeTmpPath('plain.fastq.gz'), 'wb') as f:
+            f.write(reverseFastqStr)
+        with self.assertRaises(StandardError):
+            hybseqAnalyser.openFastqIndex(self.makeTmpPath('plain.fastq.gz'))
+
+    def test_readFastaCached(self):
+        targetsFname = self.makeTmpPath('targets.fasta')
+        with open(targetsFname, 'w') as f:
+            f.write('>o0-g0\nACGTACGT\n>o1-g0\nACGAACGT\n>o0-g1\nTTGCA\n>o0-g2\nGGATCC\n>o1-g2\nGGATCA\n')
+        cacheDirname = self.makeTmpPath('cache')
+        paftolTargetSet = paftol.PaftolTargetSet()
+        paftolTargetSet.readFasta(targetsFname)
+        targetTupleList = sorted(paftolTargetSet.makeTargetTupleList())
+        for i in xrange(2):
+            paftolTargetSet = paftol.PaftolTargetSet()
+            paftolTargetSet.readFastaCached(targetsFname, cacheDirname)
+            self.assertEqual(targetTupleList, sorted(paftolTargetSet.makeTargetTupleList()))
+            self.assertEqual(3, len(paftolTargetSet.paftolGeneDict))
+            self.assertEqual(1, len(os.listdir(cacheDirname)))
+        with open(targetsFname, 'a') as f:
+            f.write('>org-gene\nacgtn\n')
+        with self.assertRaises(StandardError):
+            paftol.PaftolTargetSet().readFastaCached(targetsFname, cacheDirname)
+        self.assertEqual(1, len(os.listdir(cacheDirname)))
+        paftol.PaftolTargetSet().readFastaCached(targetsFname, cacheDirname, True)
+        self.assertEqual(2, len(os.listdir(cacheDirname)))
+
+    def test_writeInterleavedFastq(self):
+        # enough reads to fill the pipe buffers of the FIFOs below
+        numReadPairs = 1000
+        forwardFastq = self.makeTmpPath('fwd.fastq')
+        reverseFastq = self.makeTmpPath('rev.fastq')
+        with open(forwardFastq, 'w') as f:
+            f.write(''.join(['@p%d/1\n%s\n+\n%s\n' % (i, 'ACGT' * 25, 'I' * 100) for i in xrange(numReadPairs)]))
+        with open(reverseFastq, 'w') as f:
+            f.write(''.join(['@p%d/2\n%s\n+\n%s\n' % (i, 'ACGT'[i % 4] * 100, 'I' * 100) for i in xrange(numReadPairs)]))
+        # forward and reverse reads are written concurrently, as trimmomatic does
+        forwardFifo = self.makeTmpPath('fwd.fifo')
+        reverseFifo = self.makeTmpPath('rev.fifo')
+        os.mkfifo(forwardFifo)
+        os.mkfifo(reverseFifo)
+        def writeFifo(fastqFname, fifoFname):
+            with open(fastqFname, 'r') as f:
+                fastqStr = f.read()
+            with open(fifoFname, 'w') as f:
+                f.write(fastqStr)
+        writerThreadList = [threading.Thread(target=writeFifo, args=(forwardFastq, forwardFifo)), threading.Thread(target=writeFifo, args=(reverseFastq, reverseFifo))]
+        for writerThread in writerThreadList:
+            writerThread.start()
+        interleavedFile = StringIO.StringIO()
+        numPairs = paftol.tools.writeInterleavedFastq(forwardFifo, reverseFifo, interleavedFile, 7, 2)
+        for writerThread in writerThreadList:
+            writerThread.join()
+        self.assertEqual(numReadPairs, numPairs)
+        interleavedList = list(Bio.SeqIO.parse(StringIO.StringIO(interleavedFile.getvalue()), 'fastq'))
+        self.assertEqual(2 * numReadPairs, len(interleavedList))
+        for i in xrange(numReadPairs):
+            self.assertEqual('p%d/1' % i, interleavedList[2 * i].id)
+            self.assertEqual('p%d/2' % i, interleavedList[2 * i + 1].id)
+            self.assertEqual('ACGT'[i % 4] * 100, str(interleavedList[2 * i + 1].seq))
+        # when the consumer fails, reading continues so the writers are not blocked
+        class FailingFile(object):
+            def write(self, s):
+                raise IOError('broken pipe')
+        writerThreadList = [threading.Thread(target=writeFifo, args=(forwardFastq, forwardFifo)), threading.Thread(target=writeFifo, args=(reverseFastq, reverseFifo))]
+        for writerThread in writerThreadList:
+            writerThread.daemon = True
+            writerThread.start()
+        with self.assertRaises(IOError):
+            paftol.tools.writeInterleavedFastq(forwardFifo, reverseFifo, FailingFile(), 7, 2)
+        for writerThread in writerThreadList:
+            writerThread.join(10)
+            self.assertFalse(writerThread.is_alive())
+        with open(reverseFastq, 'r') as f:
+            reverseLineList = f.readlines()
+        with open(reverseFastq, 'w') as f:
+            f.write(''.join(reverseLineList[:-4]))
+        with self.assertRaises(StandardError):
+            paftol.tools.writeInterleavedFastq(forwardFastq, reverseFastq, StringIO.StringIO())
+
+    def test_parseExonerateResultStream(self):
+        labelledLineList = ['exonerateModel: protein2genome:local', 'queryId: q0', 'queryDef: ', 'queryStrand: +']
+        labelledLineList.extend(['%s: %d' % (label, n) for n, label in enumerate(['queryAlignmentStart', 'queryAlignmentEnd', 'queryAlignmentLength'])])
+        labelledLineList.extend(['queryCdsStart: NA', 'queryCdsEnd: NA', 'queryCdsLength: NA', 'targetId: t%d', 'targetDef: ', 'targetStrand: -'])
+        labelledLineList.extend(['%s: %d' % (label, n) for n, label in enumerate(['targetAlignmentStart', 'targetAlignmentEnd', 'targetAlignmentLength', 'targetCdsStart', 'targetCdsEnd', 'targetCdsLength', 'rawScore'])])
+        labelledLineList.extend(['percentIdentity: 87.5', 'percentSimilarity: 90.0'])
+        labelledLineList.extend(['%s: %d' % (label, n) for n, label in enumerate(['equivalencedTotal', 'equivalencedIdentity', 'equivalencedSimilarity', 'equivalencedMismatches'])])
+        labelledLineList.append('vulgar: M 1 3')
+        seqLineList = ['seqStart queryCds', 'seqEnd', 'seqStart queryAlignment', 'MK', 'V', 'seqEnd', 'seqStart targetCds', 'ATGAAA', 'GTT', 'seqEnd', 'seqStart targetAlignment', 'ATGAAAGTT', 'seqEnd']
+        recordStr = '\n'.join(['ryoStart'] + labelledLineList + seqLineList + ['ryoEnd', ''])
+        querySeq = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('MKV'), id='q0')
+        exonerateResultList = list(paftol.tools.ExonerateRunner().parseExonerateResultStream(StringIO.StringIO((recordStr % 0) + (recordStr % 1)), querySeq, 'targets.fasta', None))
+        self.assertEqual(['t0', 't1'], [exonerateResult.targetId for exonerateResult in exonerateResultList])
+        exonerateResult = exonerateResultList[1]
+        self.assertIsNone(exonerateResult.queryCdsStart)
+        self.assertEqual(4, exonerateResult.targetCdsEnd)
+        self.assertEqual(87.5, exonerateResult.percentIdentity)
+        self.assertEqual('MKV', str(exonerateResult.queryAlignmentSeq.seq))
+        self.assertEqual('q0_t1_taln', exonerateResult.targetAlignmentSeq.id)
+        self.assertIsNone(exonerateResult.queryCdsSeq)
+        self.assertEqual('ATGAAAGTT', str(exonerateResult.targetCdsSeq.seq))
+        with self.assertRaises(StandardError):
+            list(paftol.tools.ExonerateRunner().parseExonerateResultStream(StringIO.StringIO(recordStr[:-7] % 0), querySeq, 'targets.fasta', None))
+
     def test_Contig(self):
         alignmentRunner = paftol.tools.SemiglobalAlignmentRunner()
         contig = paftol.tools.Contig(5, 0.7, alignmentRunner)
@@ -59,6 +478,8 @@ class PaftolTestCase(unittest.TestCase):
         r = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('ttacgc', alphabet=Bio.Alphabet.IUPAC.ambiguous_dna), id='r5')
         contig.addRead(r)
         self.assertEqual('atggattacagc', str(getConsensusFromCopy(contig).seq), 'unexpected consensus after read %s' % r.id)
+        # the column buffer cached now must be rebuilt after adding the next read
+        contig.getColumnBuffer()
         r = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('gattacca', alphabet=Bio.Alphabet.IUPAC.ambiguous_dna), id='r6')
         contig.addRead(r)
         self.assertEqual('atggattacagca', str(getConsensusFromCopy(contig).seq), 'unexpected consensus after read %s' % r.id)
@@ -69,3 +490,6 @@ class PaftolTestCase(unittest.TestCase):
         consensusDepthProfile = consensus.letter_annotations['depth']
         self.assertEqual([1, 1, 1, 4, 4, 8, 8, 8, 3, 5, 5, 3, 4, 1], contigDepthProfile, 'unexpected contig depth profile: %s' % str(contigDepthProfile))
         self.assertEqual([1, 1, 1, 4, 4, 8, 8, 8, 5, 5, 3, 4, 1], consensusDepthProfile, 'unexpected consensus depth profile: %s' % str(consensusDepthProfile))
+        self.assertEqual(['~~~gatta-ca~~~', 'atggatta~~~~~~', '~~~gatta-ca~~~', '~~~~~tta-ca~~~', '~~~~~tta-cagc~', '~~~~~ttaccagc~', '~~~~~ttac--gc~', '~~~gattac---ca'], [str(sr.seq) for sr in alignment])
+        self.assertEqual(None, contig.getSymbol(0, 0))
+        self.assertEqual('a', contig.getSymbol(1, 0))
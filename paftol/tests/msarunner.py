@@ -1,5 +1,6 @@
 import sys
 import unittest
+import time
 import subprocess
 
 import Bio
@@ -49,3 +50,47 @@ class MafftRunnerTestCase(unittest.TestCase):
         self.assertTrue('1000' in mafftRunner.makeArgv())
         self.assertTrue('--maxiterate' in mafftRunner.makeArgv())
         
+
+
+class DelayedEchoRunner(paftol.msarunner.MultipleSequenceAlignmentRunner):
+
+    """Stub runner that returns its input as the alignment.
+
+The id of the first sequence gives the number of seconds to sleep
+before responding, a negative id makes the process fail.
+"""
+
+    def __init__(self):
+        self.numThreads = None
+
+    def makeArgv(self):
+        return [sys.executable, '-c', 'import sys, time; s = sys.stdin.read(); d = float(s[1:s.index("\\n")].split()[0]); time.sleep(max(d, 0)); sys.stdout.write(s); sys.exit(d < 0)']
+
+
+class MultipleSequenceAlignmentPoolTestCase(unittest.TestCase):
+
+    def test_numConcurrentJobs(self):
+        mafftRunner = paftol.msarunner.MafftRunner()
+        msaPool = paftol.msarunner.MultipleSequenceAlignmentPool(mafftRunner, numCores=8, numThreadsPerJob=3)
+        self.assertEqual(2, msaPool.getNumConcurrentJobs())
+        jobRunner = msaPool.makeJobRunner()
+        self.assertEqual(3, jobRunner.numThreads)
+        self.assertIsNone(mafftRunner.numThreads)
+        self.assertTrue('--thread' in jobRunner.makeArgv())
+
+    def test_alignJobs(self):
+        msaPool = paftol.msarunner.MultipleSequenceAlignmentPool(DelayedEchoRunner(), numCores=3, numThreadsPerJob=1)
+        def makeJob(jobId, delay):
+            return jobId, [Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('ACGT'), id='%s' % delay, description=''), Bio.SeqRecord.SeqRecord(Bio.Seq.Seq('AC-T'), id=jobId, description='')]
+        # queued can only start once one of the first three jobs has completed
+        resultList = list(msaPool.alignJobs([makeJob('slow', 1.0), makeJob('fast', 0.0), makeJob('medium', 0.5), makeJob('queued', 0.0)]))
+        self.assertEqual(['fast', 'queued', 'medium', 'slow'], [jobId for jobId, alignment in resultList])
+        for jobId, alignment in resultList:
+            self.assertEqual(2, len(alignment))
+            self.assertEqual(jobId, alignment[1].id)
+            self.assertEqual('AC-T', str(alignment[1].seq))
+        startTime = time.time()
+        with self.assertRaises(StandardError):
+            list(msaPool.alignJobs([makeJob('ok', 0.0), makeJob('failing', -1), makeJob('other', 0.5), makeJob('notStarted', 0.0)]))
+        # the job still running at the time of the failure has been waited for
+        self.assertTrue(time.time() - startTime >= 0.5)
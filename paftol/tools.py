@@ -12,7 +12,20 @@ import logging
 import copy
 import math
 import md5
+import mmap
 import shutil
+import threading
+import Queue
+import tarfile
+import fnmatch
+import gzip
+import StringIO
+import io
+import itertools
+import heapq
+import time
+import resource
+import sqlite3
 
 import Bio
 import Bio.Alphabet
@@ -53,17 +66,331 @@ def md5HexDigest(s):
     return m.hexdigest()
 
 
-def md5HexdigestFromFile(fname):
+def readFileBlocks(f, blockSize, useMmap=False):
+    """Generate the contents of a file as a series of blocks of at most C{blockSize} bytes.
+
+@param f: the file, must be opened in binary mode
+@type f: C{file}
+@param blockSize: maximal size of the blocks
+@type blockSize: C{int}
+@param useMmap: read the file through a read-only memory map
+@type useMmap: C{bool}
+"""
+    if useMmap and os.fstat(f.fileno()).st_size > 0:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for offset in xrange(0, len(m), blockSize):
+                yield m[offset:offset + blockSize]
+        finally:
+            m.close()
+    else:
+        block = f.read(blockSize)
+        while len(block) > 0:
+            yield block
+            block = f.read(blockSize)
+
+
+def md5HexdigestFromFile(fname, blockSize=1048576, useMmap=False):
+    m = md5.new()
     with open(fname, 'rb') as f:
-        md5Hex = md5HexDigest(f.read())
-    return md5Hex
+        for block in readFileBlocks(f, blockSize, useMmap):
+            m.update(block)
+    return m.hexdigest()
+
+
+def md5HexdigestAndStatsFromFile(fname, fileFormat, blockSize=1048576, useMmap=False):
+    """Compute the md5 digest, the size and the number of sequence records of a file in a single pass.
+
+Records are counted by header lines for FASTA and as groups of four
+lines for FASTQ, so records are not validated.
+
+@param fname: name of the file
+@type fname: C{str}
+@param fileFormat: format of the file, C{'fasta'} or C{'fastq'}
+@type fileFormat: C{str}
+@return: a tuple containing the md5 hex digest, the file size and the number of records
+@rtype: C{tuple}
+"""
+    if fileFormat not in ['fasta', 'fastq']:
+        raise StandardError, 'unsupported format: %s' % fileFormat
+    m = md5.new()
+    fileSize = 0
+    numLines = 0
+    numHeaders = 0
+    lastChar = '\n'
+    with open(fname, 'rb') as f:
+        for block in readFileBlocks(f, blockSize, useMmap):
+            m.update(block)
+            fileSize = fileSize + len(block)
+            numLines = numLines + block.count('\n')
+            if fileFormat == 'fasta':
+                numHeaders = numHeaders + block.count('\n>')
+                if lastChar == '\n' and block[0] == '>':
+                    numHeaders = numHeaders + 1
+            lastChar = block[-1]
+    if fileFormat == 'fasta':
+        numRecords = numHeaders
+    else:
+        if lastChar != '\n':
+            numLines = numLines + 1
+        numRecords = numLines / 4
+    return m.hexdigest(), fileSize, numRecords
     
 
-def fastqToFasta(fastqFname, fastaFname):
-    with open(fastqFname, 'r') as fastqFile:
+def openMaybeGzipped(fname):
+    """Open a file for reading, transparently decompressing it if it is gzipped.
+
+Compression is detected by the gzip magic number, not by the file name.
+Gzipped files are wrapped in a buffered reader for fast line iteration.
+
+@param fname: name of the file
+@type fname: C{str}
+@return: the opened file
+@rtype: C{file}, or C{gzip.GzipFile}
+"""
+    with open(fname, 'rb') as f:
+        magic = f.read(2)
+    if magic == '\x1f\x8b':
+        return io.BufferedReader(gzip.open(fname, 'rb'))
+    return open(fname, 'r')
+
+
+fastqIndexStatKey = 'paftol_fastq_stat'
+
+
+def readFastqIndexStat(indexFname):
+    """Read the FASTQ file size and modification time recorded in an index built by L{openFastqIndex}.
+
+@param indexFname: name of the index file
+@type indexFname: C{str}
+@return: the recorded size and modification time, or C{None} if the index does not exist or has none recorded
+@rtype: C{str}
+"""
+    if not os.path.exists(indexFname):
+        return None
+    try:
+        connection = sqlite3.connect(indexFname)
+        try:
+            row = connection.execute('SELECT value FROM meta_data WHERE key = ?', (fastqIndexStatKey, )).fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        logger.debug('cannot read index %s: %s', indexFname, str(e))
+        return None
+    if row is None:
+        return None
+    return str(row[0])
+
+
+def openFastqIndex(fastqFname, indexFname, keyFunction=None):
+    """Open an on-disk index of the records in a FASTQ file, building it if necessary.
+
+The index is an SQLite database of record offsets, as provided by
+C{Bio.SeqIO.index_db}. The size and modification time of the FASTQ
+file are recorded in the index, and the index is rebuilt if they do
+not match. The index is built under a temporary name and renamed when
+complete, so an interrupted build does not leave a partial index in
+place. Compressed FASTQ files must be block gzipped (BGZF, e.g. made
+by C{bgzip}), plain gzip does not permit random access.
+
+@param fastqFname: name of the FASTQ file
+@type fastqFname: C{str}
+@param indexFname: name of the index file
+@type indexFname: C{str}
+@param keyFunction: function mapping record ids to keys, C{None} to use ids as keys
+@return: read only dictionary of C{SeqRecord}s, which should be closed after use
+"""
+    with open(fastqFname, 'rb') as f:
+        header = f.read(14)
+    if header[:2] == '\x1f\x8b' and header[12:14] != 'BC':
+        raise StandardError, 'cannot index %s: gzip compressed files must be block gzipped (BGZF)' % fastqFname
+    fastqStat = os.stat(fastqFname)
+    fastqStatStr = '%d %r' % (fastqStat.st_size, fastqStat.st_mtime)
+    if readFastqIndexStat(indexFname) == fastqStatStr:
+        try:
+            return Bio.SeqIO.index_db(indexFname, fastqFname, 'fastq', key_function=keyFunction)
+        except ValueError as e:
+            logger.debug('cannot load index %s (%s), rebuilding', indexFname, str(e))
+    else:
+        logger.debug('index %s is missing or out of date, rebuilding', indexFname)
+    tmpIndexFname = '%s.tmp%d' % (indexFname, os.getpid())
+    if os.path.exists(tmpIndexFname):
+        os.unlink(tmpIndexFname)
+    Bio.SeqIO.index_db(tmpIndexFname, fastqFname, 'fastq', key_function=keyFunction).close()
+    connection = sqlite3.connect(tmpIndexFname)
+    try:
+        connection.execute('INSERT INTO meta_data (key, value) VALUES (?, ?)', (fastqIndexStatKey, fastqStatStr))
+        connection.commit()
+    finally:
+        connection.close()
+    os.rename(tmpIndexFname, indexFname)
+    return Bio.SeqIO.index_db(indexFname, fastqFname, 'fastq', key_function=keyFunction)
+
+
+def writeFastqAsFasta(fastqFile, fastaFile, bufferSize=1048576):
+    """Convert FASTQ to FASTA by text processing, without constructing C{SeqRecord}s.
+
+The input must be in the common four line per record FASTQ format.
+Sequences are written on a single line. Output is collected in
+chunks of approximately C{bufferSize} bytes, which are written at once.
+
+@param fastqFile: the FASTQ input
+@type fastqFile: C{file}
+@param fastaFile: the FASTA output
+@type fastaFile: C{file}
+@param bufferSize: approximate number of bytes to collect before writing
+@type bufferSize: C{int}
+@return: number of records converted
+@rtype: C{int}
+"""
+    numRecords = 0
+    chunkList = []
+    chunkSize = 0
+    lineIterator = iter(fastqFile)
+    for header in lineIterator:
+        try:
+            seq = lineIterator.next()
+            plusLine = lineIterator.next()
+            lineIterator.next()
+        except StopIteration:
+            raise StandardError, 'truncated FASTQ record: %s' % header.strip()
+        if header[0] != '@' or plusLine[0] != '+':
+            raise StandardError, 'malformed FASTQ record: %s' % header.strip()
+        chunkList.append('>')
+        chunkList.append(header[1:])
+        chunkList.append(seq)
+        chunkSize = chunkSize + len(header) + len(seq)
+        numRecords = numRecords + 1
+        if chunkSize >= bufferSize:
+            fastaFile.write(''.join(chunkList))
+            chunkList = []
+            chunkSize = 0
+    fastaFile.write(''.join(chunkList))
+    return numRecords
+
+
+class FastqChunkReader(threading.Thread):
+    """Thread reading a FASTQ file in chunks of records into a queue.
+
+The end of the file is signalled by putting C{None} into the queue.
+Records are kept as text, in the four line per record format.
+"""
+
+    def __init__(self, fastqFname, chunkQueue, numRecordsPerChunk):
+        super(FastqChunkReader, self).__init__()
+        self.fastqFname = fastqFname
+        self.chunkQueue = chunkQueue
+        self.numRecordsPerChunk = numRecordsPerChunk
+        self.error = None
+
+    def run(self):
+        try:
+            with open(self.fastqFname, 'r') as f:
+                chunk = list(itertools.islice(f, 4 * self.numRecordsPerChunk))
+                while len(chunk) > 0:
+                    if len(chunk) % 4 != 0:
+                        raise StandardError, 'truncated FASTQ record in %s' % self.fastqFname
+                    self.chunkQueue.put(chunk)
+                    chunk = list(itertools.islice(f, 4 * self.numRecordsPerChunk))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.chunkQueue.put(None)
+
+
+def drainChunkQueue(chunkQueue):
+    while chunkQueue.get() is not None:
+        pass
+
+
+def writeInterleavedFastq(forwardFastqFname, reverseFastqFname, interleavedFile, numRecordsPerChunk=1000, maxNumQueuedChunks=4):
+    """Write paired FASTQ files as a single interleaved FASTQ stream.
+
+The files are typically FIFOs written by a concurrently running
+process. They are read by separate threads, so the writing process
+cannot deadlock by blocking on one file while this function waits
+for the other. At most C{maxNumQueuedChunks} chunks are read ahead
+from each file, so memory use is bounded when the interleaved stream
+is consumed more slowly than the files are written. If interleaving
+stops early, the remainder of the files is read and discarded, so the
+writing process is not blocked.
+
+@param forwardFastqFname: name of the forward reads file (FASTQ format)
+@type forwardFastqFname: C{str}
+@param reverseFastqFname: name of the reverse reads file (FASTQ format)
+@type reverseFastqFname: C{str}
+@param interleavedFile: the interleaved output
+@type interleavedFile: C{file}
+@param numRecordsPerChunk: number of records read in one chunk
+@type numRecordsPerChunk: C{int}
+@param maxNumQueuedChunks: maximal number of chunks read ahead from each file
+@type maxNumQueuedChunks: C{int}
+@return: the number of read pairs written
+@rtype: C{int}
+"""
+    forwardQueue = Queue.Queue(maxNumQueuedChunks)
+    reverseQueue = Queue.Queue(maxNumQueuedChunks)
+    readerList = [FastqChunkReader(forwardFastqFname, forwardQueue, numRecordsPerChunk), FastqChunkReader(reverseFastqFname, reverseQueue, numRecordsPerChunk)]
+    for reader in readerList:
+        reader.daemon = True
+        reader.start()
+    numPairs = 0
+    forwardChunk = forwardQueue.get()
+    reverseChunk = reverseQueue.get()
+    try:
+        while forwardChunk is not None and reverseChunk is not None:
+            if len(forwardChunk) != len(reverseChunk):
+                break
+            lineList = []
+            for i in xrange(0, len(forwardChunk), 4):
+                lineList.extend(forwardChunk[i:i + 4])
+                lineList.extend(reverseChunk[i:i + 4])
+            interleavedFile.write(''.join(lineList))
+            numPairs = numPairs + len(forwardChunk) / 4
+            forwardChunk = forwardQueue.get()
+            reverseChunk = reverseQueue.get()
+    finally:
+        if forwardChunk is not None:
+            drainChunkQueue(forwardQueue)
+        if reverseChunk is not None:
+            drainChunkQueue(reverseQueue)
+    for reader in readerList:
+        if reader.error is not None:
+            raise StandardError, 'reading %s failed: %s' % (reader.fastqFname, str(reader.error))
+    if forwardChunk is not None or reverseChunk is not None:
+        raise StandardError, 'paired read files %s / %s differ in number of reads' % (forwardFastqFname, reverseFastqFname)
+    return numPairs
+
+
+def unblockFifoReaders(fifoFnameList):
+    """Unblock readers waiting to open FIFOs that will not be opened by a writer.
+
+Each FIFO with a waiting reader is opened and closed for writing, so the
+reader gets an end of file.
+"""
+    for fifoFname in fifoFnameList:
+        try:
+            fd = os.open(fifoFname, os.O_WRONLY | os.O_NONBLOCK)
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def fastqToFasta(fastqFname, fastaFname, bufferSize=1048576):
+    """Convert a FASTQ file, which may be gzipped, to a FASTA file.
+
+@param fastqFname: name of the FASTQ file
+@type fastqFname: C{str}
+@param fastaFname: name of the FASTA file
+@type fastaFname: C{str}
+@param bufferSize: approximate number of bytes to write at once
+@type bufferSize: C{int}
+@return: number of records converted
+@rtype: C{int}
+"""
+    with openMaybeGzipped(fastqFname) as fastqFile:
         with open(fastaFname, 'w') as fastaFile:
-            for record in Bio.SeqIO.parse(fastqFile, 'fastq'):
-                Bio.SeqIO.write(record, fastaFile, 'fasta')
+            return writeFastqAsFasta(fastqFile, fastaFile, bufferSize)
 
 
 def fastaSeqRecordList(fastaFname):
@@ -82,18 +409,53 @@ def alignCdsByProtein(alignedProteinSeqRecord, cdsSeqRecord):
     if not isinstance(cdsAlphabet, Bio.Alphabet.Gapped):
         cdsAlphabet = Bio.Alphabet.Gapped(cdsAlphabet)
     a = str(alignedProteinSeqRecord.seq)
-    s = ''
+    codonGap = 3 * cdsAlphabet.gap_char
+    codonList = []
     i = 0
     for aa in a:
         if aa == proteinAlphabet.gap_char:
-            s = s + 3 * cdsAlphabet.gap_char
+            codonList.append(codonGap)
         else:
-            s = s + c[i:i + 3]
+            codonList.append(c[i:i + 3])
             i = i + 3
-    return Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(s, cdsAlphabet), id=cdsSeqRecord.id, description='%s, gapped along %s' % (cdsSeqRecord.description, alignedProteinSeqRecord.id))
+    return Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(''.join(codonList), cdsAlphabet), id=cdsSeqRecord.id, description='%s, gapped along %s' % (cdsSeqRecord.description, alignedProteinSeqRecord.id))
+
+
+def countSeqRecordsAndBases(fName, fFormat):
+    """Count the records and the total number of bases in a FASTA or FASTQ file.
+
+The file is processed as lines of text, without parsing records, and
+may be gzipped. FASTQ files must be in the common four line per record
+format, FASTA records are counted by header lines.
+
+@param fName: name of the file
+@type fName: C{str}
+@param fFormat: format of the file, C{'fasta'} or C{'fastq'}
+@type fFormat: C{str}
+@return: a tuple containing the number of records and the number of bases
+@rtype: C{tuple}
+"""
+    numRecords = 0
+    numBases = 0
+    with openMaybeGzipped(fName) as f:
+        if fFormat == 'fastq':
+            for seqLine in itertools.islice(f, 1, None, 4):
+                numRecords = numRecords + 1
+                numBases = numBases + len(seqLine.rstrip('\r\n'))
+        elif fFormat == 'fasta':
+            for line in f:
+                if line[0] == '>':
+                    numRecords = numRecords + 1
+                else:
+                    numBases = numBases + len(line.rstrip('\r\n'))
+        else:
+            raise StandardError, 'unsupported format: %s' % fFormat
+    return numRecords, numBases
 
 
 def countSeqRecords(fName, fFormat):
+    if fFormat in ['fasta', 'fastq']:
+        return countSeqRecordsAndBases(fName, fFormat)[0]
     count = 0
     for seqRecord in Bio.SeqIO.parse(fName, fFormat):
         count = count + 1
@@ -257,6 +619,93 @@ class DataFrame(object):
         return d
 
 
+def readProcessIoCounters():
+    """Read the numbers of bytes read and written by this process.
+
+Counters are taken from C{/proc/self/io} and so are only available on Linux.
+
+@return: tuple of bytes read and bytes written, or C{(None, None)} if counters are not available
+@rtype: C{tuple}
+"""
+    ioDict = {}
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                k, v = line.split(':')
+                ioDict[k.strip()] = int(v)
+    except (IOError, ValueError):
+        return None, None
+    return ioDict.get('rchar'), ioDict.get('wchar')
+
+
+class StageMetrics(object):
+
+    """Resource usage of a stage of an analysis.
+
+Instances are context managers, measuring the resources used by the
+statements in the C{with} block.
+
+@ivar stageName: name of the stage
+@type stageName: C{str}
+@ivar wallTime: elapsed time (seconds)
+@type wallTime: C{float}
+@ivar cpuTime: user and system CPU time of this process (seconds)
+@type cpuTime: C{float}
+@ivar peakRss: maximum resident set size of this process (kilobytes) at the end of the stage
+@type peakRss: C{int}
+@ivar bytesRead: number of bytes read by this process, C{None} if not available
+@type bytesRead: C{int}
+@ivar bytesWritten: number of bytes written by this process, C{None} if not available
+@type bytesWritten: C{int}
+@ivar externalProcessTime: user and system CPU time of external processes that terminated during the stage (seconds)
+@type externalProcessTime: C{float}
+"""
+
+    columnHeaderList = ['stageName', 'wallTime', 'cpuTime', 'peakRss', 'bytesRead', 'bytesWritten', 'externalProcessTime']
+
+    def __init__(self, stageName):
+        self.stageName = stageName
+        self.wallTime = None
+        self.cpuTime = None
+        self.peakRss = None
+        self.bytesRead = None
+        self.bytesWritten = None
+        self.externalProcessTime = None
+        self.startState = None
+
+    def measureState(self):
+        selfUsage = resource.getrusage(resource.RUSAGE_SELF)
+        childrenUsage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        bytesRead, bytesWritten = readProcessIoCounters()
+        return time.time(), selfUsage.ru_utime + selfUsage.ru_stime, childrenUsage.ru_utime + childrenUsage.ru_stime, bytesRead, bytesWritten
+
+    def start(self):
+        self.startState = self.measureState()
+
+    def stop(self):
+        if self.startState is None:
+            raise StandardError, 'stage %s not started' % self.stageName
+        wallTime, cpuTime, externalProcessTime, bytesRead, bytesWritten = self.measureState()
+        self.wallTime = wallTime - self.startState[0]
+        self.cpuTime = cpuTime - self.startState[1]
+        self.externalProcessTime = externalProcessTime - self.startState[2]
+        if bytesRead is not None and self.startState[3] is not None:
+            self.bytesRead = bytesRead - self.startState[3]
+            self.bytesWritten = bytesWritten - self.startState[4]
+        self.peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+        return False
+
+    def getRowDict(self):
+        return dict([(columnHeader, getattr(self, columnHeader)) for columnHeader in self.columnHeaderList])
+
+
 class FastqcDataFrame(DataFrame):
 
     def __init__(self, columnHeaderList, description=None, result=None):
@@ -855,8 +1304,8 @@ Ranges are canonicalised to be ascending, therefore returned ranges are ascendin
         if self.exonerateModel != 'affine:local:dna2dna':
             raise StandardError('nucleotideAlignment is not supported for exonerate model "%s"' % self.exonerateModel)
         v = self.vulgar.split()
-        qAln = ''
-        tAln = ''
+        qAlnList = []
+        tAlnList = []
         vulgarLetterAnnotation = []
         qPos = 0
         tPos = 0
@@ -902,15 +1351,15 @@ Ranges are canonicalised to be ascending, therefore returned ranges are ascendin
             vTargetLength = int(v[i + 2])
             # logger.debug('qPos = %d, tPos = %d, vLabel = %s, vql = %d, vtl = %d', qPos, tPos, vLabel, vQueryLength, vTargetLength)
             if vLabel == 'M':
-                qAln = qAln + qAligned[qPos:(qPos + vQueryLength)]
-                tAln = tAln + tAligned[tPos:(tPos + vTargetLength)]
+                qAlnList.append(qAligned[qPos:(qPos + vQueryLength)])
+                tAlnList.append(tAligned[tPos:(tPos + vTargetLength)])
             elif vLabel == 'G':
                 if vQueryLength == 0:
-                    qAln = qAln + gapChar * vTargetLength
-                    tAln = tAln + tAligned[tPos:(tPos + vTargetLength)]
+                    qAlnList.append(gapChar * vTargetLength)
+                    tAlnList.append(tAligned[tPos:(tPos + vTargetLength)])
                 elif vTargetLength == 0:
-                    qAln = qAln + qAligned[qPos:(qPos + vQueryLength)]
-                    tAln = tAln + gapChar * vQueryLength
+                    qAlnList.append(qAligned[qPos:(qPos + vQueryLength)])
+                    tAlnList.append(gapChar * vQueryLength)
             else:
                 raise StandardError, 'unsupported VULGAR label: %s' % vLabel
             vLength = max(vQueryLength, vTargetLength)
@@ -936,11 +1385,15 @@ Ranges are canonicalised to be ascending, therefore returned ranges are ascendin
                 tRightFlank = tRightFlank + gapChar * rfDiff
             elif rfDiff < 0:
                 qRightFlank = qRightFlank + gapChar * (-rfDiff)
-            qAln = qLeftFlank + qAln + qRightFlank
-            tAln = tLeftFlank + tAln + tRightFlank
+            qAlnList.insert(0, qLeftFlank)
+            qAlnList.append(qRightFlank)
+            tAlnList.insert(0, tLeftFlank)
+            tAlnList.append(tRightFlank)
             vulgarLetterAnnotation = ([None] * len(qLeftFlank)) + vulgarLetterAnnotation + ([None] * len(qRightFlank))
         # logger.debug('len(qAln) = %d, len(tAln) = %d, len(vulgarLetterAnnotation) = %d', len(qAln), len(tAln), len(vulgarLetterAnnotation))
         # sys.stderr.write('len(qAln) = %d, len(tAln) = %d, len(vulgarLetterAnnotation) = %d\n' % (len(qAln), len(tAln), len(vulgarLetterAnnotation)))
+        qAln = ''.join(qAlnList)
+        tAln = ''.join(tAlnList)
         qAlnSeq = Bio.Seq.Seq(qAln, alphabet=Bio.Alphabet.Gapped(Bio.Alphabet.IUPAC.unambiguous_dna))
         tAlnSeq = Bio.Seq.Seq(tAln, alphabet=Bio.Alphabet.Gapped(self.targetAlignmentSeq.seq.alphabet))
         # FIXME: assuming standard translation table -- check whether exonerate supports setting table?
@@ -955,8 +1408,10 @@ Ranges are canonicalised to be ascending, therefore returned ranges are ascendin
         if self.exonerateModel != 'protein2genome:local':
             raise StandardError('proteinAlignment is not supported for exonerate model "%s"' % self.exonerateModel)
         v = self.vulgar.split()
-        qAln = ''
-        tAln = ''
+        qSeq = str(self.queryAlignmentSeq.seq)
+        tSeq = str(self.targetAlignmentSeq.seq)
+        qAlnList = []
+        tAlnList = []
         qPos = 0
         tPos = 0
         # logger.debug('queryAlignmentSeq: %d, targetAlignmentSeq: %d', len(self.queryAlignmentSeq), len(self.targetAlignmentSeq))
@@ -967,17 +1422,17 @@ Ranges are canonicalised to be ascending, therefore returned ranges are ascendin
             vTargetLength = int(v[i + 2])
             # logger.debug('qPos = %d, tPos = %d, vLabel = %s, vql = %d, vtl = %d', qPos, tPos, vLabel, vQueryLength, vTargetLength)
             if vLabel == 'M' or vLabel == 'S':
-                qAln = qAln + str(self.queryAlignmentSeq[qPos:(qPos + vQueryLength)].seq)
-                tAln = tAln + str(self.targetAlignmentSeq[tPos:(tPos + vTargetLength)].seq)
+                qAlnList.append(qSeq[qPos:(qPos + vQueryLength)])
+                tAlnList.append(tSeq[tPos:(tPos + vTargetLength)])
             elif vLabel == 'G':
                 if vQueryLength == 0:
                     if vTargetLength % 3 != 0:
                         raise StandardError('cannot process nucleotide gaps with length not a multiple of 3')
-                    qAln = qAln + gapChar * (vTargetLength / 3)
-                    tAln = tAln + str(self.targetAlignmentSeq[tPos:(tPos + vTargetLength)].seq)
+                    qAlnList.append(gapChar * (vTargetLength / 3))
+                    tAlnList.append(tSeq[tPos:(tPos + vTargetLength)])
                 elif vTargetLength == 0:
-                    qAln = qAln + str(self.queryAlignmentSeq[qPos:(qPos + vQueryLength)].seq)
-                    tAln = tAln + gapChar * (vQueryLength * 3)
+                    qAlnList.append(qSeq[qPos:(qPos + vQueryLength)])
+                    tAlnList.append(gapChar * (vQueryLength * 3))
             elif vLabel == '5' or vLabel == '3' or vLabel == 'I' or vLabel == 'F':
                 pass
             qPos = qPos + vQueryLength
@@ -988,8 +1443,8 @@ Ranges are canonicalised to be ascending, therefore returned ranges are ascendin
             # s = Bio.Seq.Seq(tAln, alphabet=Bio.Alphabet.Gapped(self.targetAlignmentSeq.seq.alphabet))
             # s3 = s[:(len(s) - len(s) % 3)]
             # logger.debug('tA_tr: %s%s', str(translateGapped(s3)), '' if len(s) == len(s3) else '.')
-        qAlnSeq = Bio.Seq.Seq(qAln, alphabet=Bio.Alphabet.Gapped(Bio.Alphabet.IUPAC.protein))
-        tAlnSeq = Bio.Seq.Seq(tAln, alphabet=Bio.Alphabet.Gapped(self.targetAlignmentSeq.seq.alphabet))
+        qAlnSeq = Bio.Seq.Seq(''.join(qAlnList), alphabet=Bio.Alphabet.Gapped(Bio.Alphabet.IUPAC.protein))
+        tAlnSeq = Bio.Seq.Seq(''.join(tAlnList), alphabet=Bio.Alphabet.Gapped(self.targetAlignmentSeq.seq.alphabet))
         # FIXME: assuming standard translation table -- check whether exonerate supports setting table?
         tAlnProt = translateGapped(tAlnSeq)
         return Bio.Align.MultipleSeqAlignment([Bio.SeqRecord.SeqRecord(qAlnSeq, id=self.queryAlignmentSeq.id), Bio.SeqRecord.SeqRecord(tAlnProt, id='%s_pep' % self.targetAlignmentSeq.id)])
@@ -1053,6 +1508,21 @@ class ExonerateRunner(object):
 
     labelledLineRe = re.compile('([A-Za-z][A-Za-z0-9_]*): (.*)')
     seqStartRe = re.compile('seqStart (.*)')
+    ryoFieldList = [
+        ('exonerateModel', str), ('queryId', str), ('queryDef', str), ('queryStrand', str),
+        ('queryAlignmentStart', int), ('queryAlignmentEnd', int), ('queryAlignmentLength', int),
+        ('queryCdsStart', int), ('queryCdsEnd', int), ('queryCdsLength', int),
+        ('targetId', str), ('targetDef', str), ('targetStrand', str),
+        ('targetAlignmentStart', int), ('targetAlignmentEnd', int), ('targetAlignmentLength', int),
+        ('targetCdsStart', int), ('targetCdsEnd', int), ('targetCdsLength', int),
+        ('rawScore', int), ('percentIdentity', float), ('percentSimilarity', float),
+        ('equivalencedTotal', int), ('equivalencedIdentity', int), ('equivalencedSimilarity', int), ('equivalencedMismatches', int),
+        ('vulgar', str)]
+    ryoSeqList = [
+        ('queryCdsSeq', 'queryCds', Bio.Alphabet.IUPAC.ambiguous_dna, 'qcds'),
+        ('queryAlignmentSeq', 'queryAlignment', Bio.Alphabet.IUPAC.protein, 'qaln'),
+        ('targetCdsSeq', 'targetCds', Bio.Alphabet.IUPAC.ambiguous_dna, 'tcds'),
+        ('targetAlignmentSeq', 'targetAlignment', Bio.Alphabet.IUPAC.ambiguous_dna, 'taln')]
 
     def __init__(self):
         # FIXME: consider setting this from environment?
@@ -1107,49 +1577,58 @@ class ExonerateRunner(object):
     def makeSeqId(self, exonerateResult, seqType):
         return('%s_%s_%s' % (exonerateResult.queryId, exonerateResult.targetId, seqType))
 
-    def parseExonerateResult(self, f, exonerateResult, targetSeqDict):
-        line = f.readline()
-        if line == '':
-            return None
-        if line.strip() != 'ryoStart':
-            raise StandardError('malformed input: ryoStart missing, got %s instead' % line.strip())
-        exonerateResult.exonerateModel = self.parseString(f, 'exonerateModel')
-        exonerateResult.queryId = self.parseString(f, 'queryId')
+    def setExonerateResultFields(self, exonerateResult, lineList, targetSeqDict):
+        """Set attributes of an L{ExonerateResult} from the lines of one ryo record.
+
+@param exonerateResult: the result to populate
+@type exonerateResult: L{ExonerateResult}
+@param lineList: the lines between C{ryoStart} and C{ryoEnd}, without line terminators
+@type lineList: C{list} of C{str}
+@param targetSeqDict: target sequences by ID
+@type targetSeqDict: C{dict}, or C{None}
+"""
+        if len(lineList) < len(self.ryoFieldList):
+            raise StandardError('unexpected end of record')
+        for i in xrange(len(self.ryoFieldList)):
+            label, fieldType = self.ryoFieldList[i]
+            w = lineList[i].split(': ', 1)
+            if len(w) != 2:
+                raise StandardError('malformed line (expected label %s): %s' % (label, lineList[i].strip()))
+            if w[0] != label:
+                raise StandardError('expected label %s but got %s' % (label, w[0]))
+            v = w[1].strip()
+            if fieldType is not str:
+                if v == 'NA':
+                    v = None
+                else:
+                    v = fieldType(v)
+            setattr(exonerateResult, label, v)
         if exonerateResult.queryId != exonerateResult.querySeq.id:
-            raise StandardError('result incompatible with query: querySeq.id = %s, exonerate queryId = %s' % (self.querySeq.id, exonerateResult.queryId))
-        exonerateResult.queryDef = self.parseString(f, 'queryDef')
-        exonerateResult.queryStrand = self.parseString(f, 'queryStrand')
-        exonerateResult.queryAlignmentStart = self.parseInt(f, 'queryAlignmentStart')
-        exonerateResult.queryAlignmentEnd = self.parseInt(f, 'queryAlignmentEnd')
-        exonerateResult.queryAlignmentLength = self.parseInt(f, 'queryAlignmentLength')
-        exonerateResult.queryCdsStart = self.parseInt(f, 'queryCdsStart')
-        exonerateResult.queryCdsEnd = self.parseInt(f, 'queryCdsEnd')
-        exonerateResult.queryCdsLength = self.parseInt(f, 'queryCdsLength')
-        exonerateResult.targetId = self.parseString(f, 'targetId')
+            raise StandardError('result incompatible with query: querySeq.id = %s, exonerate queryId = %s' % (exonerateResult.querySeq.id, exonerateResult.queryId))
         if targetSeqDict is not None:
             if exonerateResult.targetId not in targetSeqDict:
                 raise StandardError, 'found targetId %s but no corresponding sequence' % exonerateResult.targetId
             exonerateResult.targetSeq = targetSeqDict[exonerateResult.targetId]
-        exonerateResult.targetDef = self.parseString(f, 'targetDef')
-        exonerateResult.targetStrand = self.parseString(f, 'targetStrand')
-        exonerateResult.targetAlignmentStart = self.parseInt(f, 'targetAlignmentStart')
-        exonerateResult.targetAlignmentEnd = self.parseInt(f, 'targetAlignmentEnd')
-        exonerateResult.targetAlignmentLength = self.parseInt(f, 'targetAlignmentLength')
-        exonerateResult.targetCdsStart = self.parseInt(f, 'targetCdsStart')
-        exonerateResult.targetCdsEnd = self.parseInt(f, 'targetCdsEnd')
-        exonerateResult.targetCdsLength = self.parseInt(f, 'targetCdsLength')
-        exonerateResult.rawScore = self.parseInt(f, 'rawScore')
-        exonerateResult.percentIdentity = self.parseFloat(f, 'percentIdentity')
-        exonerateResult.percentSimilarity = self.parseFloat(f, 'percentSimilarity')
-        exonerateResult.equivalencedTotal = self.parseInt(f, 'equivalencedTotal')
-        exonerateResult.equivalencedIdentity = self.parseInt(f, 'equivalencedIdentity')
-        exonerateResult.equivalencedSimilarity = self.parseInt(f, 'equivalencedSimilarity')
-        exonerateResult.equivalencedMismatches = self.parseInt(f, 'equivalencedMismatches')
-        exonerateResult.vulgar = self.parseString(f, 'vulgar')
-        exonerateResult.queryCdsSeq = self.parseSeq(f, 'queryCds', Bio.Alphabet.IUPAC.ambiguous_dna, self.makeSeqId(exonerateResult, 'qcds'))
-        exonerateResult.queryAlignmentSeq = self.parseSeq(f, 'queryAlignment', Bio.Alphabet.IUPAC.protein, self.makeSeqId(exonerateResult, 'qaln'))
-        exonerateResult.targetCdsSeq = self.parseSeq(f, 'targetCds', Bio.Alphabet.IUPAC.ambiguous_dna, self.makeSeqId(exonerateResult, 'tcds'))
-        exonerateResult.targetAlignmentSeq = self.parseSeq(f, 'targetAlignment', Bio.Alphabet.IUPAC.ambiguous_dna, self.makeSeqId(exonerateResult, 'taln'))
+        i = len(self.ryoFieldList)
+        for attrName, label, alphabet, seqType in self.ryoSeqList:
+            if i >= len(lineList):
+                raise StandardError('unexpected end of record')
+            m = self.seqStartRe.match(lineList[i])
+            if m is None:
+                raise StandardError('malformed line (expected seqStart): %s' % lineList[i].strip())
+            if m.group(1) != label:
+                raise StandardError('expected sequence label %s but got %s' % (label, m.group(1)))
+            i = i + 1
+            seqStart = i
+            while i < len(lineList) and lineList[i] != 'seqEnd':
+                i = i + 1
+            if i == len(lineList):
+                raise StandardError('unexpected end of record')
+            seq = ''.join(lineList[seqStart:i])
+            i = i + 1
+            setattr(exonerateResult, attrName, Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(seq, alphabet), id=self.makeSeqId(exonerateResult, seqType)))
+        if i != len(lineList):
+            raise StandardError('malformed input: ryoEnd missing')
         if exonerateResult.exonerateModel == 'protein2genome:local':
             # FIXME: kludge -- throwing away rubbish output of exonerate, would be much better not to generate it in the first place
             # FIXME: would seem better to not include fields that don't apply and that exonerate populates with garbage
@@ -1162,11 +1641,51 @@ class ExonerateRunner(object):
             exonerateResult.targetCdsSeq = None
         else:
             raise StandardError('unsupported exonerate model: %s' % exonerateResult.exonerateModel)
-        line = self.nextLine(f)
-        if line.strip() != 'ryoEnd':
-            raise StandardError('malformed input: ryoEnd missing')
         return exonerateResult
 
+    def parseExonerateResult(self, f, exonerateResult, targetSeqDict):
+        line = f.readline()
+        if line == '':
+            return None
+        if line.strip() != 'ryoStart':
+            raise StandardError('malformed input: ryoStart missing, got %s instead' % line.strip())
+        lineList = []
+        line = self.nextLine(f)
+        while line != 'ryoEnd':
+            lineList.append(line)
+            line = self.nextLine(f)
+        return self.setExonerateResultFields(exonerateResult, lineList, targetSeqDict)
+
+    def parseExonerateResultStream(self, f, querySeq, targetFname, targetSeqDict):
+        """Generate L{ExonerateResult} instances from a stream of ryo records.
+
+Unlike repeated calls of C{parseExonerateResult}, this reads each
+record as a block of lines, using the file's buffered iteration.
+
+@param f: the stream to read
+@type f: C{file}
+@param querySeq: the query sequence
+@type querySeq: C{Bio.SeqRecord.SeqRecord}
+@param targetFname: the name of the FASTA sequence file containing the targets
+@type targetFname: C{str}
+@param targetSeqDict: target sequences by ID
+@type targetSeqDict: C{dict}, or C{None}
+"""
+        lineList = None
+        for line in f:
+            line = line.rstrip('\n')
+            if lineList is None:
+                if line.strip() != 'ryoStart':
+                    raise StandardError('malformed input: ryoStart missing, got %s instead' % line.strip())
+                lineList = []
+            elif line == 'ryoEnd':
+                yield self.setExonerateResultFields(ExonerateResult(querySeq, targetFname), lineList, targetSeqDict)
+                lineList = None
+            else:
+                lineList.append(line)
+        if lineList is not None:
+            raise StandardError('unexpected EOF')
+
     def parse(self, querySeq, targetFname, exonerateModel, bestn=None, minPercentIdentity=None, addRawTargetSeqs=False):
         """Run C{exonerate} and return a C{list} of C{ExonerateResult}s.
 
@@ -1201,26 +1720,11 @@ class ExonerateRunner(object):
                 exonerateArgv.extend(['--percent', '%f' % minPercentIdentity])
             exonerateArgv.extend(['--ryo', 'ryoStart\\nexonerateModel: %m\\nqueryId: %qi\\nqueryDef: %qd\\nqueryStrand: %qS\\nqueryAlignmentStart: %qab\\nqueryAlignmentEnd: %qae\\nqueryAlignmentLength: %qal\\nqueryCdsStart: NA\\nqueryCdsEnd: NA\\nqueryCdsLength: NA\\ntargetId: %ti\\ntargetDef: %td\\ntargetStrand: %tS\\ntargetAlignmentStart: %tab\\ntargetAlignmentEnd: %tae\\ntargetAlignmentLength: %tal\\ntargetCdsStart: %tcb\\ntargetCdsEnd: %tce\\ntargetCdsLength: %tcl\\nrawScore: %s\\npercentIdentity: %pi\\npercentSimilarity: %ps\\nequivalencedTotal: %et\\nequivalencedIdentity: %ei\\nequivalencedSimilarity: %es\\nequivalencedMismatches: %em\\nvulgar: %V\\nseqStart queryCds\\n%qcsseqEnd\\nseqStart queryAlignment\\n%qasseqEnd\\nseqStart targetCds\\n%tcsseqEnd\\nseqStart targetAlignment\\n%tasseqEnd\\nryoEnd\\n', queryScratchFname, targetFname])
             logger.debug('%s', ' '.join(exonerateArgv))
-            p = subprocess.Popen(exonerateArgv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-            pid = os.fork()
-            if pid == 0:
-                p.stdout.close()
-                # exonerate seems to be one of those stupid programs that don't read from stdin...
-                # p.stdin.write('%s\n' % querySr.format('fasta'))
-                p.stdin.close()
-                os._exit(0)
-            p.stdin.close()
-            exonerateResultList = []
-            exonerateResult = self.parseExonerateResult(p.stdout, ExonerateResult(querySeq, targetFname), targetSeqDict)
-            while exonerateResult is not None:
-                exonerateResultList.append(exonerateResult)
-                exonerateResult = self.parseExonerateResult(p.stdout, ExonerateResult(querySeq, targetFname), targetSeqDict)
+            # exonerate does not read from stdin, the query is passed in the scratch file
+            with open(os.devnull, 'r') as devnullFile:
+                p = subprocess.Popen(exonerateArgv, stdin=devnullFile, stdout=subprocess.PIPE, close_fds=True)
+            exonerateResultList = list(self.parseExonerateResultStream(p.stdout, querySeq, targetFname, targetSeqDict))
             p.stdout.close()
-            wPid, wExit = os.waitpid(pid, 0)
-            if pid != wPid:
-                raise StandardError('wait returned pid %s (expected %d)' % (wPid, pid))
-            if wExit != 0:
-                raise StandardError('wait on forked process returned %d' % wExit)
             r = p.wait()
             if r != 0:
                 raise StandardError('exonerate process exited with %d' % r)
@@ -1318,83 +1822,95 @@ the caller's responsibility to close it.
 
 
 def alignMerge(pairwiseAlignmentList):
+    """Merge pairwise alignments against a common reference into a star alignment.
+
+Insertions relative to the reference are left justified within the
+merged alignment. An insertion length table (maximal number of inserted
+columns before each reference position) is computed first, so each row
+of the merged alignment is allocated once and filled in a single pass.
+Reference symbols are converted to lower case.
+
+@param pairwiseAlignmentList: pairwise alignments, with the reference as the first row
+@type pairwiseAlignmentList: C{list} of C{Bio.Align.MultipleSeqAlignment}
+@return: the merged alignment, with the reference as the first row
+@rtype: C{Bio.Align.MultipleSeqAlignment}
+"""
     gapChar = '-'
     alphabet = pairwiseAlignmentList[0][0].seq.alphabet
     refId  = pairwiseAlignmentList[0][0].id
-    refseqList = []
-    otherseqList = []
-    refSymbolSeq = []
-    otherSymbolSeqList = []
-    vulgarLetterAnnotationList = []
-    staralignLetterAnnotationList = []
-    for i in xrange(len(pairwiseAlignmentList)):
-        if 'vulgar' in pairwiseAlignmentList[i][1].letter_annotations:
-            vulgarLetterAnnotationList.append([])
-        else:
-            vulgarLetterAnnotationList.append(None)
-        staralignLetterAnnotationList.append([])
-    for pairwiseAlignment in pairwiseAlignmentList:
-        refseqList.append(str(pairwiseAlignment[0].seq))
-        otherseqList.append(str(pairwiseAlignment[1].seq))
-        otherSymbolSeqList.append([])
-    i = [0] * len(pairwiseAlignmentList)
-    while max([len(refseqList[n]) - i[n] for n in xrange(len(pairwiseAlignmentList))]) > 0:
-        refGap = False
-        refSym = None
-        refSymAlignIndex = None
-        for n in xrange(len(pairwiseAlignmentList)):
-            # sys.stderr.write('n = %d, i[n] = %d, l = %d\n' % (n, i[n], len(refseqList[n])))
-            if i[n] == len(refseqList[n]):
-                r  = gapChar
-                # Bio.AlignIO.write(pairwiseAlignmentList[n], sys.stderr, 'fasta')
-            else:
-                r = refseqList[n][i[n]].lower()
+    refseqList = [str(pairwiseAlignment[0].seq) for pairwiseAlignment in pairwiseAlignmentList]
+    otherseqList = [str(pairwiseAlignment[1].seq) for pairwiseAlignment in pairwiseAlignmentList]
+    refUngapped = refseqList[0].replace(gapChar, '').lower()
+    refLength = len(refUngapped)
+    # maxInsertionLengthList[p]: maximal number of reference gap columns before reference position p, p == refLength for trailing insertions
+    maxInsertionLengthList = [0] * (refLength + 1)
+    for n in xrange(len(pairwiseAlignmentList)):
+        refseq = refseqList[n]
+        nUngapped = refseq.replace(gapChar, '').lower()
+        if nUngapped != refUngapped:
+            p = 0
+            while p < min(len(nUngapped), refLength) and nUngapped[p] == refUngapped[p]:
+                p = p + 1
+            if p < min(len(nUngapped), refLength):
+                raise StandardError, 'reference sequences inconsistent, found symbols %s (%s:%d) and %s (%s:%d)' % (refUngapped[p], pairwiseAlignmentList[0][1].id, 0, nUngapped[p], pairwiseAlignmentList[n][1].id, n)
+            raise StandardError, 'reference sequences inconsistent, found lengths %d (%s:%d) and %d (%s:%d)' % (refLength, pairwiseAlignmentList[0][1].id, 0, len(nUngapped), pairwiseAlignmentList[n][1].id, n)
+        p = 0
+        k = 0
+        for r in refseq:
             if r == gapChar:
-                refGap = True
-            elif refSym is None:
-                refSym = r
-                refSymAlignIndex = n
+                k = k + 1
             else:
-                if r != refSym:
-                    raise StandardError, 'reference sequences inconsistent, found symbols %s (%s:%d) and %s (%s:%d)' % (refSym, pairwiseAlignmentList[refSymAlignIndex][1].id, refSymAlignIndex, r, pairwiseAlignmentList[n][1].id, n)
-        if refGap:
-            refSymbolSeq.append(gapChar)
-            for n in xrange(len(pairwiseAlignmentList)):
-                if i[n] ==len(otherseqList[n]):
-                    otherSymbolSeqList[n].append(gapChar)
-                    vulgarLetterAnnotationList[n].append(None)
-                    staralignLetterAnnotationList[n].append(None)
-                else:
-                    if refseqList[n][i[n]] == gapChar:
-                        otherSymbolSeqList[n].append(otherseqList[n][i[n]])
-                        if 'vulgar' in pairwiseAlignmentList[n][1].letter_annotations:
-                            vulgarLetterAnnotationList[n].append(pairwiseAlignmentList[n][1].letter_annotations['vulgar'][i[n]])
-                        staralignLetterAnnotationList[n].append(i[n])
-                        i[n] = i[n] + 1
-                    elif refseqList[n][i[n]].lower() == refSym:
-                        otherSymbolSeqList[n].append(gapChar)
-                        if 'vulgar' in pairwiseAlignmentList[n][1].letter_annotations:
-                            vulgarLetterAnnotationList[n].append(None)
-                        staralignLetterAnnotationList[n].append(None)
-                    else:
-                        raise StandardError, 'weird: refSym = %s, refseqsym = %s, n = %d, i[n] = %d, id = %s' % (refSym, refseqList[n][i[n]], n, i[n], pairwiseAlignmentList[n][1].id)
-        else:
-            refSymbolSeq.append(refSym)
-            for n in xrange(len(pairwiseAlignmentList)):
-                otherSymbolSeqList[n].append(otherseqList[n][i[n]])
-                if 'vulgar' in pairwiseAlignmentList[n][1].letter_annotations:
-                    vulgarLetterAnnotationList[n].append(pairwiseAlignmentList[n][1].letter_annotations['vulgar'][i[n]])
-                staralignLetterAnnotationList[n].append(i[n])
-                i[n] = i[n] + 1
+                if k > maxInsertionLengthList[p]:
+                    maxInsertionLengthList[p] = k
+                p = p + 1
+                k = 0
+        if k > maxInsertionLengthList[p]:
+            maxInsertionLengthList[p] = k
+    # slotStartList[p]: merged column of the first insertion before reference position p,
+    # the reference symbol itself is at slotStartList[p] + maxInsertionLengthList[p]
+    slotStartList = [0] * (refLength + 1)
+    c = 0
+    for p in xrange(refLength + 1):
+        slotStartList[p] = c
+        c = c + maxInsertionLengthList[p] + 1
+    mergedLength = c - 1
+    refSymbolSeq = [gapChar] * mergedLength
+    for p in xrange(refLength):
+        refSymbolSeq[slotStartList[p] + maxInsertionLengthList[p]] = refUngapped[p]
     refSr = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(''.join(refSymbolSeq), alphabet=alphabet), id='%s_ref' % refId)
     srList = [refSr]
     # sys.stderr.write('ref. %s: length: %d\n' % (refSr.id, len(refSr)))
     for n in xrange(len(pairwiseAlignmentList)):
+        refseq = refseqList[n]
+        otherseq = otherseqList[n]
+        otherSr = pairwiseAlignmentList[n][1]
+        if 'vulgar' in otherSr.letter_annotations:
+            vulgar = otherSr.letter_annotations['vulgar']
+            vulgarLetterAnnotation = [None] * mergedLength
+        else:
+            vulgar = None
+            vulgarLetterAnnotation = None
+        otherSymbolSeq = [gapChar] * mergedLength
+        staralignLetterAnnotation = [None] * mergedLength
+        p = 0
+        k = 0
+        for i in xrange(len(refseq)):
+            if refseq[i] == gapChar:
+                c = slotStartList[p] + k
+                k = k + 1
+            else:
+                c = slotStartList[p] + maxInsertionLengthList[p]
+                p = p + 1
+                k = 0
+            otherSymbolSeq[c] = otherseq[i]
+            staralignLetterAnnotation[c] = i
+            if vulgar is not None:
+                vulgarLetterAnnotation[c] = vulgar[i]
         letter_annotations = {}
-        if vulgarLetterAnnotationList[n] is not None:
-            letter_annotations['vulgar'] = vulgarLetterAnnotationList[n]
-        letter_annotations['staralign'] = staralignLetterAnnotationList[n]
-        sr = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(''.join(otherSymbolSeqList[n]), alphabet=alphabet), id='%s_%05d' % (pairwiseAlignmentList[n][1].id, n), letter_annotations = letter_annotations)
+        if vulgarLetterAnnotation is not None:
+            letter_annotations['vulgar'] = vulgarLetterAnnotation
+        letter_annotations['staralign'] = staralignLetterAnnotation
+        sr = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(''.join(otherSymbolSeq), alphabet=alphabet), id='%s_%05d' % (otherSr.id, n), letter_annotations = letter_annotations)
         # sys.stderr.write('%s: length %d\n' % (sr.id, len(sr)))
         srList.append(sr)
     # Bio.SeqIO.write(srList, sys.stderr, 'fasta')
@@ -1402,33 +1918,96 @@ def alignMerge(pairwiseAlignmentList):
 
 
 class ExonerateStarAlignment(object):
+    """Star alignment of sequences around a reference, computed with C{exonerate}.
+
+The reference is aligned to all sequences in the FASTA file by one
+C{exonerate} run, or by C{numJobs} parallel runs on partitions of
+the sequences, and the best alignment for each target is retained.
+
+@ivar reference: the reference sequence
+@type reference: C{Bio.SeqRecord.SeqRecord}
+@ivar fastaFname: name of FASTA file containing the sequences to align to the reference
+@type fastaFname: C{str}
+@ivar numJobs: number of C{exonerate} processes to run in parallel
+@type numJobs: C{int}
+@ivar xstarAlignment: the star alignment
+@type xstarAlignment: C{Bio.Align.MultipleSeqAlignment}
+"""
 
-    def __init__(self, reference, fastaFname):
+    def __init__(self, reference, fastaFname, numJobs=1):
         self.reference = reference
         self.fastaFname = fastaFname
+        self.numJobs = numJobs
         self.xstarAlignment = None
         self.makeStarAlignment()
 
-    def makeExonerateResult(self, seqRecord, exonerateRunner):
-        tmpFastaFd, tmpFastaFname = tempfile.mkstemp('.fasta', 'xstar', '.')
+    def makeExonerateResult(self, targetFname, exonerateRunner):
+        # no bestn here, as that applies to all targets collectively, best alignment per target is selected by makeBestExonerateResultList
+        return exonerateRunner.parse(self.reference, targetFname, 'affine:local', addRawTargetSeqs=True)
+
+    def runExonerateJob(self, targetFname, exonerateRunner, jobResultList, jobIndex):
         try:
-            with os.fdopen(tmpFastaFd, 'w') as tmpFastaFile:
-                Bio.SeqIO.write([seqRecord], tmpFastaFile, 'fasta')
-            # only best alignment for now, extending to multiple local alignments will require name fiddling...
-            exonerateResultList = exonerateRunner.parse(self.reference, tmpFastaFname, 'affine:local', bestn=1, addRawTargetSeqs=True)
+            jobResultList[jobIndex] = self.makeExonerateResult(targetFname, exonerateRunner)
         except StandardError as e:
-            raise e
+            jobResultList[jobIndex] = e
+
+    def makeExonerateResultListParallel(self, exonerateRunner):
+        tmpFastaFnameList = []
+        jobResultList = [None] * self.numJobs
+        try:
+            tmpFastaFileList = []
+            for i in xrange(self.numJobs):
+                tmpFastaFd, tmpFastaFname = tempfile.mkstemp('.fasta', 'xstar', '.')
+                tmpFastaFnameList.append(tmpFastaFname)
+                tmpFastaFileList.append(os.fdopen(tmpFastaFd, 'w'))
+            n = 0
+            for seqRecord in Bio.SeqIO.parse(self.fastaFname, 'fasta'):
+                Bio.SeqIO.write([seqRecord], tmpFastaFileList[n % self.numJobs], 'fasta')
+                n = n + 1
+            for tmpFastaFile in tmpFastaFileList:
+                tmpFastaFile.close()
+            threadList = []
+            for i in xrange(min(n, self.numJobs)):
+                t = threading.Thread(target=self.runExonerateJob, args=(tmpFastaFnameList[i], exonerateRunner, jobResultList, i))
+                t.start()
+                threadList.append(t)
+            for t in threadList:
+                t.join()
         finally:
-            # FIXME: check keepTmp when moving this into pypaftol
-            os.unlink(tmpFastaFname)
-            pass
+            for tmpFastaFname in tmpFastaFnameList:
+                if paftol.keepTmp:
+                    logger.warning('not deleting temporary file %s', tmpFastaFname)
+                else:
+                    os.unlink(tmpFastaFname)
+        exonerateResultList = []
+        for jobResult in jobResultList:
+            if isinstance(jobResult, StandardError):
+                raise jobResult
+            if jobResult is not None:
+                exonerateResultList.extend(jobResult)
         return exonerateResultList
 
+    def makeBestExonerateResultList(self, exonerateResultList):
+        """Select the highest scoring result for each target, in the order of targets in the FASTA file.
+"""
+        bestExonerateResultDict = {}
+        for exonerateResult in exonerateResultList:
+            targetId = exonerateResult.targetId
+            if targetId not in bestExonerateResultDict or exonerateResult.rawScore > bestExonerateResultDict[targetId].rawScore:
+                bestExonerateResultDict[targetId] = exonerateResult
+        bestExonerateResultList = []
+        for seqRecord in Bio.SeqIO.parse(self.fastaFname, 'fasta'):
+            if seqRecord.id in bestExonerateResultDict:
+                bestExonerateResultList.append(bestExonerateResultDict[seqRecord.id])
+        return bestExonerateResultList
+
     def makeStarAlignment(self):
         exonerateRunner = ExonerateRunner()
-        exonerateResultList = []
-        for seqRecord in Bio.SeqIO.parse(self.fastaFname, 'fasta'):
-            exonerateResultList.extend(self.makeExonerateResult(seqRecord, exonerateRunner))
+        if self.numJobs > 1:
+            exonerateResultList = self.makeExonerateResultListParallel(exonerateRunner)
+        else:
+            exonerateResultList = self.makeExonerateResult(self.fastaFname, exonerateRunner)
+        exonerateResultList = self.makeBestExonerateResultList(exonerateResultList)
         # sys.stderr.write('got %d exonerate results\n')
         exonerateResultList.sort(lambda e1, e2: cmp(e1.queryAlignmentStart, e2.queryAlignmentStart))
         pairwiseAlignmentList = [er.nucleotideAlignment(appendFlanking=True) for er in exonerateResultList]
@@ -1488,6 +2067,61 @@ class ExonerateStarAlignment(object):
         epsFile.write('%%EOF\n')
 
 
+class TarArchiver(object):
+    """Archive directories into tar files in process, using the C{tarfile} module.
+
+@ivar compression: compression codec, C{'gz'}, C{'bz2'} or C{None} for an uncompressed archive
+@type compression: C{str}
+@ivar compressLevel: compression level (1 to 9), C{None} for the codec's default
+@type compressLevel: C{int}
+@ivar excludePatternList: shell style patterns of files and directories to exclude, matched
+    against both the base name and the path within the archive
+@type excludePatternList: C{list} of C{str}
+"""
+
+    compressionList = ['gz', 'bz2']
+
+    def __init__(self, compression='gz', compressLevel=None, excludePatternList=None):
+        if compression is not None and compression not in self.compressionList:
+            raise StandardError, 'unsupported compression: %s' % compression
+        self.compression = compression
+        self.compressLevel = compressLevel
+        if excludePatternList is None:
+            self.excludePatternList = []
+        else:
+            self.excludePatternList = excludePatternList[:]
+
+    def isExcluded(self, archivePath):
+        basename = os.path.basename(archivePath)
+        for excludePattern in self.excludePatternList:
+            if fnmatch.fnmatch(basename, excludePattern) or fnmatch.fnmatch(archivePath, excludePattern):
+                return True
+        return False
+
+    def filterTarinfo(self, tarinfo):
+        if self.isExcluded(tarinfo.name):
+            logger.debug('excluding %s from archive', tarinfo.name)
+            return None
+        return tarinfo
+
+    def archive(self, tarFname, dirname, arcname=None):
+        if self.compression is None:
+            mode = 'w'
+            kwargs = {}
+        else:
+            mode = 'w:%s' % self.compression
+            kwargs = {}
+            if self.compressLevel is not None:
+                kwargs['compresslevel'] = self.compressLevel
+        if arcname is None:
+            arcname = os.path.basename(dirname)
+        tarFile = tarfile.open(tarFname, mode, **kwargs)
+        try:
+            tarFile.add(dirname, arcname, filter=self.filterTarinfo)
+        finally:
+            tarFile.close()
+
+
 class TrimmomaticRunner(object):
 
     def __init__(self, numThreads=None, leadingQuality=None, trailingQuality=None, minLength=None, slidingWindowSize=None, slidingWindowQuality=None, adapterFname=None):
@@ -1499,7 +2133,7 @@ class TrimmomaticRunner(object):
         self.slidingWindowQuality = slidingWindowQuality
         self.adapterFname = adapterFname
 
-    def runTrimmomaticPaired(self, forwardReadsFname, reverseReadsFname, forwardPairedFname, reversePairedFname, forwardUnpairedFname, reverseUnpairedFname, trimlogFname=None, workDirname=None):
+    def trimmomaticPairedArgv(self, forwardReadsFname, reverseReadsFname, forwardPairedFname, reversePairedFname, forwardUnpairedFname, reverseUnpairedFname, trimlogFname=None):
         if (self.slidingWindowSize is None and self.slidingWindowQuality is not None) or (self.slidingWindowSize is not None and self.slidingWindowQuality is None):
             raise StandardError, 'must specify both slidingWindowSize and slidingWindowQuality or neither'
         trimmomaticArgv = ['TrimmomaticPE']
@@ -1520,8 +2154,23 @@ class TrimmomaticRunner(object):
             trimmomaticArgv.append('SLIDINGWINDOW:%d:%d' % (self.slidingWindowSize, self.slidingWindowQuality))
         if self.minLength is not None:
             trimmomaticArgv.append('MINLEN:%d' % self.minLength)
+        return trimmomaticArgv
+
+    def startTrimmomaticPaired(self, forwardReadsFname, reverseReadsFname, forwardPairedFname, reversePairedFname, forwardUnpairedFname, reverseUnpairedFname, trimlogFname=None, workDirname=None):
+        """Start trimmomatic without waiting for it to finish.
+
+This permits the paired output files to be FIFOs that are read while
+trimmomatic runs.
+
+@return: the trimmomatic process and its command line
+@rtype: C{tuple}
+"""
+        trimmomaticArgv = self.trimmomaticPairedArgv(forwardReadsFname, reverseReadsFname, forwardPairedFname, reversePairedFname, forwardUnpairedFname, reverseUnpairedFname, trimlogFname)
         logger.debug('%s', ' '.join(trimmomaticArgv))
-        trimmomaticProcess = subprocess.Popen(trimmomaticArgv, cwd=workDirname)
+        return subprocess.Popen(trimmomaticArgv, cwd=workDirname), trimmomaticArgv
+
+    def runTrimmomaticPaired(self, forwardReadsFname, reverseReadsFname, forwardPairedFname, reversePairedFname, forwardUnpairedFname, reverseUnpairedFname, trimlogFname=None, workDirname=None):
+        trimmomaticProcess, trimmomaticArgv = self.startTrimmomaticPaired(forwardReadsFname, reverseReadsFname, forwardPairedFname, reversePairedFname, forwardUnpairedFname, reverseUnpairedFname, trimlogFname, workDirname)
         returncode = trimmomaticProcess.wait()
         if returncode != 0:
             raise StandardError('trimmomatic process "%s" exited with %d' % (' '.join(trimmomaticArgv), returncode))
@@ -1558,8 +2207,10 @@ Parameters correspond to instance variables, see their documentation.
     def indexReferenceArgv(self, referenceFname):
         return ['bwa', 'index', referenceFname]
 
-    def mappingMemArgv(self, referenceFname, forwardReadsFname, reverseReadsFname=None):
+    def mappingMemArgv(self, referenceFname, forwardReadsFname, reverseReadsFname=None, interleaved=False):
         argv = ['bwa', 'mem', '-M']
+        if interleaved:
+            argv.append('-p')
         if self.minSeedLength is not None:
             argv.extend(['-k', '%d' % self.minSeedLength])
         if self.reseedTrigger is not None:
@@ -1589,7 +2240,7 @@ necessary.
         logger.debug('%s', ' '.join(bwaIndexArgv))
         subprocess.check_call(bwaIndexArgv)
 
-    def processBwa(self, samAlignmentProcessor, referenceFname, forwardReadsFname, reverseReadsFname=None):
+    def processBwa(self, samAlignmentProcessor, referenceFname, forwardReadsFname, reverseReadsFname=None, indexReference=True):
         """Process reads mapped to to reference sequences.
 
 This method runs C{bwa} with the reference sequence, forwards reads
@@ -1601,6 +2252,11 @@ In other words, by implementing a C{processSamAlignment} method, a
 class is of a suitable "duck type" to be used as a
 C{samAlignmentProcessor}.
 
+By default, the reference is indexed before mapping. Callers that map
+several samples concurrently should index the reference once (see
+L{indexReference}) and set C{indexReference} to C{False}, so that the
+index files are not rewritten while other mappings read them.
+
 @param samAlignmentProcessor: the object for processing SAM alignments
 @type samAlignmentProcessor: object of suitable "duck type"
 @param referenceFname: name of the reference sequence file (FASTA format)
@@ -1609,16 +2265,63 @@ C{samAlignmentProcessor}.
 @type forwardReadsFname: C{str}
 @param reverseReadsFname: name of the reverse reads file (FASTQ format)
 @type reverseReadsFname: C{str}, or C{None}
+@param indexReference: whether to index the reference before mapping
+@type indexReference: C{bool}
 """
         sys.stderr.write('effective mapReadsBwa logging level: %d\n' % logger.getEffectiveLevel())
         logger.debug('mapping reads to gene sequences')
-        self.indexReference(referenceFname)
+        if indexReference:
+            self.indexReference(referenceFname)
         bwaArgv = self.mappingMemArgv(referenceFname, forwardReadsFname, reverseReadsFname)
         logger.debug('%s', ' '.join(bwaArgv))
         bwaProcess = subprocess.Popen(bwaArgv, stdout=subprocess.PIPE, cwd=self.workingDirectory)
         # samtoolsArgv = ['samtools', 'view', '-h', '-S', '-F', '4', '-']
         # logger.debug('%s', ' '.join(samtoolsArgv))
         # samtoolsProcess = subprocess.Popen(samtoolsArgv, stdin=bwaProcess.stdout.fileno(), stdout=subprocess.PIPE, cwd = self.workingDirectory)
+        self.processSamOutput(samAlignmentProcessor, bwaProcess, bwaArgv)
+
+    def processBwaInterleaved(self, samAlignmentProcessor, referenceFname, writeInterleavedReads, indexReference=True):
+        """Process paired reads streamed to C{bwa mem} as interleaved FASTQ.
+
+The reads are written to C{bwa}'s standard input by C{writeInterleavedReads},
+which is called with the input file in a separate thread, while SAM
+alignments are processed as C{bwa} emits them. See L{processBwa} for
+the C{samAlignmentProcessor} and indexing of the reference.
+
+@param writeInterleavedReads: function writing interleaved FASTQ to a file
+@param indexReference: whether to index the reference before mapping
+@type indexReference: C{bool}
+"""
+        if indexReference:
+            self.indexReference(referenceFname)
+        bwaArgv = self.mappingMemArgv(referenceFname, '-', interleaved=True)
+        logger.debug('%s', ' '.join(bwaArgv))
+        bwaProcess = subprocess.Popen(bwaArgv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=self.workingDirectory)
+        errorList = []
+
+        def writeReads():
+            try:
+                writeInterleavedReads(bwaProcess.stdin)
+            except Exception as e:
+                errorList.append(e)
+            finally:
+                bwaProcess.stdin.close()
+
+        writerThread = threading.Thread(target=writeReads)
+        writerThread.start()
+        try:
+            self.processSamOutput(samAlignmentProcessor, bwaProcess, bwaArgv)
+        except:
+            # unblock the writer thread
+            if bwaProcess.poll() is None:
+                bwaProcess.kill()
+            raise
+        finally:
+            writerThread.join()
+        if len(errorList) > 0:
+            raise StandardError('streaming reads to bwa failed: %s' % str(errorList[0]))
+
+    def processSamOutput(self, samAlignmentProcessor, bwaProcess, bwaArgv):
         samLine = bwaProcess.stdout.readline()
         while samLine != '':
             # logger.debug(samLine)
@@ -1689,6 +2392,10 @@ default to be used.
 @type evalue: C{float}, or C{None}
 @ivar windowSize: multiple hits window size
 @type windowSize: C{int}, or C{None}
+@ivar pipeFastaToMakeblastdb: if C{True}, C{indexFastqDatabase} pipes FASTA into C{makeblastdb} rather than writing a FASTA file
+@type pipeFastaToMakeblastdb: C{bool}
+@ivar databaseStoreDirname: directory for keeping databases made from FASTQ files across runs, keyed by the FASTQ file's MD5 digest
+@type databaseStoreDirname: C{str}, or C{None} to not keep databases
 """
     def __init__(self, numThreads, gapOpen, gapExtend, maxTargetSeqs, numAlignments, maxHsps, evalue, windowSize):
         self.numThreads = numThreads
@@ -1699,12 +2406,90 @@ default to be used.
         self.maxHsps = maxHsps
         self.evalue = evalue
         self.windowSize = windowSize
+        self.pipeFastaToMakeblastdb = False
+        self.databaseStoreDirname = None
 
     def indexDatabase(self, databaseFname, dbtype):
         makeblastdbArgv = ['makeblastdb', '-dbtype', dbtype, '-in', databaseFname, '-parse_seqids']
         logger.debug('%s', ' '.join(makeblastdbArgv))
         makeblastdbProcess = subprocess.check_call(makeblastdbArgv)
 
+    def indexFastqDatabase(self, fastqFname, databaseFname, dbtype):
+        """Make a BLAST database named C{databaseFname} from the reads in a FASTQ file.
+
+If C{pipeFastaToMakeblastdb} is set, the converted reads are written
+to the standard input of C{makeblastdb} and no FASTA file is created,
+otherwise a FASTA file C{databaseFname} is written and indexed.
+
+@param fastqFname: name of the FASTQ file, may be gzipped
+@type fastqFname: C{str}
+@param databaseFname: name of the database
+@type databaseFname: C{str}
+@param dbtype: the database type (C{makeblastdb -dbtype})
+@type dbtype: C{str}
+"""
+        if not self.pipeFastaToMakeblastdb:
+            fastqToFasta(fastqFname, databaseFname)
+            BlastRunner.indexDatabase(self, databaseFname, dbtype)
+            return
+        makeblastdbArgv = ['makeblastdb', '-dbtype', dbtype, '-in', '-', '-out', databaseFname, '-title', databaseFname, '-parse_seqids']
+        logger.debug('%s', ' '.join(makeblastdbArgv))
+        p = subprocess.Popen(makeblastdbArgv, stdin=subprocess.PIPE)
+        try:
+            with openMaybeGzipped(fastqFname) as fastqFile:
+                writeFastqAsFasta(fastqFile, p.stdin)
+        finally:
+            p.stdin.close()
+            r = p.wait()
+        if r != 0:
+            raise StandardError, 'makeblastdb process exited with %d' % r
+
+    def makeFastqDatabase(self, fastqFname, databaseFname, dbtype):
+        """Provide a BLAST database of the reads in a FASTQ file.
+
+Without a database store, the database is made as C{databaseFname}.
+With a store, a database previously made from a FASTQ file with the
+same MD5 digest is reused, and a new one is made in the store otherwise.
+Databases are built in a temporary directory in the store which is
+then renamed, so concurrent runs never see incomplete databases.
+
+@param fastqFname: name of the FASTQ file, may be gzipped
+@type fastqFname: C{str}
+@param databaseFname: name of the database to make if no store is used
+@type databaseFname: C{str}
+@param dbtype: the database type (C{makeblastdb -dbtype})
+@type dbtype: C{str}
+@return: the name of the database, to be passed to the BLAST program
+@rtype: C{str}
+"""
+        if self.databaseStoreDirname is None:
+            BlastRunner.indexFastqDatabase(self, fastqFname, databaseFname, dbtype)
+            return databaseFname
+        storeDatabaseDirname = os.path.join(self.databaseStoreDirname, '%s-%s' % (md5HexdigestFromFile(fastqFname), dbtype))
+        storeDatabaseFname = os.path.join(storeDatabaseDirname, 'reads')
+        if os.path.isdir(storeDatabaseDirname):
+            logger.debug('reusing database %s for %s', storeDatabaseFname, fastqFname)
+            return storeDatabaseFname
+        if not os.path.isdir(self.databaseStoreDirname):
+            os.makedirs(self.databaseStoreDirname)
+        tmpDatabaseDirname = tempfile.mkdtemp('.tmp', 'blastdb', self.databaseStoreDirname)
+        try:
+            tmpDatabaseFname = os.path.join(tmpDatabaseDirname, 'reads')
+            BlastRunner.indexFastqDatabase(self, fastqFname, tmpDatabaseFname, dbtype)
+            if os.path.exists(tmpDatabaseFname):
+                # FASTA file is not needed with -parse_seqids
+                os.unlink(tmpDatabaseFname)
+            try:
+                os.rename(tmpDatabaseDirname, storeDatabaseDirname)
+            except OSError:
+                if not os.path.isdir(storeDatabaseDirname):
+                    raise
+                logger.debug('database %s stored concurrently', storeDatabaseFname)
+        finally:
+            if os.path.isdir(tmpDatabaseDirname):
+                shutil.rmtree(tmpDatabaseDirname)
+        return storeDatabaseFname
+
     def makeBlastArgv(self, blastProgram, databaseFname):
         blastArgv = [blastProgram]
         if self.numThreads is not None:
@@ -1781,6 +2566,12 @@ class BlastnRunner(BlastRunner):
     def indexDatabase(self, databaseFname):
         super(BlastnRunner, self).indexDatabase(databaseFname, 'nucl')
 
+    def indexFastqDatabase(self, fastqFname, databaseFname):
+        super(BlastnRunner, self).indexFastqDatabase(fastqFname, databaseFname, 'nucl')
+
+    def makeFastqDatabase(self, fastqFname, databaseFname):
+        return super(BlastnRunner, self).makeFastqDatabase(fastqFname, databaseFname, 'nucl')
+
     def processBlast(self, blastAlignmentProcessor, databaseFname, queryList):
         logger.debug('BlastnRunner.processBlast')
         super(BlastnRunner, self).processBlast('blastn', blastAlignmentProcessor, databaseFname, queryList)
@@ -1796,22 +2587,95 @@ class TblastnRunner(BlastRunner):
     def indexDatabase(self, databaseFname):
         super(TblastnRunner, self).indexDatabase(databaseFname, 'nucl')
 
+    def indexFastqDatabase(self, fastqFname, databaseFname):
+        super(TblastnRunner, self).indexFastqDatabase(fastqFname, databaseFname, 'nucl')
+
+    def makeFastqDatabase(self, fastqFname, databaseFname):
+        return super(TblastnRunner, self).makeFastqDatabase(fastqFname, databaseFname, 'nucl')
+
     def processTblastn(self, blastAlignmentProcessor, databaseFname, queryList):
         super(TblastnRunner, self).processBlast('tblastn', blastAlignmentProcessor, databaseFname, queryList)
 
 
+class TopScoringSelection(object):
+    """Retain the items with the highest scores among a stream of items.
+
+Items are added under keys, and at most C{maxNumKeys} keys are retained.
+All items added under a key are retained or discarded together, the
+score of a key is the highest score of its items. Among keys with equal
+scores, those added first are retained. Memory use depends on
+C{maxNumKeys} rather than on the number of items added.
+
+@ivar maxNumKeys: the maximal number of keys retained
+@type maxNumKeys: C{int}
+@ivar numDiscardedKeys: the number of times a key has been discarded so far
+@type numDiscardedKeys: C{int}
+"""
+
+    def __init__(self, maxNumKeys):
+        if maxNumKeys < 1:
+            raise StandardError, 'illegal maxNumKeys: %d' % maxNumKeys
+        self.maxNumKeys = maxNumKeys
+        self.numDiscardedKeys = 0
+        self.keyEntryDict = {}
+        self.entryHeap = []
+        self.numAddedKeys = 0
+
+    def isCurrentEntry(self, heapEntry):
+        score, negativeSerial, key = heapEntry
+        keyEntry = self.keyEntryDict.get(key)
+        return keyEntry is not None and keyEntry[0] == score and keyEntry[1] == -negativeSerial
+
+    def add(self, key, score, item):
+        """Add an item.
+
+@param key: the key of the item
+@param score: the score of the item, any comparable value
+@param item: the item
+@return: the items discarded to keep the number of keys within C{maxNumKeys}, possibly including C{item}
+@rtype: C{list}
+"""
+        if key in self.keyEntryDict:
+            keyEntry = self.keyEntryDict[key]
+            keyEntry[2].append(item)
+            if score > keyEntry[0]:
+                keyEntry[0] = score
+                heapq.heappush(self.entryHeap, (score, -keyEntry[1], key))
+            return []
+        discardedItemList = []
+        if len(self.keyEntryDict) >= self.maxNumKeys:
+            # entries of keys with subsequently increased scores are removed lazily
+            while not self.isCurrentEntry(self.entryHeap[0]):
+                heapq.heappop(self.entryHeap)
+            lowestScore, negativeSerial, lowestKey = self.entryHeap[0]
+            self.numDiscardedKeys = self.numDiscardedKeys + 1
+            if score <= lowestScore:
+                return [item]
+            heapq.heappop(self.entryHeap)
+            discardedItemList = self.keyEntryDict.pop(lowestKey)[2]
+        self.keyEntryDict[key] = [score, self.numAddedKeys, [item]]
+        heapq.heappush(self.entryHeap, (score, -self.numAddedKeys, key))
+        self.numAddedKeys = self.numAddedKeys + 1
+        return discardedItemList
+
+    def getKeyList(self):
+        """Get the retained keys, ordered by decreasing score.
+"""
+        keyEntryList = sorted(self.keyEntryDict.iteritems(), key=lambda keyEntry: (-keyEntry[1][0], keyEntry[1][1]))
+        return [key for key, entry in keyEntryList]
+
+
 def selectLongestReads(readsList, numReads):
     """Select the longest reads from a list of reads.
 @param readsList: list of reads
 @type readsList: C{list} of C{Bio.SeqRecord.SeqRecord}
 @param numReads: the number of longest reads to return
 @type numReads: C{int}
+@return: the longest reads, ordered by decreasing length, with reads of equal length in their original order
+@rtype: C{list} of C{Bio.SeqRecord.SeqRecord}
 """
-    # maximally naive implementation would be:
-    # return readsList[:numReads]
-    l = readsList[:]
-    l.sort(cmp=lambda x, y: cmp(len(x), len(y)), reverse=True)
-    return l[:numReads]
+    # heapq.nlargest is equivalent to a stable descending sort truncated to numReads
+    return heapq.nlargest(numReads, readsList, key=len)
 
 
 class SpadesRunner(object):
@@ -1959,43 +2823,138 @@ def pairwiseAlignmentStatsRowDict(alignment):
     return rowDict
 
 
+pairwiseAlignmentStatsColumnHeaderList = ['seqKey', 'seqId1', 'seqId2', 'seqLength1', 'seqLength2', 'alignmentLength', 'numIdentity', 'terminalGapLength1', 'terminalGapLength2', 'internalGapLength1', 'internalGapLength2', 'numInternalGaps1', 'numInternalGaps2']
+
+
+def pairwiseAlignmentStatsRow(k, sr1Dict, sr2Dict, alignmentRunner):
+    """Align the sequences stored under key C{k} and compute the statistics row for them.
+
+@return: tuple of the row dictionary and the alignment (C{None} unless both sequences are present)
+@rtype: C{tuple}
+"""
+    sr1 = None
+    sr2 = None
+    if k in sr1Dict:
+        sr1 = sr1Dict[k]
+    if k in sr2Dict:
+        sr2 = sr2Dict[k]
+    if sr1 is not None and sr2 is not None:
+        alignmentList = alignmentRunner.align(sr1, [sr2])
+        alignment = alignmentList[0]
+    else:
+        alignment = None
+    rowDict = pairwiseAlignmentStatsRowDict(alignment)
+    if sr1 is not None:
+        rowDict['seqId1'] = sr1.id
+        rowDict['seqLength1'] = len(sr1)
+    else:
+        rowDict['seqId1'] = None
+        rowDict['seqLength1'] = None
+    if sr2 is not None:
+        rowDict['seqId2'] = sr2.id
+        rowDict['seqLength2'] = len(sr2)
+    else:
+        rowDict['seqId2'] = None
+        rowDict['seqLength2'] = None
+    rowDict['seqKey'] = k
+    return rowDict, alignment
+
+
 def pairwiseAlignmentStats(sr1Dict, sr2Dict, alignmentRunner, alignmentFastaFname=None):
-    alignmentStatsFrame = DataFrame(['seqKey', 'seqId1', 'seqId2', 'seqLength1', 'seqLength2', 'alignmentLength', 'numIdentity', 'terminalGapLength1', 'terminalGapLength2', 'internalGapLength1', 'internalGapLength2', 'numInternalGaps1', 'numInternalGaps2'])
+    alignmentStatsFrame = DataFrame(pairwiseAlignmentStatsColumnHeaderList)
     alignmentSaveList = []
     keySet = set(sr1Dict.keys() + sr2Dict.keys())
     for k in keySet:
-        sr1 = None
-        sr2 = None
-        if k in sr1Dict:
-            sr1 = sr1Dict[k]
-        if k in sr2Dict:
-            sr2 = sr2Dict[k]
-        if sr1 is not None and sr2 is not None:
-            alignmentList = alignmentRunner.align(sr1, sr2)
-            alignment = alignmentList[0]
+        rowDict, alignment = pairwiseAlignmentStatsRow(k, sr1Dict, sr2Dict, alignmentRunner)
+        if alignment is not None:
             alignmentSaveList.append(alignment)
-        else:
-            alignment = None
-        rowDict = pairwiseAlignmentStatsRowDict(alignment)
-        if sr1 is not None:
-            rowDict['seqId1'] = sr1.id
-            rowDict['seqLength1'] = len(sr1)
-        else:
-            rowDict['seqId1'] = None
-            rowDict['seqLength1'] = None
-        if sr2 is not None:
-            rowDict['seqId2'] = sr2.id
-            rowDict['seqLength2'] = len(sr2)
-        else:
-            rowDict['seqId2'] = None
-            rowDict['seqLength2'] = None
-        rowDict['seqKey'] = k
         alignmentStatsFrame.addRow(rowDict)
     if alignmentFastaFname is not None:
         Bio.AlignIO.write(alignmentSaveList, alignmentFastaFname, 'fasta')
     return alignmentStatsFrame
 
 
+def writePairwiseAlignmentStatsCsv(sr1Dict, sr2Dict, alignmentRunner, csvFile, numWorkers=1, maxNumPending=None):
+    """Compute the same statistics as L{pairwiseAlignmentStats} using multiple worker threads.
+
+Rows are written to C{csvFile} as they are completed, so their order
+is not deterministic. At most C{maxNumPending} sequence pairs are
+dispatched but not yet written at any time, which bounds memory use.
+Workers are threads, so this is efficient with alignment runners that
+do not hold the GIL while aligning, i.e. those running external
+programs and those using C{paftol.clib}.
+
+@param numWorkers: number of worker threads
+@type numWorkers: C{int}
+@param maxNumPending: maximal number of pending sequence pairs, defaults to C{4 * numWorkers}
+@type maxNumPending: C{int}
+@return: number of rows written
+@rtype: C{int}
+"""
+    if numWorkers < 1:
+        raise StandardError, 'illegal number of workers: %d' % numWorkers
+    if maxNumPending is None:
+        maxNumPending = 4 * numWorkers
+    keyList = list(set(sr1Dict.keys() + sr2Dict.keys()))
+    pendingSemaphore = threading.BoundedSemaphore(maxNumPending)
+    stopEvent = threading.Event()
+    keyQueue = Queue.Queue()
+    resultQueue = Queue.Queue()
+
+    def feedKeys():
+        for k in keyList:
+            pendingSemaphore.acquire()
+            if stopEvent.is_set():
+                pendingSemaphore.release()
+                break
+            keyQueue.put(k)
+        for i in xrange(numWorkers):
+            keyQueue.put(None)
+
+    def alignKeys():
+        k = keyQueue.get()
+        while k is not None:
+            try:
+                rowDict, alignment = pairwiseAlignmentStatsRow(k, sr1Dict, sr2Dict, alignmentRunner)
+                resultQueue.put((rowDict, None))
+            except StandardError as e:
+                resultQueue.put((None, e))
+            k = keyQueue.get()
+        resultQueue.put(None)
+
+    threadList = [threading.Thread(target=feedKeys, name='pairwisestats-feeder')]
+    for i in xrange(numWorkers):
+        threadList.append(threading.Thread(target=alignKeys, name='pairwisestats-worker-%d' % i))
+    for thread in threadList:
+        thread.daemon = True
+        thread.start()
+    csvDictWriter = csv.DictWriter(csvFile, pairwiseAlignmentStatsColumnHeaderList)
+    csvDictWriter.writeheader()
+    numRows = 0
+    firstError = None
+    numFinishedWorkers = 0
+    while numFinishedWorkers < numWorkers:
+        result = resultQueue.get()
+        if result is None:
+            numFinishedWorkers = numFinishedWorkers + 1
+            continue
+        rowDict, e = result
+        if e is not None:
+            if firstError is None:
+                logger.error('pairwise alignment stats failed: %s', str(e))
+                firstError = e
+                stopEvent.set()
+        elif firstError is None:
+            csvDictWriter.writerow(rowDict)
+            numRows = numRows + 1
+        pendingSemaphore.release()
+    for thread in threadList:
+        thread.join()
+    if firstError is not None:
+        raise firstError
+    return numRows
+
+
 class PairwiseAlignmentRunner(object):
 
     def __init__(self):
@@ -2021,24 +2980,14 @@ class NeedleRunner(PairwiseAlignmentRunner):
             # sys.stderr.write('wrote bsequence file %s\n' % bsequenceFname)
             needleArgv = ['needle', '-asequence', 'stdin', '-bsequence', bsequenceFname, '-outfile', 'stdout', '-auto']
             logger.debug('%s', ' '.join(needleArgv))
-            needleProcess = subprocess.Popen(needleArgv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-            pid = os.fork()
-            if pid == 0:
-                needleProcess.stdout.close()
-                Bio.SeqIO.write([sra], needleProcess.stdin, 'fasta')
-                needleProcess.stdin.close()
-                os._exit(0)
-            needleProcess.stdin.close()
-            alignmentList = list(Bio.AlignIO.parse(needleProcess.stdout, 'emboss', alphabet=Bio.Alphabet.Gapped(sra.seq.alphabet)))
-            needleProcess.stdout.close()
-            wPid, wExit = os.waitpid(pid, 0)
-            if pid != wPid:
-                raise StandardError('wait returned pid %s (expected %d)' % (wPid, pid))
-            if wExit != 0:
-                raise StandardError('wait on forked process returned %d' % wExit)
-            r = needleProcess.wait()
-            if r != 0:
-                raise StandardError('needle process exited with %d' % r)
+            # communicate rather than forking a writer so alignments can be run from multiple threads
+            asequenceFile = StringIO.StringIO()
+            Bio.SeqIO.write([sra], asequenceFile, 'fasta')
+            needleProcess = subprocess.Popen(needleArgv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+            alignmentStr, errStr = needleProcess.communicate(asequenceFile.getvalue())
+            if needleProcess.returncode != 0:
+                raise StandardError('needle process exited with %d' % needleProcess.returncode)
+            alignmentList = list(Bio.AlignIO.parse(StringIO.StringIO(alignmentStr), 'emboss', alphabet=Bio.Alphabet.Gapped(sra.seq.alphabet)))
         finally:
             if paftol.keepTmp:
                 logger.warning('not deleting needle bsequence file %s', bsequenceFname)
@@ -2063,24 +3012,14 @@ class WaterRunner(PairwiseAlignmentRunner):
             # sys.stderr.write('wrote bsequence file %s\n' % bsequenceFname)
             waterArgv = ['water', '-asequence', 'stdin', '-bsequence', bsequenceFname, '-outfile', 'stdout', '-auto']
             logger.debug('%s', ' '.join(waterArgv))
-            waterProcess = subprocess.Popen(waterArgv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-            pid = os.fork()
-            if pid == 0:
-                waterProcess.stdout.close()
-                Bio.SeqIO.write([sra], waterProcess.stdin, 'fasta')
-                waterProcess.stdin.close()
-                os._exit(0)
-            waterProcess.stdin.close()
-            alignmentList = list(Bio.AlignIO.parse(waterProcess.stdout, 'emboss', alphabet=Bio.Alphabet.Gapped(sra.seq.alphabet)))
-            waterProcess.stdout.close()
-            wPid, wExit = os.waitpid(pid, 0)
-            if pid != wPid:
-                raise StandardError('wait returned pid %s (expected %d)' % (wPid, pid))
-            if wExit != 0:
-                raise StandardError('wait on forked process returned %d' % wExit)
-            r = waterProcess.wait()
-            if r != 0:
-                raise StandardError('water process exited with %d' % r)
+            # communicate rather than forking a writer so alignments can be run from multiple threads
+            asequenceFile = StringIO.StringIO()
+            Bio.SeqIO.write([sra], asequenceFile, 'fasta')
+            waterProcess = subprocess.Popen(waterArgv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+            alignmentStr, errStr = waterProcess.communicate(asequenceFile.getvalue())
+            if waterProcess.returncode != 0:
+                raise StandardError('water process exited with %d' % waterProcess.returncode)
+            alignmentList = list(Bio.AlignIO.parse(StringIO.StringIO(alignmentStr), 'emboss', alphabet=Bio.Alphabet.Gapped(sra.seq.alphabet)))
         finally:
             if paftol.keepTmp:
                 logger.warning('not deleting water bsequence file %s', bsequenceFname)
@@ -2106,6 +3045,68 @@ class SemiglobalAlignmentRunner(PairwiseAlignmentRunner):
         return alignmentList
 
 
+class AffineGapAlignmentRunner(PairwiseAlignmentRunner):
+    """Base class for runners computing affine gap alignments in process, using C{paftol.clib}.
+
+Alignments are scored with the EDNAFULL matrix, default gap penalties
+are those of EMBOSS needle and water. Alignment results have the same
+form as those of L{NeedleRunner} and L{WaterRunner}. The GIL is released
+while aligning, so runners can be used from multiple threads.
+
+@ivar gapOpen: gap opening penalty
+@type gapOpen: C{float}
+@ivar gapExtend: gap extension penalty
+@type gapExtend: C{float}
+"""
+
+    def __init__(self, gapOpen=10.0, gapExtend=0.5):
+        super(AffineGapAlignmentRunner, self).__init__()
+        self.gapOpen = gapOpen
+        self.gapExtend = gapExtend
+
+    def alignStrings(self, sa, sb):
+        raise StandardError, 'abstract method'
+
+    def align(self, sra, srbList):
+        alignmentList = []
+        sa = str(sra.seq)
+        alphabet = sra.seq.alphabet
+        if not isinstance(alphabet, Bio.Alphabet.Gapped):
+            alphabet = Bio.Alphabet.Gapped(alphabet)
+        for srb in srbList:
+            aa, ab, alignmentScore = self.alignStrings(sa, str(srb.seq))
+            asra = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(aa, alphabet), id=sra.id, description='%s, score %f' % (sra.description, alignmentScore))
+            asrb = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(ab, alphabet), id=srb.id, description='%s, score %f' % (srb.description, alignmentScore))
+            alignmentList.append(Bio.Align.MultipleSeqAlignment([asra, asrb]))
+        return alignmentList
+
+
+class GlobalAlignmentRunner(AffineGapAlignmentRunner):
+    """In process replacement for L{NeedleRunner}.
+
+@ivar penalizeEndGaps: penalize leading and trailing gaps, off by default as in needle
+@type penalizeEndGaps: C{bool}
+"""
+
+    def __init__(self, gapOpen=10.0, gapExtend=0.5, penalizeEndGaps=False):
+        super(GlobalAlignmentRunner, self).__init__(gapOpen, gapExtend)
+        self.penalizeEndGaps = penalizeEndGaps
+
+    def alignStrings(self, sa, sb):
+        return paftol.clib.align_global(sa, sb, self.gapOpen, self.gapExtend, 1 if self.penalizeEndGaps else 0)
+
+
+class LocalAlignmentRunner(AffineGapAlignmentRunner):
+    """In process replacement for L{WaterRunner}.
+"""
+
+    def __init__(self, gapOpen=10.0, gapExtend=0.5):
+        super(LocalAlignmentRunner, self).__init__(gapOpen, gapExtend)
+
+    def alignStrings(self, sa, sb):
+        return paftol.clib.align_local(sa, sb, self.gapOpen, self.gapExtend)
+
+
 def findRelativeIdentity(alignment):
     n = 0
     for i in xrange(alignment.get_alignment_length()):
@@ -2139,15 +3140,88 @@ def testMaxRelativeIdentity(alignment):
         sys.stderr.write('max. relative identity at window %d: %f\n' % (windowSize, findMaxRelativeIdentity(alignment, windowSize)))
 
 
+class ReadView(object):
+    """Immutable, lightweight view of a read.
+
+Provides the C{id}, C{seq} and C{description} attributes used by the
+alignment runners and by L{Contig}, so read views can be used in place
+of C{SeqRecord} instances. As views cannot be modified, they can be
+shared between lists, L{PositionedRead} instances and contigs without
+copying.
+
+@ivar name: the read name
+@type name: C{str}
+@ivar seq: the read sequence
+@type seq: C{str}
+@ivar orientation: orientation tag appended to the name to form the id (e.g. C{'fwd'}), or C{None}
+@type orientation: C{str}
+@ivar offset: position of the read relative to a reference, or C{None}
+@type offset: C{int}
+"""
+
+    __slots__ = ('name', 'seq', 'orientation', 'offset')
+
+    def __init__(self, name, seq, orientation=None, offset=None):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'seq', str(seq))
+        object.__setattr__(self, 'orientation', orientation)
+        object.__setattr__(self, 'offset', offset)
+
+    def __setattr__(self, attrName, value):
+        raise AttributeError, 'cannot set %s: ReadView instances are immutable' % attrName
+
+    def __delattr__(self, attrName):
+        raise AttributeError, 'cannot delete %s: ReadView instances are immutable' % attrName
+
+    def __len__(self):
+        return len(self.seq)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @property
+    def id(self):
+        if self.orientation is None:
+            return self.name
+        return '%s-%s' % (self.name, self.orientation)
+
+    @property
+    def description(self):
+        if self.offset is None:
+            return ''
+        return 'pos: %d' % self.offset
+
+    def withOffset(self, offset):
+        return ReadView(self.name, self.seq, self.orientation, offset)
+
+    def reverse_complement(self):
+        if self.orientation is None:
+            orientation = 'rc'
+        else:
+            orientation = '%s-rc' % self.orientation
+        return ReadView(self.name, Bio.Seq.reverse_complement(self.seq), orientation)
+
+    def toSeqRecord(self):
+        return Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(self.seq), id=self.id, description=self.description)
+
+    @staticmethod
+    def fromSeqRecord(seqRecord, orientation=None):
+        return ReadView(seqRecord.id, seqRecord.seq, orientation)
+
+
 class PositionedRead(object):
 
-    def __init__(self, readSr, position, maxRelativeIdentity, coreLength, coreMatch):
+    def __init__(self, read, position, maxRelativeIdentity, coreLength, coreMatch):
         self.position = position
         self.maxRelativeIdentity = maxRelativeIdentity
         self.coreLength = coreLength
         self.coreMatch = coreMatch
-        self.readSr = copy.deepcopy(readSr)
-        self.readSr.description = 'pos: %d' % self.position
+        if not isinstance(read, ReadView):
+            read = ReadView.fromSeqRecord(read)
+        self.readView = read.withOffset(position)
 
     def __cmp__(self, other):
         return cmp(self.position, other.position)
@@ -2174,8 +3248,9 @@ def reverseComplementSeqRecordList(seqRecordList):
     rList = []
     for seqRecord in seqRecordList:
         r = seqRecord.reverse_complement()
-        r.id = '%s-rc' % seqRecord.id
-        r.description = '%s, reverse complement' % seqRecord.description
+        if not isinstance(r, ReadView):
+            r.id = '%s-rc' % seqRecord.id
+            r.description = '%s, reverse complement' % seqRecord.description
     return rList
 
 
@@ -2267,19 +3342,58 @@ class ContigColumn(object):
 
 class Contig(object):
 
+    """Contig assembled by aligning reads one by one.
+
+Reads are added as rows, and their aligned symbols are kept in
+L{ContigColumn}s. Consensus and depth computations work on a packed
+column buffer (see L{getColumnBuffer}), which is cached until the
+contig is modified. After L{removeTerminalGaps}, the buffer is the
+only representation of the contig, and the columns are unpacked from
+it when they are accessed again.
+
+@ivar columnBuffer: cached packed column buffer, or C{None} if it needs to be rebuilt
+@type columnBuffer: C{str}
+@ivar storedColumnList: the columns, or C{None} if they need to be unpacked from C{columnBuffer}
+@type storedColumnList: C{list} of L{ContigColumn}
+"""
+
     def __init__(self, overlapLengthThreshold, overlapMatchThreshold, alignmentRunner, gapChar='-'):
         self.overlapLengthThreshold = overlapLengthThreshold
         self.overlapMatchThreshold = overlapMatchThreshold
         self.alignmentRunner = alignmentRunner
         self.gapChar = gapChar
         self.readList = []
-        self.columnList = []
+        self.storedColumnList = []
+        self.columnBuffer = None
+
+    def unpackColumns(self):
+        """Unpack the columns from the column buffer if they are not stored.
+
+This must be done before rows are added, as the layout of the buffer
+depends on the number of rows.
+"""
+        if self.storedColumnList is None:
+            numRows = self.numRows()
+            storedColumnList = []
+            for columnStart in xrange(0, len(self.columnBuffer), numRows):
+                column = ContigColumn()
+                column.symbolList = [symbol if symbol != '\0' else None for symbol in self.columnBuffer[columnStart:columnStart + numRows]]
+                storedColumnList.append(column)
+            self.storedColumnList = storedColumnList
+
+    @property
+    def columnList(self):
+        if self.storedColumnList is None:
+            self.unpackColumns()
+        return self.storedColumnList
 
     def numRows(self):
         return len(self.readList)
 
     def numColumns(self):
-        return len(self.columnList)
+        if self.storedColumnList is None:
+            return len(self.columnBuffer) / self.numRows()
+        return len(self.storedColumnList)
 
     def getSymbol(self, rowIndex, columnIndex):
         # logger.debug('rowIndex: %d / %d, columnIndex: %d / %d', rowIndex, self.numRows(), columnIndex, self.numColumns())
@@ -2287,13 +3401,17 @@ class Contig(object):
 
     def setSymbol(self, rowIndex, columnIndex, symbol):
         self.columnList[columnIndex].setSymbol(rowIndex, symbol)
+        self.columnBuffer = None
 
     def getSeqRecord(self, rowIndex, terminalGapChar):
         # logger.debug('terminalGapChar: %s', terminalGapChar)
-        rawSymbolList = [c.getSymbol(rowIndex) for c in self.columnList]
-        # logger.debug('rawSymbolList: %s', str(rawSymbolList))
-        symbolList = [rawSymbol if rawSymbol is not None else terminalGapChar for rawSymbol in rawSymbolList]
-        s = ''.join(symbolList)
+        if self.storedColumnList is None:
+            s = self.columnBuffer[rowIndex::self.numRows()].replace('\0', terminalGapChar)
+        else:
+            rawSymbolList = [c.getSymbol(rowIndex) for c in self.storedColumnList]
+            # logger.debug('rawSymbolList: %s', str(rawSymbolList))
+            symbolList = [rawSymbol if rawSymbol is not None else terminalGapChar for rawSymbol in rawSymbolList]
+            s = ''.join(symbolList)
         sr = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(s), id=self.readList[rowIndex].id, description='')
         return sr
 
@@ -2307,26 +3425,36 @@ class Contig(object):
             srList.append(self.getSeqRecord(r, terminalGapChar))
         return Bio.Align.MultipleSeqAlignment(srList)
 
+    def getColumnBuffer(self):
+        """Pack the symbols of this contig into a string, column by column.
+
+The symbol in row C{r} of column C{c} is at index C{c * numRows + r}
+of the buffer. Cells outside the extent of a read (i.e. terminal gaps
+that have been removed) are represented by C{'\\0'}. The buffer is
+cached until the contig is modified.
+"""
+        if self.columnBuffer is None:
+            columnStringList = []
+            for column in self.storedColumnList:
+                try:
+                    columnStringList.append(''.join(column.symbolList))
+                except TypeError:
+                    columnStringList.append(''.join([symbol if symbol is not None else '\0' for symbol in column.symbolList]))
+            self.columnBuffer = ''.join(columnStringList)
+        return self.columnBuffer
+
     def getDepthProfile(self):
-        return [column.getNumNongaps(self.gapChar) for column in self.columnList]
+        if self.numColumns() == 0:
+            return []
+        return paftol.clib.contig_depth_profile(self.getColumnBuffer(), self.numRows(), self.gapChar, '\0')
 
     def getMeanDepth(self):
         return float(sum(self.getDepthProfile())) / float(self.numColumns())
 
     def getConsensus(self):
-        if len(self.columnList) == 0:
+        if self.numColumns() == 0:
             return None
-        s = ''
-        depthProfile = []
-        for column in self.columnList:
-            symbolList = column.getMostFrequentSymbolList()
-            symbol = symbolList[0]
-
-            if symbol == self.gapChar and len(symbolList) > 1:
-                symbol = symbolList[1]
-            if symbol != self.gapChar:
-                s = s + symbol
-                depthProfile.append(column.getNumNongaps(self.gapChar))
+        s, depthProfile = paftol.clib.contig_consensus(self.getColumnBuffer(), self.numRows(), self.gapChar, '\0')
         sr = Bio.SeqRecord.SeqRecord(Bio.Seq.Seq(s, alphabet=Bio.Alphabet.IUPAC.ambiguous_dna), id='contig', description='numReads=%s, meanDepth=%f' % (self.numRows(), float(sum(depthProfile)) / float(len(depthProfile))))
         sr.letter_annotations['depth'] = depthProfile
         return sr
@@ -2334,8 +3462,10 @@ class Contig(object):
     def getNumReads(self):
         if self.numColumns() == 0:
             return None
+        elif self.storedColumnList is None:
+            return self.numRows()
         else:
-            return self.columnList[0].getNumRows()
+            return self.storedColumnList[0].getNumRows()
 
     def getLastRead(self):
         return self.readList[-1]
@@ -2354,30 +3484,25 @@ class Contig(object):
         if columnIndex is None:
             self.columnList.append(newColumn)
         else:
-            self.columnList = self.columnList[:columnIndex] + [newColumn] + self.columnList[columnIndex:]
+            self.columnList.insert(columnIndex, newColumn)
+        self.columnBuffer = None
 
     def addRow(self):
         for column in self.columnList:
             column.addRow(self.gapChar)
+        self.columnBuffer = None
 
     def removeTerminalGaps(self):
-        for rowIndex in xrange(self.numRows()):
-            # logger.debug('row: %d', rowIndex)
-            columnIndex = 0
-            while columnIndex < self.numColumns() and self.getSymbol(rowIndex, columnIndex) == self.gapChar:
-                self.setSymbol(rowIndex, columnIndex, None)
-                columnIndex = columnIndex + 1
-            # logger.debug('final left columnIndex: %d', columnIndex)
-            columnIndex = self.numColumns() - 1
-            while columnIndex >= 0 and self.getSymbol(rowIndex, columnIndex) == self.gapChar:
-                self.setSymbol(rowIndex, columnIndex, None)
-                columnIndex = columnIndex - 1
-            # logger.debug('final right columnIndex: %d', columnIndex)
+        if self.numColumns() == 0:
+            return
+        self.columnBuffer = paftol.clib.contig_remove_terminal_gaps(self.getColumnBuffer(), self.numRows(), self.gapChar, '\0')
+        self.storedColumnList = None
 
     def addFirstRead(self, readSr):
         self.readList.append(readSr)
         for symbol in str(readSr.seq):
             self.columnList.append(ContigColumn(1, symbol))
+        self.columnBuffer = None
         return True
 
     def addSubsequentRead(self, readSr):
@@ -2393,6 +3518,7 @@ class Contig(object):
         overlapMatch = findRelativeIdentity(overlapAlignment)
         logger.debug('overlapLength: %d, overlapMatch: %f', overlapAlignment.get_alignment_length(), overlapMatch)
         if overlapAlignment.get_alignment_length() >= self.overlapLengthThreshold and overlapMatch >= self.overlapMatchThreshold:
+            self.unpackColumns()
             self.readList.append(readSr)
             r0 = self.getNumReads() - 1
             r1 = r0 + 1
@@ -2424,6 +3550,11 @@ class Contig(object):
             return False
 
     def addRead(self, readSr):
+        """Add a read to this contig.
+
+The read is stored by reference, so immutable L{ReadView} instances
+can be added without copying.
+"""
         # sys.stderr.write('adding read %s\n' % readSr.id)
         if self.numRows() == 0:
             isAdded = self.addFirstRead(readSr)
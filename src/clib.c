@@ -1,3 +1,4 @@
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
 
 #include <stdlib.h>
@@ -5,6 +6,8 @@
 #include <stdarg.h>
 #include <string.h>
 #include <float.h>
+#include <limits.h>
+#include <ctype.h>
 
 
 #define MAX_LINE_LENGTH 1000
@@ -57,7 +60,7 @@ typedef struct
  * The API version must be changed manually each time the API is
  * changed.
  */
-static char clib_api_version[] = "0.0.1";
+static char clib_api_version[] = "0.0.3";
 
 
 static CLIB_MSG_IMPORTANCE message_importance_threshold = CLIB_MSG_WARNING;
@@ -632,6 +635,7 @@ void free_pairwise_alignment(PAIRWISE_ALIGNMENT *pairwise_alignment)
 {
   free_biosequence(pairwise_alignment->seq0);
   free_biosequence(pairwise_alignment->seq1);
+  free(pairwise_alignment);
 }
 
 
@@ -1266,6 +1270,436 @@ static PAIRWISE_ALIGNMENT *align_semiglobal(const BIOSEQUENCE *seq0, const BIOSE
   return (pairwise_alignment);
 }
 
+/*
+ * Affine gap alignment (Gotoh) in global or local mode. Only the
+ * current and previous rows of the three score matrices are kept, the
+ * traceback for all three states is packed into one byte per cell.
+ */
+
+typedef enum
+{
+  ALIGNMENT_GLOBAL,
+  ALIGNMENT_LOCAL
+} ALIGNMENT_MODE;
+
+
+#define TRACE_FROM_M 0
+#define TRACE_FROM_X 1
+#define TRACE_FROM_Y 2
+#define TRACE_FROM_START 3
+#define TRACE_M_SHIFT 0
+#define TRACE_X_SHIFT 2
+#define TRACE_Y_SHIFT 4
+
+
+static double max3_trace(double m, double x, double y, unsigned char *from)
+{
+  if ((m >= x) && (m >= y))
+  {
+    *from = TRACE_FROM_M;
+    return (m);
+  }
+  if (x >= y)
+  {
+    *from = TRACE_FROM_X;
+    return (x);
+  }
+  *from = TRACE_FROM_Y;
+  return (y);
+}
+
+
+static int find_invalid_symbol(const SYMBOL_SCORE_MATRIX *symbol_score_matrix, const char *s)
+{
+  size_t i;
+
+  for (i = 0; s[i] != '\0'; i++)
+  {
+    if (find_symbol_index(symbol_score_matrix, (char) toupper(s[i])) == -1)
+    {
+      return ((unsigned char) s[i]);
+    }
+  }
+  return (-1);
+}
+
+
+static int *make_symbol_index_list(const SYMBOL_SCORE_MATRIX *symbol_score_matrix, const char *s, size_t length)
+{
+  int *symbol_index_list;
+  size_t i;
+
+  symbol_index_list = (int *) malloc((length + 1) * sizeof(int));
+  if (symbol_index_list == NULL)
+  {
+    return (NULL);
+  }
+  for (i = 0; i < length; i++)
+  {
+    symbol_index_list[i] = find_symbol_index(symbol_score_matrix, (char) toupper(s[i]));
+  }
+  return (symbol_index_list);
+}
+
+
+/*
+ * All symbols in seq0 and seq1 must be contained in the symbol score
+ * matrix (see find_invalid_symbol). In global mode with
+ * penalize_end_gaps == 0, leading and trailing gaps are free, as is
+ * the default of EMBOSS needle.
+ */
+
+static PAIRWISE_ALIGNMENT *align_affine(const BIOSEQUENCE *seq0, const BIOSEQUENCE *seq1, const SYMBOL_SCORE_MATRIX *symbol_score_matrix, double gap_creation_penalty, double gap_extension_penalty, ALIGNMENT_MODE mode, int penalize_end_gaps)
+{
+  char gapchar = '-';
+  size_t l0 = strlen(seq0->seq);
+  size_t l1 = strlen(seq1->seq);
+  size_t i, j, k, end_i, end_j;
+  int free_end_gaps = (mode == ALIGNMENT_GLOBAL) && !penalize_end_gaps;
+  int *index0, *index1;
+  double *buffer, *prev_m, *prev_x, *prev_y, *cur_m, *cur_x, *cur_y, *tmp;
+  double neg = -DBL_MAX, best_score, score;
+  unsigned char *trace;
+  unsigned char from_m, from_x, from_y, end_state, state, from;
+  char *aln0, *aln1;
+  BIOSEQUENCE *aligned_seq0, *aligned_seq1;
+  PAIRWISE_ALIGNMENT *pairwise_alignment;
+
+  index0 = make_symbol_index_list(symbol_score_matrix, seq0->seq, l0);
+  index1 = make_symbol_index_list(symbol_score_matrix, seq1->seq, l1);
+  buffer = (double *) malloc(6 * (l1 + 1) * sizeof(double));
+  trace = (unsigned char *) malloc((l0 + 1) * (l1 + 1));
+  aln0 = (char *) malloc(l0 + l1 + 1);
+  aln1 = (char *) malloc(l0 + l1 + 1);
+  if ((index0 == NULL) || (index1 == NULL) || (buffer == NULL) || (trace == NULL) || (aln0 == NULL) || (aln1 == NULL))
+  {
+    free(aln1);
+    free(aln0);
+    free(trace);
+    free(buffer);
+    free(index1);
+    free(index0);
+    return (NULL);
+  }
+  prev_m = buffer;
+  prev_x = buffer + (l1 + 1);
+  prev_y = buffer + 2 * (l1 + 1);
+  cur_m = buffer + 3 * (l1 + 1);
+  cur_x = buffer + 4 * (l1 + 1);
+  cur_y = buffer + 5 * (l1 + 1);
+  /* row 0 */
+  prev_m[0] = (mode == ALIGNMENT_GLOBAL) ? 0.0 : neg;
+  prev_x[0] = neg;
+  prev_y[0] = neg;
+  for (j = 1; j <= l1; j++)
+  {
+    prev_m[j] = neg;
+    prev_x[j] = neg;
+    if (mode == ALIGNMENT_LOCAL)
+    {
+      prev_y[j] = neg;
+    }
+    else if (free_end_gaps)
+    {
+      prev_y[j] = 0.0;
+    }
+    else
+    {
+      prev_y[j] = -gap_creation_penalty - (j - 1) * gap_extension_penalty;
+    }
+  }
+  best_score = neg;
+  end_i = l0;
+  end_j = l1;
+  end_state = TRACE_FROM_M;
+  if (mode == ALIGNMENT_LOCAL)
+  {
+    best_score = 0.0;
+    end_i = 0;
+    end_j = 0;
+  }
+  else if (free_end_gaps)
+  {
+    best_score = max3_trace(prev_m[l1], prev_x[l1], prev_y[l1], &end_state);
+    end_i = 0;
+  }
+  for (i = 1; i <= l0; i++)
+  {
+    cur_m[0] = neg;
+    cur_y[0] = neg;
+    if (mode == ALIGNMENT_LOCAL)
+    {
+      cur_x[0] = neg;
+    }
+    else if (free_end_gaps)
+    {
+      cur_x[0] = 0.0;
+    }
+    else
+    {
+      cur_x[0] = -gap_creation_penalty - (i - 1) * gap_extension_penalty;
+    }
+    for (j = 1; j <= l1; j++)
+    {
+      score = max3_trace(prev_m[j - 1], prev_x[j - 1], prev_y[j - 1], &from_m);
+      if ((mode == ALIGNMENT_LOCAL) && (score < 0.0))
+      {
+        score = 0.0;
+        from_m = TRACE_FROM_START;
+      }
+      cur_m[j] = score + symbol_score_matrix->score[index0[i - 1]][index1[j - 1]];
+      cur_x[j] = max3_trace(prev_m[j] - gap_creation_penalty, prev_x[j] - gap_extension_penalty, prev_y[j] - gap_creation_penalty, &from_x);
+      cur_y[j] = max3_trace(cur_m[j - 1] - gap_creation_penalty, cur_x[j - 1] - gap_creation_penalty, cur_y[j - 1] - gap_extension_penalty, &from_y);
+      trace[i * (l1 + 1) + j] = (from_m << TRACE_M_SHIFT) | (from_x << TRACE_X_SHIFT) | (from_y << TRACE_Y_SHIFT);
+      if ((mode == ALIGNMENT_LOCAL) && (cur_m[j] > best_score))
+      {
+        best_score = cur_m[j];
+        end_i = i;
+        end_j = j;
+      }
+    }
+    if (free_end_gaps)
+    {
+      score = max3_trace(cur_m[l1], cur_x[l1], cur_y[l1], &from);
+      if (score > best_score)
+      {
+        best_score = score;
+        end_state = from;
+        end_i = i;
+        end_j = l1;
+      }
+    }
+    tmp = prev_m;
+    prev_m = cur_m;
+    cur_m = tmp;
+    tmp = prev_x;
+    prev_x = cur_x;
+    cur_x = tmp;
+    tmp = prev_y;
+    prev_y = cur_y;
+    cur_y = tmp;
+  }
+  /* prev_* now hold row l0 */
+  if (free_end_gaps)
+  {
+    for (j = 0; j <= l1; j++)
+    {
+      score = max3_trace(prev_m[j], prev_x[j], prev_y[j], &from);
+      if (score > best_score)
+      {
+        best_score = score;
+        end_state = from;
+        end_i = l0;
+        end_j = j;
+      }
+    }
+  }
+  else if (mode == ALIGNMENT_GLOBAL)
+  {
+    best_score = max3_trace(prev_m[l1], prev_x[l1], prev_y[l1], &end_state);
+  }
+  k = 0;
+  if (mode == ALIGNMENT_GLOBAL)
+  {
+    for (i = l0; i > end_i; i--)
+    {
+      aln0[k] = seq0->seq[i - 1];
+      aln1[k] = gapchar;
+      k++;
+    }
+    for (j = l1; j > end_j; j--)
+    {
+      aln0[k] = gapchar;
+      aln1[k] = seq1->seq[j - 1];
+      k++;
+    }
+  }
+  i = end_i;
+  j = end_j;
+  state = end_state;
+  while ((i > 0) && (j > 0))
+  {
+    if (state == TRACE_FROM_M)
+    {
+      from = (trace[i * (l1 + 1) + j] >> TRACE_M_SHIFT) & 3;
+      aln0[k] = seq0->seq[--i];
+      aln1[k] = seq1->seq[--j];
+    }
+    else if (state == TRACE_FROM_X)
+    {
+      from = (trace[i * (l1 + 1) + j] >> TRACE_X_SHIFT) & 3;
+      aln0[k] = seq0->seq[--i];
+      aln1[k] = gapchar;
+    }
+    else
+    {
+      from = (trace[i * (l1 + 1) + j] >> TRACE_Y_SHIFT) & 3;
+      aln0[k] = gapchar;
+      aln1[k] = seq1->seq[--j];
+    }
+    k++;
+    if (from == TRACE_FROM_START)
+    {
+      break;
+    }
+    state = from;
+  }
+  if (mode == ALIGNMENT_GLOBAL)
+  {
+    while (i > 0)
+    {
+      aln0[k] = seq0->seq[--i];
+      aln1[k] = gapchar;
+      k++;
+    }
+    while (j > 0)
+    {
+      aln0[k] = gapchar;
+      aln1[k] = seq1->seq[--j];
+      k++;
+    }
+  }
+  aln0[k] = '\0';
+  aln1[k] = '\0';
+  reverse_string(aln0);
+  reverse_string(aln1);
+  free(trace);
+  free(buffer);
+  free(index1);
+  free(index0);
+  aligned_seq0 = new_biosequence(seq0->id, seq0->description, aln0);
+  aligned_seq1 = new_biosequence(seq1->id, seq1->description, aln1);
+  free(aln1);
+  free(aln0);
+  if ((aligned_seq0 == NULL) || (aligned_seq1 == NULL))
+  {
+    if (aligned_seq0 != NULL)
+    {
+      free_biosequence(aligned_seq0);
+    }
+    if (aligned_seq1 != NULL)
+    {
+      free_biosequence(aligned_seq1);
+    }
+    return (NULL);
+  }
+  pairwise_alignment = wrap_pairwise_alignment(aligned_seq0, aligned_seq1);
+  if (pairwise_alignment == NULL)
+  {
+    free_biosequence(aligned_seq0);
+    free_biosequence(aligned_seq1);
+    return (NULL);
+  }
+  pairwise_alignment->score = best_score;
+  return (pairwise_alignment);
+}
+
+
+/*
+ * Contig column buffers: a contig with num_rows reads and num_columns
+ * columns is packed column by column, i.e. the symbol of row r in column
+ * c is found at column_buffer[c * num_rows + r]. Cells outside a read's
+ * extent (terminal gaps that have been removed) are represented by
+ * terminal_gap_char.
+ */
+
+static void contig_terminal_gap_range(const char *column_buffer, size_t num_rows, size_t num_columns, size_t row, char gap_char, size_t *left_end, size_t *right_start)
+{
+  size_t c;
+
+  c = 0;
+  while ((c < num_columns) && (column_buffer[c * num_rows + row] == gap_char))
+  {
+    c++;
+  }
+  *left_end = c;
+  c = num_columns;
+  while ((c > *left_end) && (column_buffer[(c - 1) * num_rows + row] == gap_char))
+  {
+    c--;
+  }
+  *right_start = c;
+}
+
+
+static long contig_column_depth(const char *column, size_t num_rows, char gap_char, char terminal_gap_char)
+{
+  size_t r;
+  long depth = 0;
+
+  for (r = 0; r < num_rows; r++)
+  {
+    if ((column[r] != gap_char) && (column[r] != terminal_gap_char))
+    {
+      depth++;
+    }
+  }
+  return (depth);
+}
+
+
+/*
+ * Find the most frequent symbol in a column, disregarding terminal gaps.
+ * Ties are resolved in favour of non-gap symbols, and then in favour of
+ * the symbol that occurs in the lowest numbered row. Returns -1 if the
+ * column consists of terminal gaps only or if the gap is the unique most
+ * frequent symbol.
+ */
+
+static int contig_column_consensus_symbol(const char *column, size_t num_rows, char gap_char, char terminal_gap_char)
+{
+  size_t count[UCHAR_MAX + 1];
+  size_t first_row[UCHAR_MAX + 1];
+  size_t r;
+  int s, best_symbol = -1;
+  unsigned char gap_index = (unsigned char) gap_char;
+  unsigned char terminal_gap_index = (unsigned char) terminal_gap_char;
+
+  memset(count, 0, sizeof(count));
+  for (r = 0; r < num_rows; r++)
+  {
+    s = (unsigned char) column[r];
+    if (count[s] == 0)
+    {
+      first_row[s] = r;
+    }
+    count[s]++;
+  }
+  count[terminal_gap_index] = 0;
+  for (s = 0; s <= UCHAR_MAX; s++)
+  {
+    if (count[s] == 0)
+    {
+      continue;
+    }
+    if (best_symbol == -1)
+    {
+      best_symbol = s;
+    }
+    else if (count[s] > count[best_symbol])
+    {
+      best_symbol = s;
+    }
+    else if (count[s] == count[best_symbol])
+    {
+      if (best_symbol == gap_index)
+      {
+        best_symbol = s;
+      }
+      else if ((s != gap_index) && (first_row[s] < first_row[best_symbol]))
+      {
+        best_symbol = s;
+      }
+    }
+  }
+  if (best_symbol == gap_index)
+  {
+    return (-1);
+  }
+  return (best_symbol);
+}
+
+
 static void clib_message(CLIB_MSG_IMPORTANCE importance, const char *format, ...)
 {
   va_list arglist;
@@ -1504,10 +1938,256 @@ static PyObject *clib_semiglobal_alignment_series(PyObject *self, PyObject *args
 }
 
 
+static PyObject *align_affine_python(const char *s0, const char *s1, double gap_creation_penalty, double gap_extension_penalty, ALIGNMENT_MODE mode, int penalize_end_gaps)
+{
+  BIOSEQUENCE *biosequence0, *biosequence1;
+  SYMBOL_SCORE_MATRIX *symbol_score_matrix;
+  PAIRWISE_ALIGNMENT *pairwise_alignment;
+  PyObject *r;
+  int invalid_symbol;
+
+  symbol_score_matrix = make_ednafull_matrix();
+  if (symbol_score_matrix == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "failed to allocate symbol score matrix");
+    return (NULL);
+  }
+  invalid_symbol = find_invalid_symbol(symbol_score_matrix, s0);
+  if (invalid_symbol == -1)
+  {
+    invalid_symbol = find_invalid_symbol(symbol_score_matrix, s1);
+  }
+  if (invalid_symbol != -1)
+  {
+    free_symbol_score_matrix(symbol_score_matrix);
+    PyErr_Format(PyExc_ValueError, "symbol '%c' not in symbol score matrix", invalid_symbol);
+    return (NULL);
+  }
+  biosequence0 = new_biosequence("seq0", "seq0", s0);
+  biosequence1 = new_biosequence("seq1", "seq1", s1);
+  if ((biosequence0 == NULL) || (biosequence1 == NULL))
+  {
+    if (biosequence0 != NULL)
+    {
+      free_biosequence(biosequence0);
+    }
+    if (biosequence1 != NULL)
+    {
+      free_biosequence(biosequence1);
+    }
+    free_symbol_score_matrix(symbol_score_matrix);
+    PyErr_SetString(PyExc_MemoryError, "failed to allocate biosequences");
+    return (NULL);
+  }
+  /* no Python objects are touched while aligning, so other threads can run */
+  Py_BEGIN_ALLOW_THREADS
+  pairwise_alignment = align_affine(biosequence0, biosequence1, symbol_score_matrix, gap_creation_penalty, gap_extension_penalty, mode, penalize_end_gaps);
+  Py_END_ALLOW_THREADS
+  free_biosequence(biosequence0);
+  free_biosequence(biosequence1);
+  free_symbol_score_matrix(symbol_score_matrix);
+  if (pairwise_alignment == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "failed to allocate pairwise alignment");
+    return (NULL);
+  }
+  r = Py_BuildValue("ssd", pairwise_alignment->seq0->seq, pairwise_alignment->seq1->seq, pairwise_alignment->score);
+  free_pairwise_alignment(pairwise_alignment);
+  return (r);
+}
+
+
+static PyObject *clib_align_global(PyObject *self, PyObject *args)
+{
+  const char *s0, *s1;
+  double gap_creation_penalty = 10.0, gap_extension_penalty = 0.5;
+  int penalize_end_gaps = 0;
+
+  if (!PyArg_ParseTuple(args, "ss|ddi", &s0, &s1, &gap_creation_penalty, &gap_extension_penalty, &penalize_end_gaps))
+  {
+    return (NULL);
+  }
+  return (align_affine_python(s0, s1, gap_creation_penalty, gap_extension_penalty, ALIGNMENT_GLOBAL, penalize_end_gaps));
+}
+
+
+static PyObject *clib_align_local(PyObject *self, PyObject *args)
+{
+  const char *s0, *s1;
+  double gap_creation_penalty = 10.0, gap_extension_penalty = 0.5;
+
+  if (!PyArg_ParseTuple(args, "ss|dd", &s0, &s1, &gap_creation_penalty, &gap_extension_penalty))
+  {
+    return (NULL);
+  }
+  return (align_affine_python(s0, s1, gap_creation_penalty, gap_extension_penalty, ALIGNMENT_LOCAL, 0));
+}
+
+
+static int check_column_buffer_shape(Py_ssize_t buffer_length, int num_rows, size_t *num_columns)
+{
+  if (num_rows <= 0)
+  {
+    PyErr_SetString(PyExc_ValueError, "number of rows must be positive");
+    return (-1);
+  }
+  if (buffer_length % num_rows != 0)
+  {
+    PyErr_SetString(PyExc_ValueError, "column buffer length is not a multiple of the number of rows");
+    return (-1);
+  }
+  *num_columns = (size_t) (buffer_length / num_rows);
+  return (0);
+}
+
+
+static PyObject *clib_contig_depth_profile(PyObject *self, PyObject *args)
+{
+  const char *column_buffer;
+  Py_ssize_t buffer_length;
+  int num_rows;
+  char gap_char, terminal_gap_char;
+  size_t num_columns, c;
+  PyObject *depth_list, *depth;
+
+  if (!PyArg_ParseTuple(args, "s#icc", &column_buffer, &buffer_length, &num_rows, &gap_char, &terminal_gap_char))
+  {
+    return (NULL);
+  }
+  if (check_column_buffer_shape(buffer_length, num_rows, &num_columns) != 0)
+  {
+    return (NULL);
+  }
+  depth_list = PyList_New(num_columns);
+  if (depth_list == NULL)
+  {
+    return (NULL);
+  }
+  for (c = 0; c < num_columns; c++)
+  {
+    depth = PyInt_FromLong(contig_column_depth(column_buffer + c * num_rows, num_rows, gap_char, terminal_gap_char));
+    if (depth == NULL)
+    {
+      Py_DECREF(depth_list);
+      return (NULL);
+    }
+    PyList_SetItem(depth_list, c, depth);
+  }
+  return (depth_list);
+}
+
+
+static PyObject *clib_contig_remove_terminal_gaps(PyObject *self, PyObject *args)
+{
+  const char *column_buffer;
+  Py_ssize_t buffer_length;
+  int num_rows;
+  char gap_char, terminal_gap_char;
+  size_t num_columns, r, c, left_end, right_start;
+  PyObject *result;
+  char *result_buffer;
+
+  if (!PyArg_ParseTuple(args, "s#icc", &column_buffer, &buffer_length, &num_rows, &gap_char, &terminal_gap_char))
+  {
+    return (NULL);
+  }
+  if (check_column_buffer_shape(buffer_length, num_rows, &num_columns) != 0)
+  {
+    return (NULL);
+  }
+  result = PyString_FromStringAndSize(column_buffer, buffer_length);
+  if (result == NULL)
+  {
+    return (NULL);
+  }
+  result_buffer = PyString_AS_STRING(result);
+  for (r = 0; r < (size_t) num_rows; r++)
+  {
+    contig_terminal_gap_range(column_buffer, num_rows, num_columns, r, gap_char, &left_end, &right_start);
+    for (c = 0; c < left_end; c++)
+    {
+      result_buffer[c * num_rows + r] = terminal_gap_char;
+    }
+    for (c = right_start; c < num_columns; c++)
+    {
+      result_buffer[c * num_rows + r] = terminal_gap_char;
+    }
+  }
+  return (result);
+}
+
+
+static PyObject *clib_contig_consensus(PyObject *self, PyObject *args)
+{
+  const char *column_buffer;
+  Py_ssize_t buffer_length;
+  int num_rows, symbol;
+  char gap_char, terminal_gap_char;
+  char *consensus;
+  size_t num_columns, c, k;
+  PyObject *depth_list, *depth, *r;
+
+  if (!PyArg_ParseTuple(args, "s#icc", &column_buffer, &buffer_length, &num_rows, &gap_char, &terminal_gap_char))
+  {
+    return (NULL);
+  }
+  if (check_column_buffer_shape(buffer_length, num_rows, &num_columns) != 0)
+  {
+    return (NULL);
+  }
+  consensus = (char *) malloc(num_columns + 1);
+  if (consensus == NULL)
+  {
+    PyErr_SetString(PyExc_MemoryError, "failed to allocate consensus");
+    return (NULL);
+  }
+  depth_list = PyList_New(0);
+  if (depth_list == NULL)
+  {
+    free(consensus);
+    return (NULL);
+  }
+  k = 0;
+  for (c = 0; c < num_columns; c++)
+  {
+    symbol = contig_column_consensus_symbol(column_buffer + c * num_rows, num_rows, gap_char, terminal_gap_char);
+    if (symbol == -1)
+    {
+      continue;
+    }
+    consensus[k++] = (char) symbol;
+    depth = PyInt_FromLong(contig_column_depth(column_buffer + c * num_rows, num_rows, gap_char, terminal_gap_char));
+    if (depth == NULL)
+    {
+      Py_DECREF(depth_list);
+      free(consensus);
+      return (NULL);
+    }
+    if (PyList_Append(depth_list, depth) != 0)
+    {
+      Py_DECREF(depth);
+      Py_DECREF(depth_list);
+      free(consensus);
+      return (NULL);
+    }
+    Py_DECREF(depth);
+  }
+  r = Py_BuildValue("s#O", consensus, (Py_ssize_t) k, depth_list);
+  Py_DECREF(depth_list);
+  free(consensus);
+  return (r);
+}
+
+
 static PyMethodDef clib_methods[] = {
   {"dummy", clib_dummy, METH_VARARGS, "dummy test function for clib development"},
   {"align_semiglobal", clib_align_semiglobal, METH_VARARGS, "compute semiglobal alignment of two sequences"},
+  {"align_global", clib_align_global, METH_VARARGS, "compute global affine gap alignment of two sequences"},
+  {"align_local", clib_align_local, METH_VARARGS, "compute local affine gap alignment of two sequences"},
   {"semiglobal_alignment_series", clib_semiglobal_alignment_series, METH_VARARGS, "compute consecutive series of semiglobal alignments"},
+  {"contig_depth_profile", clib_contig_depth_profile, METH_VARARGS, "compute the depth profile of a packed contig column buffer"},
+  {"contig_remove_terminal_gaps", clib_contig_remove_terminal_gaps, METH_VARARGS, "replace the terminal gaps of each row in a packed contig column buffer by the terminal gap character"},
+  {"contig_consensus", clib_contig_consensus, METH_VARARGS, "compute the majority consensus and its depth profile from a packed contig column buffer"},
   {"setverbose", clib_setverbose, METH_VARARGS, "set verbosity level for paftol.clib module"},
   {NULL, NULL, 0, NULL}
 };